@@ -15,7 +15,7 @@
 #            Copyright 2016 Karl Dolenc, beholdingeye.com.             #
 #                         All rights reserved.                         #
 #                                                                      #
-#                  Python 3.4 or greater is required.                  #
+#                  Python 3.8 or greater is required.                  #
 #                                                                      #
 ########################################################################
 
@@ -37,23 +37,27 @@
 
 
 import sys
-# Check for version, must be 3.4 or greater
+# Check for version, must be 3.8 or greater
 if sys.version_info[0] < 3:
     eval(   "print 'Error: Python "+str(sys.version_info[0])+" is too old for Quicknr.\n"+\
-            "       Please upgrade to version 3.4 or greater.\n       Quit.'")
+            "       Please upgrade to version 3.8 or greater.\n       Quit.'")
     sys.exit()
-if sys.version_info[0] == 3 and sys.version_info[1] < 4:
+if sys.version_info[0] == 3 and sys.version_info[1] < 8:
     print(  "Error: Python 3."+str(sys.version_info[1])+" is too old for Quicknr.\n"+\
-            "       Please upgrade to version 3.4 or greater.\n       Quit.")
+            "       Please upgrade to version 3.8 or greater.\n       Quit.")
     sys.exit()
 
-import os, re, hashlib, shutil, html, getpass, random, readline, argparse
+import os, re, hashlib, shutil, html, getpass, random, readline, argparse, json, ast, bisect
+import multiprocessing, time, mimetypes, subprocess, importlib.util, threading, gzip, io
 import xml.dom.minidom as xml
 import ftplib as ftp
 import datetime as dt
-from urllib.parse import urljoin
+import http.server
+from collections import OrderedDict, deque
+from urllib.parse import urljoin, unquote, urlsplit
 from urllib.request import pathname2url
 from contextlib import suppress
+from concurrent.futures import ThreadPoolExecutor
 try: import markdown
 except ImportError: markdownModule = False
 else: markdownModule = True
@@ -62,14 +66,26 @@ try:
     from PIL import ImageOps
 except ImportError: imgModule = False
 else: imgModule = True
+try: import brotli # Brotli compressed copies of files, see PRECOMPRESS
+except ImportError: brotliModule = False
+else: brotliModule = True
+try: import fcntl # File locks on POSIX systems
+except ImportError: fcntlModule = False
+else: fcntlModule = True
+try: import msvcrt # File locks on Windows
+except ImportError: msvcrtModule = False
+else: msvcrtModule = True
+
+
+QUICKNR_VERSION = "2.0.2"
 
 
 def markdown_to_html(text):
     """
     Process text from Markdown markup to HTML, return the result
     
-    This is the only function that is outside the main Quicknr() function,
-    for easy adaptation or override by the user. Incorporate your pre- and 
+    This function is kept outside the main Quicknr() function, for easy
+    adaptation or override by the user. Incorporate your pre- and 
     post-processors and extensions as you like here
     
     """
@@ -78,6 +94,153 @@ def markdown_to_html(text):
         print("Error: Markdown module not available. Text returned in original state.")
         return text
 
+def indent_html_tree(text):
+    """
+    Returns HTML text as indented tree
+    
+    """
+    # A line starting with an opening tag is an opener if a line further 
+    #   down starts with its closing tag, unless a closing tag for it is 
+    #   found inline before that, with no nested opening tag before it
+    # An opener increases the indent level of the lines down from it, and
+    #   a line starting with any closing tag decreases it, from itself
+    # Indents are applied to lines starting with a tag, not to content text
+    # Tag lines are found in one pass, by name, so each opener is qualified
+    #   by bisecting the lists of its name instead of searching the text down.
+    #   The first rule looks ahead for a closer, so a stack of open tags 
+    #   alone would not give the same indents
+    
+    # Remove leading whitespace before tags at line starts
+    def _strip_leading(mo):
+        """ Returns whitespace run before a tag, cut at its first line start """
+        if text[mo.end():mo.end()+1] != "<": return mo.group()
+        if mo.start() == 0: return ""
+        nl = mo.group().find("\n") + 1
+        return mo.group()[:nl] if nl else mo.group()
+    text = re.sub(r"\s+", _strip_leading, text)
+    
+    tL = text.splitlines()
+    startsD = {} # Line numbers of lines starting with closing tag, by name
+    closersD = {} # Line numbers of lines with closing tag anywhere, by name
+    nestersD = {} # Line numbers of lines with "<" and the name, or a longer one (<pre for p)
+    for i, tLine in enumerate(tL):
+        if "<" not in tLine: continue
+        if "</" in tLine:
+            for x in set(re.findall(r"</(\w+|!--)>", tLine)):
+                closersD.setdefault(x, []).append(i)
+            mo = re.match(r"</(\w+|!--)>", tLine)
+            if mo: startsD.setdefault(mo.group(1), []).append(i)
+        for x in {y[:n] for y in re.findall(r"<(!--|\w+)", tLine) for n in range(1, len(y)+1)}:
+            nestersD.setdefault(x, []).append(i)
+    
+    levelsD = {} # Indent level changes by line number
+    indentLevel = 0
+    for i, tLine in enumerate(tL):
+        mo = re.match(r"<(\w+|!--)", tLine)
+        if mo:
+            tag = mo.group(1)
+            if "</"+tag+">" in tLine: continue # Closed inline
+            startsL = startsD.get(tag, [])
+            k = bisect.bisect_right(startsL, i)
+            if k == len(startsL): continue # No closer, keep indent level as is
+            closer = startsL[k]
+            # Check for an inline closer before the closer, not a nester
+            closersL = closersD[tag]
+            k = closersL[bisect.bisect_right(closersL, i)]
+            if k < closer:
+                nestersL = nestersD[tag]
+                n = bisect.bisect_right(nestersL, i)
+                if (n == len(nestersL) or nestersL[n] >= k) and \
+                                "<"+tag not in tL[k][:tL[k].find("</"+tag+">")]:
+                    continue
+            # Confirmed as an opener, increase indent for lines down
+            indentLevel += 1
+            levelsD[i+1] = indentLevel
+        elif re.match(r"</\w", tLine):
+            # Confirmed as a closer, decrease indent
+            indentLevel -= 1
+            levelsD[i] = indentLevel
+        # If neither opener nor closer found, it is content text that won't be indented
+    indentLevel = 0
+    for i, tLine in enumerate(tL):
+        indentLevel = levelsD.get(i, indentLevel)
+        if tLine.startswith("<"): # Not content text
+            tL[i] = "  "*max(0,indentLevel) + tLine
+        # else: Content text, not indenting
+    return "\n".join(tL)
+
+def news_post_blurb(text, length):
+    """
+    Returns the first paragraph of a news post source, as the blurb of its
+    item in the news listing, with links replaced by their text or URL, or 
+    shortened to about length characters by word if it has no links
+    
+    Directives, link paragraphs, image floats, blocks and headings are 
+    skipped over. Paragraphs end at a blank line, so the text after the last
+    one is not looked at, the patterns backtracking over all of it from each
+    line start otherwise
+    
+    """
+    def _replace_links(bT, textLinks):
+        """
+        Returns blurb text with its links replaced by their URL, as by
+        \\[+[ ]*([^ \\]]+)[ ]*\\]+ replaced by \\1, or by their text if 
+        textLinks, as by \\[+[ ]*([^\\]]+?)[ ]+[^ \\]]+[ ]*\\]+ replaced by \\1
+        
+        The text up to each closing bracket is looked at once, from the 
+        first opening bracket for links with text, else from the bracket run
+        before the spaces before the last word, or the first one after them
+        
+        """
+        outL = []
+        pos = 0
+        while True:
+            i = bT.find("[", pos)
+            e = bT.find("]", i) if i != -1 else -1
+            if e == -1: break
+            w = e # End of the closing brackets
+            while w < len(bT) and bT[w] == "]": w += 1
+            c = e # End of the last word
+            while bT[c-1] == " ": c -= 1
+            ls = bT.rfind(" ", i, c) # Last space before it
+            s0 = ls # Start of the spaces
+            while ls != -1 and bT[s0-1] == " ": s0 -= 1
+            link = None
+            if textLinks:
+                if ls > i + 1:
+                    q = openingRE.match(bT, i).end()
+                    link = i, bT[q:s0] if q < s0 else bT[ls-1:ls]
+            else:
+                k = i
+                if ls != -1:
+                    k = s0
+                    while k > i and bT[k-1] == "[": k -= 1
+                    if k == s0: k = bT.find("[", ls, e)
+                if k != -1:
+                    mo = openingRE.match(bT, k)
+                    if mo.end() < c: link = k, bT[mo.end():c]
+                    elif mo.end(1) - k > 1: link = k, "["
+            outL.append(bT[pos:link[0]] + link[1] if link else bT[pos:w])
+            pos = w
+        outL.append(bT[pos:])
+        return "".join(outL)
+    openingRE = re.compile(r"(\[*)[ ]*")
+    text = re.sub(r"(?:@import:|@python:) \"[^\"\n]*\"", "", text)
+    text = re.sub(r"(?m)^\[[^\n]+?\]$", "", text)
+    text = re.sub(r"(?m)^\[[^\n]+?(?:\.jpg|\.png|\.gif|\.svg)\] (\S)",r"\1",text)
+    end = text.rfind("\n\n") # Of the last paragraph, nothing after it is looked at
+    text = text[:end+2] if end != -1 else ""
+    text = re.sub(r"(?ms)^(?:(?:\w+:\s*\S)|(?:\S[^:\n]*:\n[ ]*\S)).+?$(?=\n\n)", "", text)
+    mo = re.search(r"(?ms)^\S.+?$(?=\n\n)", text) # Corrected to allow line breaks
+    blurb = mo.group() if mo else ""
+    # Get rid of any links in first paragraph
+    if "[" in blurb and "]" in blurb:
+        blurb = _replace_links(blurb, False)
+        blurb = _replace_links(blurb, True)
+    elif len(blurb) > length: # Nicely shorten by word
+        blurb = blurb[:length].rsplit(maxsplit=1)[0]+"..."
+    return blurb
+
 class QuicknrError(Exception):
     """
     Custom exception, used to provide traceback on handled errors, if pref set so
@@ -88,6 +251,1755 @@ class QuicknrError(Exception):
     def __str__(self):
         return str(self.message)
 
+class LRUCache:
+    """
+    Bounded mapping that drops its least recently used entry when full
+    
+    """
+    def __init__(self, maxEntries):
+        self.maxEntries = maxEntries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    def __len__(self):
+        return len(self.entries)
+    def __contains__(self, key):
+        return key in self.entries
+    def get(self, key, default=None):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return default
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxEntries:
+            self.entries.popitem(last=False)
+
+class BuildCache:
+    """
+    On-disk cache of converted pages, one JSON entry file per key. Keys are
+    digests of everything a page is converted from, so an entry never goes 
+    stale, and the cache folder can be shared between machines
+    
+    Entries are touched when used, and the least recently used are deleted
+    when the cache grows over its size limit
+    
+    """
+    def __init__(self, cacheDir, maxBytes):
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+    def _path(self, key):
+        return os.path.join(self.cacheDir, key + ".json")
+    def get(self, key):
+        try:
+            with open(self._path(key), mode="r") as f: entry = json.load(f)
+            os.utime(self._path(key)) # Mark as recently used
+        except (OSError, ValueError): return None
+        return entry
+    def put(self, key, entry):
+        os.makedirs(self.cacheDir, exist_ok=True)
+        tmpPath = self._path(key) + ".{}.tmp".format(os.getpid())
+        with open(tmpPath, mode="w") as f: json.dump(entry, f)
+        os.replace(tmpPath, self._path(key)) # Atomic, entries are never seen half-written
+    def prune(self):
+        """ Deletes least recently used entries until the cache fits its size limit """
+        with suppress(OSError):
+            entries = []
+            for e in os.scandir(self.cacheDir):
+                if e.name.endswith(".json"):
+                    st = e.stat()
+                    entries.append([st.st_mtime, st.st_size, e.path])
+            entries.sort()
+            total = sum([x[1] for x in entries])
+            for mtime, size, path in entries:
+                if total <= self.maxBytes: break
+                with suppress(OSError):
+                    os.remove(path)
+                    total -= size
+
+class BlockMemo:
+    """
+    Block cache of one page, seeded with the blocks of its previous render.
+    The blocks used by this render are collected in used, to be kept for
+    the next, so blocks of older versions of the page drop out
+
+    """
+    def __init__(self, previous=None):
+        self.previous = previous or {}
+        self.used = {}
+        self.hits = 0
+        self.misses = 0
+    def get(self, key, default=None):
+        value = self.used.get(key, self.previous.get(key))
+        if value is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.used[key] = value
+        return value
+    def put(self, key, value):
+        self.used[key] = value
+
+class ImportFiles:
+    """
+    Cache of the files of the "config/import" folder of a website, their text
+    read without the comment lines at their top. refresh() reads again only
+    the files whose modification time or size changed, and drops deleted ones
+    
+    Files are indexed by the base name of their import naming convention,
+    the file name without any "prefix__" and extension, being the source
+    base name they apply to, "all" or "newspost"
+    
+    """
+    directiveRE = re.compile(r"@import:\s+['\"](.*?)['\"]\n*")
+    _headerRE = re.compile(r"(?m)(^#.*?$\n*)+")
+    
+    def __init__(self, importDir):
+        self.importDir = importDir
+        self.files = {} # (mtime, size, text) by file name
+        self.byBase = {} # File names by base name
+        self.refresh()
+    @staticmethod
+    def base_name(name):
+        """ Returns the base name of import file name """
+        if "__" in name: name = name.split("__", maxsplit=1)[1]
+        return os.path.splitext(name)[0]
+    @classmethod
+    def read(cls, path):
+        """ Returns text of import file, without its top comment lines """
+        with open(path) as f: fT = f.read()
+        mc = cls._headerRE.match(fT)
+        return fT[mc.end():] if mc else fT
+    def refresh(self):
+        """ Reads the files new or changed since last read, and forgets deleted ones """
+        changed = False
+        namesL = []
+        with suppress(FileNotFoundError):
+            for e in os.scandir(self.importDir):
+                if not e.is_file(): continue
+                namesL.append(e.name)
+                st = e.stat()
+                if self.files.get(e.name, (None, None))[:2] != (st.st_mtime_ns, st.st_size):
+                    self.files[e.name] = (st.st_mtime_ns, st.st_size, self.read(e.path))
+                    changed = True
+        for x in set(self.files) - set(namesL):
+            del self.files[x]
+            changed = True
+        if changed:
+            self.byBase = {}
+            for x in sorted(self.files):
+                self.byBase.setdefault(self.base_name(x), []).append(x)
+    def for_page(self, sourcePath):
+        """
+        Returns the set of base names of imports that apply to a source file,
+        and dict of the text of the import files that apply, by file name
+    
+        """
+        basesS = {os.path.splitext(os.path.basename(sourcePath))[0], "all"}
+        if os.path.split(os.path.dirname(sourcePath))[1] == "news": basesS.add("newspost")
+        return basesS, {x: self.files[x][2] for b in basesS for x in self.byBase.get(b, [])}
+
+class UserFunctions:
+    """
+    Registry of the user functions of a website, its "config/user_functions.py"
+    file imported once as a module, its byte code cached by Python as for
+    any module. Functions (or classes) are called by name, each call counted
+    and timed in timesD, by name, as [calls, seconds]
+    
+    The module starts out with the names of the Quicknr module, such as os
+    and re, which user functions could always use without importing them.
+    Only the functions and classes defined in the file are registered, not
+    those names, nor any imported
+    
+    """
+    POST_BUILD_HOOK = "post_build" # Function called once after conversion, if defined
+    directiveRE = re.compile(r"@python:\s+['\"](.*?)['\"]\n*")
+    
+    def __init__(self, path):
+        self.path = path
+        spec = importlib.util.spec_from_file_location("quicknr_user_functions", path)
+        self.module = importlib.util.module_from_spec(spec)
+        self.module.__dict__.update({k: v for k, v in globals().items() if not k.startswith("__")})
+        spec.loader.exec_module(self.module)
+        self.functions = {k: v for k, v in vars(self.module).items() if self._is_own(v)}
+        self.hook = self.functions.pop(self.POST_BUILD_HOOK, None) # Not for directives
+        self.timesD = {}
+    def _is_own(self, v):
+        """ Returns True if v is a function or class defined in the file """
+        if not callable(v) or getattr(v, "__module__", None) != self.module.__name__: return False
+        code = getattr(v, "__code__", None) # Classes have none, their module is enough
+        return code is None or os.path.abspath(code.co_filename) == os.path.abspath(self.path)
+    def __contains__(self, name):
+        return name in self.functions
+    def call(self, name, *args, timesD=None):
+        """
+        Returns the result of the function of name called with args: the 
+        text of a page, the position of its directive in it and the settings
+        dict for directives. The call is counted in timesD if given, else in
+        timesD of the registry
+        
+        """
+        return self._timed(name, self.functions[name], args, timesD)
+    def call_hook(self, *args):
+        """ Returns the result of the post-build hook called with args, see call() """
+        return self._timed(self.POST_BUILD_HOOK, self.hook, args, None)
+    def _timed(self, name, function, args, timesD):
+        t = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            x = (self.timesD if timesD is None else timesD).setdefault(name, [0, 0.0])
+            x[0] += 1
+            x[1] += time.perf_counter() - t
+    def add_times(self, timesD):
+        """ Adds calls counted and timed elsewhere, in a worker process """
+        for name, (calls, seconds) in timesD.items():
+            x = self.timesD.setdefault(name, [0, 0.0])
+            x[0] += calls
+            x[1] += seconds
+
+class Profiler:
+    """
+    Times the stages of a build for the --profile option, each call of a 
+    function wrapped by wrap() being a stage. Stages are kept as Chrome 
+    trace events, with the file they worked on, their own or that of the
+    stage they ran in, and the bytes read and written and the regular 
+    expression passes made in them as arguments
+    
+    Bytes are counted by the I/O counters of the process, where the system
+    keeps them in "/proc/self/io", less the reads of the counters, so only
+    what is read and written during a stage counts. Writing a page and
+    writing the data file are stages of their own for this. Stages run in
+    other threads than the main one, as the hashing of files in a pool, 
+    count by the counters of their thread, "/proc/thread-self/io", or not
+    at all without them, not to be credited with what the other threads of
+    the pool read. Each thread has a stack of its own, and its events the
+    thread as their tid, as they overlap in time. Regex passes
+    are the calls of the matching functions of the re module, made through
+    the stand-in that install() puts in its place in a namespace
+    
+    """
+    class _CountingRE:
+        """ Stands in for the re module, counting calls of its matching functions """
+        _counted = ("match", "fullmatch", "search", "sub", "subn", "split", "findall", "finditer")
+        def __init__(self, module, profiler):
+            self._module = module
+            self._profiler = profiler
+        def __getattr__(self, name):
+            x = getattr(self._module, name)
+            if name not in self._counted: return x
+            def _counted(*args, **kwargs):
+                self._profiler.regexPasses += 1
+                return x(*args, **kwargs)
+            return _counted
+    
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.events = []
+        self.local = threading.local() # Stack and counter reads of each thread
+        self.regexPasses = 0
+        self.installed = {} # Original values of names replaced by install()
+        self.hasIO = os.path.exists("/proc/self/io")
+        self.hasThreadIO = os.path.exists("/proc/thread-self/io")
+        self.ioRead = 0 # Bytes of the counters read so far, by all threads
+        self.lock = threading.Lock()
+    def _thread(self):
+        """
+        Returns the state of the current thread: the stack of the files of its
+        stages running, innermost last, and the bytes of the counters it read
+        
+        """
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+            self.local.ioRead = 0
+        return self.local
+    def _io(self):
+        """
+        Returns the bytes read and written so far, by the process in the main
+        thread, or by the current thread in others
+        
+        """
+        main = threading.current_thread() is threading.main_thread()
+        if not (self.hasIO if main else self.hasThreadIO): return 0, 0
+        with open(main and "/proc/self/io" or "/proc/thread-self/io", mode="rb") as f: ioB = f.read()
+        d = dict(x.split(b": ") for x in ioB.splitlines() if b": " in x)
+        thread = self._thread()
+        thread.ioRead += len(ioB)
+        with self.lock:
+            self.ioRead += len(ioB)
+            ioRead = self.ioRead if main else thread.ioRead
+        return int(d.get(b"rchar", 0)) - ioRead + len(ioB), int(d.get(b"wchar", 0))
+    def wrap(self, fn, fileOf=None):
+        """
+        Returns function fn timed as a stage of its name, fileOf returning the
+        file it works on from its arguments, if given
+        
+        """
+        name = fn.__name__.lstrip("_")
+        def _staged(*args, **kwargs):
+            stack = self._thread().stack
+            fP = fileOf(*args, **kwargs) if fileOf else (stack[-1] if stack else "")
+            stack.append(fP)
+            read, written = self._io()
+            regexPasses = self.regexPasses
+            t = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                dur = time.perf_counter() - t
+                read1, written1 = self._io()
+                stack.pop()
+                self.events.append(dict(name=name, cat="quicknr", ph="X", 
+                        ts=round((t - self.t0)*1000000), dur=round(dur*1000000),
+                        pid=os.getpid(), tid=threading.get_ident(), 
+                        args=dict(file=fP, read=read1-read, written=written1-written,
+                                    regex=self.regexPasses-regexPasses)))
+        return _staged
+    def install(self, namespace, names):
+        """ Replaces re and the functions of names in namespace with profiled ones """
+        for x in names + ["re"]:
+            self.installed[x] = namespace[x]
+            namespace[x] = self._CountingRE(re, self) if x == "re" else self.wrap(namespace[x])
+    def uninstall(self, namespace):
+        namespace.update(self.installed)
+        self.installed = {}
+    def take(self):
+        """ Returns and forgets the events of this process, to be added to another """
+        eventsL = [x for x in self.events if x["pid"] == os.getpid()]
+        self.events = [x for x in self.events if x["pid"] != os.getpid()]
+        return eventsL
+    def add(self, eventsL):
+        self.events.extend(eventsL)
+    def report(self, top, tracePath):
+        """
+        Prints the totals of the stages and the top slowest files converted,
+        and writes the events to a Chrome trace file, tracePath
+        
+        """
+        totalsD = {}
+        for e in self.events:
+            x = totalsD.setdefault(e["name"], [0, 0, 0, 0, 0])
+            for i, v in enumerate([1, e["dur"], e["args"]["read"], e["args"]["written"], 
+                                    e["args"]["regex"]]):
+                x[i] += v
+        print("\n  Profile of the run, by stage, nested stages included:\n")
+        print("       {:<24} {:>6} {:>9} {:>11} {:>11} {:>8}".format(
+                                "Stage", "Calls", "Seconds", "Read", "Written", "Regex"))
+        for name, x in sorted(totalsD.items(), key=lambda x: -x[1][1]):
+            print("       {:<24} {:>6} {:>9.3f} {:>11} {:>11} {:>8}".format(
+                                name, x[0], x[1]/1000000, x[2], x[3], x[4]))
+        pagesL = sorted([e for e in self.events if e["name"] == "render_source"], 
+                                                        key=lambda e: -e["dur"])[:top]
+        if pagesL:
+            print("\n  Slowest pages (seconds):\n")
+            for e in pagesL:
+                print("       {:>9.3f}  {}".format(e["dur"]/1000000, e["args"]["file"]))
+        os.makedirs(os.path.dirname(tracePath), exist_ok=True)
+        with open(tracePath, mode="w") as f:
+            json.dump(dict(traceEvents=sorted(self.events, key=lambda e: e["ts"]), 
+                                                        displayTimeUnit="ms"), f)
+        print("\n  Trace of the run written to (open in chrome://tracing or Perfetto):\n"
+                "       " + tracePath)
+
+class DataRecord:
+    """
+    Record of a file in the data file "quicknr_data.txt", one tab-delimited
+    line of fields: path, time, size, hash, stat and upload state. Records of
+    news images have no hash or stat, those of sources no upload state, and
+    those of earlier versions no stat
+    
+    """
+    __slots__ = ("path", "time", "size", "hash", "stat", "upState")
+    def __init__(self, path, time, size, hash="", stat="", upState=""):
+        self.path = path
+        self.time = time
+        self.size = size
+        self.hash = hash
+        self.stat = stat
+        self.upState = upState
+    @classmethod
+    def parse(cls, line):
+        fL = line.split("\t")
+        upState = fL.pop() if len(fL) > 3 and fL[-1] in ("UP", "NOTUP") else ""
+        return cls(fL[0], fL[1] if len(fL) > 1 else "", fL[2] if len(fL) > 2 else "",
+                    fL[3] if len(fL) > 3 else "", fL[4] if len(fL) > 4 else "", upState)
+    def line(self):
+        return "\t".join([self.path, self.time, self.size] + \
+                        [x for x in (self.hash, self.stat, self.upState) if x])
+    def date(self):
+        """ Returns the recorded time as datetime, raises ValueError if invalid """
+        return dt.datetime.strptime(self.time, "%Y-%m-%d_%H-%M-%S")
+
+class FileLock:
+    """
+    Advisory lock on a lock file, exclusive between the processes that take
+    it, with fcntl on POSIX systems and msvcrt on Windows. Used as a context
+    manager, re-entrant within one instance
+    
+    """
+    def __init__(self, path):
+        self.path = path
+        self.depth = 0
+        self.f = None
+    def __enter__(self):
+        if not self.depth:
+            self.f = open(self.path, mode="a+")
+            if fcntlModule:
+                fcntl.flock(self.f.fileno(), fcntl.LOCK_EX)
+            elif msvcrtModule:
+                self.f.seek(0)
+                while True: # LK_LOCK gives up after 10 seconds, keep waiting
+                    try: msvcrt.locking(self.f.fileno(), msvcrt.LK_LOCK, 1)
+                    except OSError: continue
+                    break
+        self.depth += 1
+        return self
+    def __exit__(self, *exc):
+        self.depth -= 1
+        if not self.depth:
+            if fcntlModule:
+                fcntl.flock(self.f.fileno(), fcntl.LOCK_UN)
+            elif msvcrtModule:
+                self.f.seek(0)
+                msvcrt.locking(self.f.fileno(), msvcrt.LK_UNLCK, 1)
+            self.f.close()
+            self.f = None
+
+class RecordStore:
+    """
+    Records of the data file, parsed once and indexed by file path, in their
+    order in the file. Secondary indexes are kept of the records of news
+    sources, of HTML files by their path in "public_html" without extension,
+    which is the path of their source in "page_sources", and of the records
+    of files not yet uploaded
+    
+    Changes are kept in memory until flush() appends them to the journal, a
+    file next to the data file, or save() writes the data file, whole and 
+    atomically, and deletes the journal. A journal left by a run that quit
+    or crashed is replayed over the data file when it is loaded
+    
+    Several processes may share the data file, as when one converts while
+    another uploads. Files are only read and written under an advisory lock
+    on "quicknr_data.lock", and flush() and save() first read the records
+    again, to apply the changes of this process over those of others. The
+    journal only grows until save() replaces the data file, so flush() reads
+    only the journal lines added since the last read, unless the data file
+    was replaced since, while save() reads the whole file again. All
+    changes are compare-and-swap: one applies only if the record of its
+    path is still as it was when changed here, or still missing for a new
+    record, else it is dropped and its path returned as a conflict. So an
+    upload state is never set on a record that another process has since
+    replaced, and a stale removal never deletes a record just put
+    
+    Journal lines: "P" and a record put at the end, "U" and a record updated
+    in place, or "D" and the path of a removed record, tab-delimited
+    
+    """
+    def __init__(self, path, siteFolder, records=()):
+        self.path = path
+        self.journalPath = os.path.splitext(path)[0] + "_journal.txt"
+        self.lock = FileLock(os.path.splitext(path)[0] + ".lock")
+        self.siteFolder = siteFolder
+        self._clear()
+        for x in records: self._put(x)
+        self.pending = [] # 3-item lists of change, record or path, expected line or None
+        self.seen = {} # Lines of the records as read, with the pending changes made
+        self.baseId = None # Stat data of the data file as read, see _file_id()
+        self.journalPos = 0 # Position in the journal after the last line replayed
+        self.stored = set() # Paths of the records in the data file and journal as read
+    @classmethod
+    def load(cls, path):
+        store = cls(path, "")
+        with store.lock: store._reload()
+        return store
+    def _clear(self):
+        self.records = OrderedDict()
+        self.newsSources = OrderedDict() # Used as ordered sets of paths
+        self.htmlPages = {}
+        self.notUploaded = OrderedDict()
+    def _reload(self):
+        """
+        Reads the records from the data file, and replays the journal over
+        them, under the lock. Returns True if there was a journal
+        
+        """
+        self.baseId = self._file_id(self.path)
+        with open(self.path, mode="r") as f: fTL = f.read().splitlines()
+        self.siteFolder = fTL[0] if fTL else ""
+        self._clear()
+        for x in fTL[1:]:
+            if x: self._put(DataRecord.parse(x))
+        self.seen = {k: v.line() for k, v in self.records.items()}
+        self.stored = set(self.records)
+        self.journalPos = 0
+        return self._replay_journal() is not None
+    def _replay_journal(self):
+        """
+        Applies the journal lines after the last one replayed to the records,
+        under the lock. Returns set of the paths of the records changed, or
+        None if there is no journal
+        
+        """
+        try: f = open(self.journalPath, mode="r")
+        except OSError: return None
+        pathS = set()
+        with f:
+            f.seek(self.journalPos)
+            while True:
+                x = f.readline()
+                if not x.endswith("\n"): break # End, or a line cut short by a crash
+                self.journalPos = f.tell()
+                op, _, line = x[:-1].partition("\t")
+                if op == "D":
+                    self._remove(line)
+                    self._see(line, None)
+                    self.stored.discard(line)
+                    pathS.add(line)
+                    continue
+                if op not in ("P", "U"): continue
+                if op == "U" and line.split("\t", 1)[0] not in self.stored: continue
+                rec = DataRecord.parse(line)
+                if rec.path in self.records and op == "U": self._update(rec)
+                else: self._put(rec) # Or removed here, a change to be dropped
+                self._see(rec.path, rec.line())
+                self.stored.add(rec.path)
+                pathS.add(rec.path)
+        return pathS
+    def _file_id(self, path):
+        """ Returns inode, modification time and size of file, None if not there """
+        try: st = os.stat(path)
+        except OSError: return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+    def _sync(self, full=True):
+        """
+        Reads the records again and applies the pending changes over them,
+        under the lock, only reading the journal lines added since the last
+        read if not full and the data file is as read. Returns list of journal
+        lines of the changes applied, list of paths of the changes dropped as
+        conflicts, and True if there was a journal
+        
+        """
+        pendingL = self.pending
+        self.pending = []
+        changedS = None # Paths changed by the journal lines read, if only those
+        if full or self._file_id(self.path) != self.baseId:
+            journaled = self._reload()
+        else:
+            changedS = self._replay_journal()
+            journaled = changedS is not None
+            changedS = changedS or set()
+        jL = []; conflicts = []
+        for op, x, expected in pendingL:
+            path = x if op == "D" else x.path
+            if changedS is None: changed = self.seen.get(path) != expected
+            else: changed = path in changedS # Lines before them seen when changed
+            if changed: # Changed by another process
+                conflicts.append(path)
+                continue
+            if op == "U": self._update(x)
+            elif op == "P": self._put(x)
+            elif op == "D": self._remove(x)
+            self._see(path, None if op == "D" else x.line())
+            if op == "D": self.stored.discard(path)
+            else: self.stored.add(path)
+            jL.append(op + "\t" + (x if op == "D" else x.line()) + "\n")
+        return jL, conflicts, journaled
+    def __len__(self):
+        return len(self.records)
+    def __contains__(self, path):
+        return path in self.records
+    def __iter__(self):
+        return iter(list(self.records.values()))
+    def _page_key(self, path, topDir):
+        """ Returns path in topDir without extension, or None if not there """
+        parts = path.split(os.sep, 1)
+        if len(parts) < 2 or parts[0] != topDir: return None
+        return os.path.splitext(parts[1])[0]
+    def _index(self, rec, add=True):
+        isNews = os.path.split(os.path.dirname(rec.path))[1] == "news"
+        if isNews and self._page_key(rec.path, "page_sources") is not None:
+            if add: self.newsSources[rec.path] = None
+            else: self.newsSources.pop(rec.path, None)
+        key = self._page_key(rec.path, "public_html")
+        if key is not None and os.path.splitext(rec.path)[1] in (".html", ".php", ".htm"):
+            if add: self.htmlPages[key] = rec.path
+            elif self.htmlPages.get(key) == rec.path: del self.htmlPages[key]
+        if rec.upState == "NOTUP" and add: self.notUploaded[rec.path] = None
+        else: self.notUploaded.pop(rec.path, None)
+    def _put(self, rec):
+        self._remove(rec.path)
+        self.records[rec.path] = rec
+        self._index(rec)
+    def _update(self, rec):
+        self._index(self.records[rec.path], add=False)
+        self.records[rec.path] = rec # Keeps its place in order
+        self._index(rec)
+    def _remove(self, path):
+        if path in self.records: self._index(self.records.pop(path), add=False)
+    def _see(self, path, line):
+        """ Sets the line of the record of path as seen, None if removed """
+        if line is None: self.seen.pop(path, None)
+        else: self.seen[path] = line
+    def _change(self, op, x, path, line):
+        """ Adds pending change op of record or path x, line None if removed """
+        self.pending.append([op, x, self.seen.get(path)])
+        self._see(path, line)
+    def get(self, path):
+        return self.records.get(path)
+    def put(self, rec):
+        """ Adds record at the end, replacing any record of the same path """
+        self._put(rec)
+        self._change("P", rec, rec.path, rec.line())
+    def update(self, path, **fields):
+        """ Sets fields of the record of path, keeping its place in order """
+        rec = self.records[path]
+        new = DataRecord(rec.path, rec.time, rec.size, rec.hash, rec.stat, rec.upState)
+        for k in fields: setattr(new, k, fields[k])
+        self._update(new)
+        self._change("U", new, path, new.line())
+    def remove(self, path):
+        if path in self.records:
+            self._remove(path)
+            self._change("D", path, path, None)
+    def news_sources(self):
+        """ Returns list of the records of sources in a news folder """
+        return [self.records[x] for x in self.newsSources]
+    def counterpart(self, sourcePath):
+        """ Returns record of the HTML file converted from source path, or None """
+        key = self._page_key(sourcePath, "page_sources")
+        if key is None or key not in self.htmlPages: return None
+        return self.records[self.htmlPages[key]]
+    def to_upload(self):
+        """ Returns list of the paths of records not yet uploaded """
+        return list(self.notUploaded)
+    def text(self):
+        return "".join([self.siteFolder + "\n"] + [x.line() + "\n" for x in self.records.values()])
+    def flush(self):
+        """
+        Appends the pending changes to the journal, synced to disk, and returns
+        list of paths of changes dropped as conflicts
+        
+        """
+        if not self.pending: return []
+        with self.lock:
+            jL, conflicts, journaled = self._sync(full=False)
+            if jL:
+                with open(self.journalPath, mode="a") as f:
+                    f.write("".join(jL))
+                    f.flush()
+                    os.fsync(f.fileno())
+                    self.journalPos = f.tell() # Own lines, already applied
+        return conflicts
+    def save(self):
+        """
+        Writes the data file, atomically, if there are pending changes or a
+        journal, and deletes the journal. Returns list of paths of changes
+        dropped as conflicts
+        
+        """
+        with self.lock:
+            jL, conflicts, journaled = self._sync()
+            if jL or journaled:
+                tmpPath = self.path + ".{}.tmp".format(os.getpid())
+                with open(tmpPath, mode="w") as f:
+                    f.write(self.text())
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmpPath, self.path) # Atomic, never seen half-written
+                with suppress(FileNotFoundError): os.remove(self.journalPath)
+                self.baseId = self._file_id(self.path)
+                self.journalPos = 0
+        return conflicts
+
+class SiteSnapshot:
+    """
+    Listing of the website folder tree, made once with os.scandir, for all the
+    scans of a run to share. Paths are relative to the website folder, with ""
+    for the folder itself. Stat results are taken when first asked for, and
+    then kept. A ".git" folder is left out
+    
+    """
+    def __init__(self, siteDir):
+        self.siteDir = siteDir
+        self.entries = {} # Paths of files and folders, and their os.DirEntry
+        self.dirs = {} # Folder paths, and 2-item lists of their folder and file names
+        self._scan("")
+    def _scan(self, relDir):
+        dL = []; fL = []
+        with suppress(OSError):
+            for e in os.scandir(os.path.join(self.siteDir, relDir)):
+                try: isDir = e.is_dir()
+                except OSError: isDir = False
+                if isDir and e.name == ".git": continue
+                self.entries[os.path.join(relDir, e.name)] = e
+                if isDir: dL.append(e.name)
+                else: fL.append(e.name)
+        self.dirs[relDir] = [dL, fL]
+        for d in dL: # Like os.walk, symlinked folders are listed, not entered
+            if not self.entries[os.path.join(relDir, d)].is_symlink():
+                self._scan(os.path.join(relDir, d))
+    def _norm(self, relPath):
+        relPath = os.path.normpath(relPath)
+        return "" if relPath == "." else relPath
+    def rescan(self, relDir):
+        """ Lists the folder tree again, after files in it were written """
+        relDir = self._norm(relDir)
+        prefix = relDir + os.sep if relDir else ""
+        for x in [x for x in self.entries if x.startswith(prefix)]: del self.entries[x]
+        for x in [x for x in self.dirs if x == relDir or x.startswith(prefix)]: del self.dirs[x]
+        self._scan(relDir)
+    def exists(self, relPath):
+        relPath = self._norm(relPath)
+        return relPath in self.entries or relPath in self.dirs
+    def stat(self, relPath):
+        return self.entries[self._norm(relPath)].stat()
+    def listdir(self, relDir):
+        """ Returns list of the folder and file names in folder, empty if none """
+        dL, fL = self.dirs.get(self._norm(relDir), [[], []])
+        return dL + fL
+    def files(self, relDir):
+        """ Returns list of the file names in folder, empty if none """
+        return self.dirs.get(self._norm(relDir), [[], []])[1][:]
+    def walk(self, relDir=""):
+        """
+        Yields 3-item tuples of full folder path, and lists of its folder and
+        file names, top-down like os.walk, which folder names can be removed
+        from to skip their trees
+        
+        """
+        stack = [self._norm(relDir)]
+        while stack:
+            d = stack.pop()
+            if d not in self.dirs: continue
+            dL, fL = self.dirs[d][0][:], self.dirs[d][1][:]
+            yield os.path.join(self.siteDir, d), dL, fL
+            stack.extend(reversed([os.path.join(d, x) for x in dL]))
+    def dir_mtimes(self):
+        """ Returns dict of folder paths and their modification times in ns """
+        mD = {}
+        for d in self.dirs:
+            with suppress(OSError):
+                if d: mD[d] = self.entries[d].stat().st_mtime_ns
+                else: mD[d] = os.stat(self.siteDir).st_mtime_ns
+        return mD
+
+class SiteConfig:
+    """
+    Read-only settings of a website, typed: whole numbers as int, YES/NO as
+    bool, others as str. Settings are read as attributes, or by key
+    
+    Settings are grouped, and each group has a fingerprint, a digest of its
+    values, so changed groups can be told apart without reading "config.txt"
+    
+    """
+    GROUPS = OrderedDict([
+        ("snippets", ("HTML_HEAD", "HTML_TAIL")),
+        ("title", ("HTML_TITLE", "HTML_TITLE_SEPARATOR", "HTML_WEBSITE_NAME",
+                                                                "HTML_PAGE_TITLE")),
+        ("content", ("PAGE_FILE_EXTENSION", "QLM_OR_MARKDOWN", "MARKDOWN_TITLING",
+                    "HTML_TAG_ID", "JAVASCRIPT_LINK_SPAN", "JAVASCRIPT_LINK_PRE",
+                    "JAVASCRIPT_LINK_POST", "ALWAYS_XHTML_TAGS")),
+        ("news", ("NEWS_LIST_ITEMS", "NEWS_LIST_TITLE", "NEWS_BLURB_LENGTH",
+                    "NEWS_MORE_PHRASE", "NEWS_LIST_LINK", "NEWS_LIST_LINK_POSITION",
+                    "NEWS_LIST_LINK_PREFIX", "NEWS_DATE_FORMAT", "NEWS_DATE_FROM_FILENAME",
+                    "NEWS_PREV_LINK", "NEWS_NEXT_LINK", "NEWS_LIST_THUMBS",
+                    "NEWS_LIST_THUMB_SIZE", "NEWS_LIST_THUMB_SQUARE")),
+        ("meta", ("META_EDIT", "META_DESCRIPTION", "META_BASE_URL")),
+        ("ftp", ("FTP_SERVER", "FTP_PATH", "FTP_USERNAME", "FTP_PASSWORD", "FTP_ACCT",
+                    "FTP_DEBUG", "FTP_PASSIVE", "FTP_CONNECTIONS")),
+        ("app", ("DEBUG_ERRORS", "BUILD_CACHE_SIZE", "CHANGE_DETECTION", "PRECOMPRESS",
+                    "FILE_SIZE_LIMIT")),
+        ])
+    # Groups that the HTML output of pages is made from
+    OUTPUT_GROUPS = ("snippets", "title", "content", "news", "meta")
+    INT_KEYS = ("NEWS_LIST_ITEMS", "NEWS_BLURB_LENGTH", "NEWS_LIST_THUMB_SIZE", "FTP_DEBUG",
+                "FTP_CONNECTIONS", "BUILD_CACHE_SIZE")
+    BOOL_KEYS = ("MARKDOWN_TITLING", "HTML_TAG_ID", "NEWS_DATE_FROM_FILENAME",
+                "NEWS_LIST_THUMBS", "NEWS_LIST_THUMB_SQUARE", "JAVASCRIPT_LINK_SPAN",
+                "META_EDIT", "META_DESCRIPTION", "DEBUG_ERRORS", "FTP_PASSIVE",
+                "ALWAYS_XHTML_TAGS", "PRECOMPRESS")
+    _keyRE = re.compile(r"(?m)^([A-Z_]+):")
+    _spaceRE = re.compile(r"\s*")
+    _openingRE = re.compile(r"[\s'\"]*")
+    _quotesRE = re.compile(r"['\"]{3,}")
+    
+    def __init__(self, settings):
+        """ Takes the validated settings dict, holding the values as strings """
+        for keys in self.GROUPS.values():
+            for k in keys:
+                v = settings[k]
+                if k in self.INT_KEYS: v = int(v)
+                elif k in self.BOOL_KEYS: v = v == "YES"
+                object.__setattr__(self, k, v)
+        fingerprints = {}
+        for g, keys in self.GROUPS.items():
+            h = hashlib.sha1()
+            for k in keys: h.update("{}={!r}\0".format(k, getattr(self, k)).encode())
+            fingerprints[g] = h.hexdigest()
+        object.__setattr__(self, "fingerprints", fingerprints)
+    def __setattr__(self, name, value):
+        raise AttributeError("Settings are read-only")
+    def __getitem__(self, key):
+        return getattr(self, key)
+    def fingerprint(self, group):
+        """ Returns the hex digest of the values of settings group """
+        return self.fingerprints[group]
+    @classmethod
+    def parse(cls, cT):
+        """
+        Returns dict of the settings found in "config.txt" text, as strings, in
+        one pass over the text. Snippet values run from the line after their
+        key to the closing triple quotes, and are skipped over, so text in them
+        is never taken for a setting. The first of any repeated keys is used
+        
+        """
+        settings = {}
+        keys = {k for x in cls.GROUPS.values() for k in x}
+        pos = 0
+        while True:
+            mo = cls._keyRE.search(cT, pos)
+            if not mo: break
+            key = mo.group(1)
+            pos = mo.end()
+            if key in cls.GROUPS["snippets"]:
+                snippet = cls._snippet(cT, pos)
+                if snippet:
+                    settings.setdefault(key, snippet[0])
+                    pos = snippet[1]
+            elif key in keys:
+                v = cls._value(cT, pos)
+                if v is not None: settings.setdefault(key, v)
+        return settings
+    @classmethod
+    def _value(cls, cT, pos):
+        """
+        Returns the value following a key at pos, or None, as the pattern
+        \\s*['"]?(.*?)['"]?\\s*?\\n would match it. Taken with string methods,
+        as the pattern backtracks in cubic time over a value with no line end
+        
+        """
+        start = cls._spaceRE.match(cT, pos).end()
+        end = cT.find("\n", start)
+        if end == -1:
+            if "\n" in cT[pos:start]: return ""
+            return None
+        v = cT[start:end]
+        if v[:1] in ("'", '"'): v = v[1:]
+        v = v.rstrip()
+        if v[-1:] in ("'", '"'): v = v[:-1]
+        return v
+    @classmethod
+    def _snippet(cls, cT, pos):
+        """
+        Returns (snippet, end) of the snippet following a key at pos, or None,
+        as the pattern (?m)(?:\\s|['"])*$\\n(^(?:.|\\n)*?)['"]{3} would match
+        it. The snippet runs from the last line start in the blank and quotes
+        after the key to the first triple quotes, or if there are none after
+        it, from the last line start before the last triple quotes
+        
+        """
+        blank = cls._openingRE.match(cT, pos).end()
+        nl = cT.rfind("\n", pos, blank)
+        if nl == -1: return None
+        mo = cls._quotesRE.search(cT, nl + 1)
+        if not mo:
+            last = None
+            for last in cls._quotesRE.finditer(cT, pos, nl): pass
+            if not last: return None
+            nl = cT.rfind("\n", pos, last.end() - 3)
+            if nl == -1: return None
+            mo = cls._quotesRE.search(cT, nl + 1)
+        return cT[nl + 1:mo.start()], mo.start() + 3
+
+class Placeholders:
+    """
+    Registry of the text of a page protected from conversion, kept under
+    tokens to be put back into the finished HTML in one scan
+    
+    Tokens read Quicknr?=<name>=?Quicknr, the Quicknr mark numbered as need
+    be to be found nowhere in the source text of the page, so they can't be
+    confused with it. protect() hands out a numbered token for a value,
+    marker() a fixed one for a name, standing in for no text
+    
+    """
+    def __init__(self, text=""):
+        mark = "Quicknr"
+        n = 0
+        while mark + "?=" in text or "=?" + mark in text:
+            n += 1
+            mark = "Quicknr" + str(n)
+        self.start = mark + "?="
+        self.end = "=?" + mark
+        self.values = {} # Text of the tokens handed out by protect()
+        self._tokenRE = re.compile(re.escape(self.start) + r"\w+?" + re.escape(self.end))
+    def marker(self, name):
+        """ Returns the token of name, a word """
+        return self.start + name + self.end
+    def protect(self, value, kind="text"):
+        """ Returns a new token of kind, a word, to be restored to value """
+        token = self.marker(kind + str(len(self.values)))
+        self.values[token] = value
+        return token
+    def restore(self, text):
+        """ Returns text with the tokens of protected values replaced by them """
+        if not self.values: return text
+        return self._tokenRE.sub(lambda mo: self.values.get(mo.group(), mo.group()), text)
+
+class QLMLexer:
+    """
+    Tokenizer of Quicknr Light Markup, making one pass over the lines of a
+    page to clean them and find its blocks, and one over the text of each 
+    block for its inline tokens
+    
+    blocks() returns the block tokens of the page: ("title", text), 
+    ("heading", text) and ("section", paragraphs), paragraphs being the list
+    of (type, text) tokens of the section's blocks, of type "link", 
+    "directive", "ulist", "olist", "code", "definition", "float" or "para".
+    Text is cleaned as for the page, tabs expanded, HTML characters escaped,
+    stray spaces and link quotes deleted, and lists gathered into blocks
+    
+    Code block contents are protected in the placeholders registry, their 
+    blocks left with the line of their token, images linking to a URL are
+    joined to it with the imageLinkMarker token, and the page title goes 
+    into title. inline() returns the tokens of the text of a block: 
+    ("text", text), ("link", text, URL), ("jslink", text, call) and 
+    ("jscall", call)
+    
+    """
+    _badURLRE = re.compile(r'\[(?:[^\[\]\n]+[ ])?[^ "\[\]\n]*?"[^ \[\]\n]*?\]')
+    _codeRE = re.compile(r"(?i)code(?:-\w+)?:\s[ ]*\S")
+    _codeLabelRE = re.compile(r"(?i)code(?:-\w+)?:")
+    _labelRE = re.compile(r"\A\S[^:\n]*:\s?")
+    _openSpaceRE = re.compile(r"(\[)[ ]+")
+    _closeSpaceRE = re.compile(r"(?<![ ])[ ]+(\])")
+    _doubleBracketRE = re.compile(r"(\[|\])\1+")
+    _imageLinkRE = re.compile(r"(\.jpg|\.png|\.gif|\.svg)\]\[")
+    _orderedItemRE = re.compile(r"[ ]*\d+\.?[ ].")
+    _itemSpacesRE = re.compile(r"(\*[ ]|\d+\.?[ ])[ ]+")
+    _titleRE = re.compile(r"[ ][ ]+\S.{0,80}")
+    _headingRE = re.compile(r"[ ][ ]+\S")
+    _directiveRE = re.compile(r"(?m)(?:@python:|@import:)[ ]+['\"][^'\"]+['\"][ ]*$")
+    _orderedLineRE = re.compile(r"\d+\.?[ ]")
+    _definitionRE = re.compile(r"(?:\w+:\s*\S)|(?:\S[^:\n]*:\n[ ]*\S)")
+    _jsLinkEndRE = re.compile(r"(?<![ ])[ ]+([A-Za-z0-9_\-'\.;]+\([A-Za-z0-9_\-'\.;]*\))\]")
+    _jsCallRE = re.compile(r"\[([A-Za-z0-9_\-'\.;]+\([A-Za-z0-9_\-'\.;]*\))\]")
+    _linkEndRE = re.compile(r"(?<![ ])[ ]+([^\s\[]\S*?)\]")
+    _whiteRE = re.compile(r"\s")
+    
+    def __init__(self, text, sourceName="", placeholders=None):
+        self.text = text
+        self.sourceName = sourceName
+        self.placeholders = placeholders if placeholders is not None else Placeholders(text)
+        self.codeMark = self.placeholders.start + "preText"
+        self.imageLinkMarker = self.placeholders.marker("IL")
+        self.title = ""
+        self._floatRE = re.compile(r"\[.+?(?:\.jpg|\.png|\.gif|\.svg)(?:" + 
+                        re.escape(self.imageLinkMarker) + r"[^\]]+)?\][ ]*\S.+")
+    def _error_url(self):
+        raise QuicknrError( "Error: File '"+self.sourceName+"' contains\n"
+                            "       an invalid URL. Correct and try again.\n"
+                            "       Quit.")
+    def _lines(self):
+        """
+        Returns the lines of the text with code blocks protected and trailing
+        spaces deleted, empty lines between paragraphs
+        
+        A code block is a paragraph starting with a "code:" label line
+        
+        """
+        tT = self.text.replace("\t", "    ")
+        tT = ("\n\n" + tT + "\n\n").replace(">", "&gt;").replace("<", "&lt;")
+        linesL = []
+        paraL = [] # Lines of the paragraph being read
+        textSeen = False # Whether the first paragraph with text was read
+        lastCode = None # Token of the last code block, if no text follows it
+        for line in tT.split("\n"):
+            if line:
+                if '"' in line and "[" in line and self._badURLRE.search(line):
+                    self._error_url()
+                paraL.append(line)
+                continue
+            if paraL:
+                start = None # Index of the line the paragraph starts at
+                hasText = any(not x.isspace() for x in paraL)
+                if hasText: lastCode = None
+                if not textSeen:
+                    if hasText: # Whitespace before the first text is ignored
+                        textSeen = True
+                        start = next(i for i, x in enumerate(paraL) if not x.isspace())
+                        if paraL[start][0].isspace(): start = None
+                else:
+                    start = 0
+                if start is not None and paraL[start][:4].lower() == "code" and \
+                                self._codeRE.match("\n".join(paraL[start:start+2])):
+                    x = self._labelRE.sub("", "\n".join(paraL[start:]))
+                    lastCode = self.placeholders.protect(x, "preText")
+                    label = paraL[start]
+                    p = self._codeLabelRE.match(label).end()
+                    if p == len(label):
+                        paraL[start:] = [label, lastCode]
+                    else:
+                        paraL[start:] = [label[:p+1] + lastCode]
+                linesL.extend(x.rstrip(" ") for x in paraL)
+                paraL = []
+            linesL.append("")
+        if lastCode is not None: # Trailing whitespace is not code
+            self.placeholders.values[lastCode] = self.placeholders.values[lastCode].rstrip()
+        return linesL
+    def _clean(self, linesL):
+        """
+        Deletes spaces and quotes within link brackets, duplicate brackets
+        and marks images linking to a URL, in lines of paragraphs
+        
+        """
+        i = 0
+        n = len(linesL)
+        while i < n:
+            if not linesL[i]:
+                i += 1
+                continue
+            j = i
+            while j < n and linesL[j]: j += 1
+            if any("[" in x or "]" in x for x in linesL[i:j]):
+                paraL = linesL[i:j]
+                for k, x in enumerate(paraL):
+                    if "[" in x: x = self._openSpaceRE.sub(r"\1", x)
+                    if "]" in x: x = self._closeSpaceRE.sub(r"\1", x)
+                    paraL[k] = x
+                pT = "\n".join(paraL)
+                if "'" in pT or '"' in pT:
+                    paraL = self._delete_link_quotes(pT).split("\n")
+                for k, x in enumerate(paraL):
+                    if "[[" in x or "]]" in x: x = self._doubleBracketRE.sub("\1", x)
+                    if "][" in x: x = self._imageLinkRE.sub(r"\1" + self.imageLinkMarker, x)
+                    paraL[k] = x
+                linesL[i:j] = paraL
+            i = j
+    @staticmethod
+    def _delete_link_quotes(pT):
+        """
+        Returns paragraph text with the quotes around link URLs deleted, as
+        (\\[)([^\\]]+[ ])?(["'])([^ \\]]+)\\3(\\]) replaced by \\1\\2\\4\\5 would,
+        but looking at the text up to each closing bracket once, instead of
+        again from each opening bracket before it
+        
+        The first opening bracket links if the word after the last space is
+        quoted, else the first one after that space, or after the first if
+        there is no space, with the rest of the text quoted
+        
+        """
+        def _quoted(a, e):
+            return e - a > 2 and pT[a] in "'\"" and pT[e-1] == pT[a]
+        partsL = []
+        pos = 0
+        while True:
+            i = pT.find("[", pos)
+            e = i != -1 and pT.find("]", i) or -1
+            if e == -1: break
+            s = pT.rfind(" ", i, e)
+            if s > i + 1 and _quoted(s + 1, e):
+                partsL.append(pT[pos:s+1] + pT[s+2:e-1] + "]")
+            else:
+                k = pT.find("[", max(s + 1, i), e)
+                while k != -1 and not _quoted(k + 1, e): k = pT.find("[", k + 1, e)
+                if k == -1: partsL.append(pT[pos:e+1])
+                else: partsL.append(pT[pos:k+1] + pT[k+2:e-1] + "]")
+            pos = e + 1
+        partsL.append(pT[pos:])
+        return "".join(partsL)
+    def _paragraphs(self):
+        """
+        Returns the lines of the text grouped into paragraphs, lists of two 
+        or more items gathered into their own, empty lines between the items
+        dropped, and leading spaces of the items deleted
+        
+        """
+        linesL = self._lines()
+        self._clean(linesL)
+        breaks = set() # Indexes of first items of lists, starting a paragraph
+        gaps = set() # Indexes of empty lines within lists
+        for isItem in (lambda x: x.lstrip(" ")[:2] == "* " and len(x.lstrip(" ")) > 2,
+                        lambda x: self._orderedItemRE.match(x)):
+            itemsL = []
+            for i, line in enumerate(linesL + ["."]): # Sentinel ends the last list
+                if line and isItem(line):
+                    itemsL.append(i)
+                elif line:
+                    if len(itemsL) > 1:
+                        breaks.add(itemsL[0])
+                        gaps.update(range(itemsL[0], itemsL[-1]))
+                        for k in itemsL: linesL[k] = linesL[k].lstrip(" ")
+                    itemsL = []
+        parasL = []
+        paraL = []
+        for i, line in enumerate(linesL):
+            if line and (line[0] == "*" or line[0].isdigit()):
+                mo = self._itemSpacesRE.match(line)
+                if mo: line = mo.group(1) + line[mo.end():]
+            if i in breaks or not line and i not in gaps:
+                if paraL: parasL.append(paraL)
+                paraL = []
+            if line: paraL.append(line)
+        if paraL: parasL.append(paraL)
+        return parasL
+    def _paragraph(self, paraL):
+        """
+        Returns the (type, text) token of a paragraph block, None if blank
+        
+        """
+        pT = "\n".join(x.lstrip(" ") for x in paraL)
+        if not pT.strip(): return None
+        if pT.startswith("[") and pT.endswith("]") and \
+                                "[" not in pT[1:-1] and "]" not in pT[1:-1]:
+            return ("link", pT)
+        if self._directiveRE.match(pT): return ("directive", pT)
+        lL = pT.split("\n")
+        if sum(1 for x in lL if x.startswith("* ")) > 1: return ("ulist", pT)
+        if sum(1 for x in lL if self._orderedLineRE.match(x)) > 1: return ("olist", pT)
+        if self.codeMark in pT and pT.lower().startswith("code"): return ("code", pT)
+        if self._definitionRE.match(pT): return ("definition", pT)
+        if self._floatRE.match(pT): return ("float", pT)
+        return ("para", pT)
+    def blocks(self):
+        """
+        Returns the list of block tokens of the page, in order
+        
+        """
+        parasL = self._paragraphs()
+        blocksL = []
+        if parasL and len(parasL[0]) == 1 and self._titleRE.fullmatch(parasL[0][0]):
+            title = parasL[0][0].strip()
+            titleAppear = True
+            if title.startswith("[") and title.endswith("]"):
+                titleAppear = False
+                title = title[1:-1]
+            if title:
+                if titleAppear: blocksL.append(("title", title))
+                self.title = title # Already escaped, and will be again
+                parasL = parasL[1:]
+        sectionL = []
+        for paraL in parasL:
+            if len(paraL) == 1 and self._headingRE.match(paraL[0]): # !No length limit
+                if sectionL: blocksL.append(("section", sectionL))
+                sectionL = []
+                blocksL.append(("heading", paraL[0].strip()))
+            else:
+                tok = self._paragraph(paraL)
+                if tok: sectionL.append(tok)
+        blocksL.append(("section", sectionL))
+        return blocksL
+    @classmethod
+    def inline(cls, text, jsLinks=True):
+        """
+        Returns the inline tokens of the text of a block. Javascript links
+        are found first if jsLinks is true, then links with text, then bare
+        links, each kind in the text left between the ones found before
+        
+        """
+        tokensL = [("text", text)]
+        if "[" not in text or "]" not in text: return tokensL
+        kindsL = ["link", "bare"]
+        if jsLinks: kindsL[:0] = ["jslink", "jscall"]
+        for kind in kindsL:
+            newL = []
+            for tok in tokensL:
+                if tok[0] != "text":
+                    newL.append(tok)
+                    continue
+                pos = 0
+                for start, end, link in cls._links(tok[1], kind):
+                    if start > pos: newL.append(("text", tok[1][pos:start]))
+                    newL.append(link)
+                    pos = end
+                if pos < len(tok[1]): newL.append(("text", tok[1][pos:]))
+            tokensL = newL
+        return tokensL
+    @classmethod
+    def _links(cls, text, kind):
+        """
+        Yields (start, end, token) of the links of kind in the text, in order
+        
+        Links with text are those of \\[(.+?)[ ]+(X)\\], X the URL or call, the
+        URL not starting with a bracket, but found from their ends, the 
+        spaces, X and closing bracket, in one pass over the text: a link runs
+        from an opening bracket to the first end at least two characters on,
+        if on the same line and the bracket does not open a bare link. Bare
+        links are those of \\[(\\S+?)\\], the text up to a closing bracket 
+        again looked at only if after whitespace. The patterns backtrack over
+        all the text after each opening bracket of a line never closed
+        
+        """
+        if kind == "jscall":
+            for mo in cls._jsCallRE.finditer(text):
+                yield mo.start(), mo.end(), ("jscall", mo.group(1))
+            return
+        i = text.find("[")
+        if kind == "bare":
+            j = -1 # First closing bracket two or more characters after i
+            while i != -1:
+                if j < i + 2:
+                    j = text.find("]", i + 2)
+                    if j == -1: return
+                mw = cls._whiteRE.search(text, i + 1, j)
+                if mw:
+                    i = text.find("[", mw.end())
+                    continue
+                yield i, j + 1, ("link", text[i+1:j], text[i+1:j])
+                i = text.find("[", j + 1)
+            return
+        ends = (kind == "jslink" and cls._jsLinkEndRE or cls._linkEndRE).finditer(text)
+        mo = next(ends, None)
+        while i != -1:
+            while mo and mo.start(1) <= i + 2: mo = next(ends, None)
+            if not mo: return
+            p = max(mo.start(), i + 2)
+            nl = text.find("\n", i, p)
+            if nl != -1:
+                i = text.find("[", nl)
+                continue
+            c = text.find("]", i + 1, p)
+            if c > i + 1 and not cls._whiteRE.search(text, i + 1, c): # A bare link first
+                i = text.find("[", c + 1)
+                continue
+            yield i, mo.end(), (kind, text[i+1:p], mo.group(1))
+            i = text.find("[", mo.end())
+
+class QLMRenderer:
+    """
+    Renders the block tokens of a QLMLexer as the HTML of the page content,
+    using the settings of the page for Javascript links and news listings
+    
+    Styled text is kept as a string with a "\\0" in place of each tag or 
+    link already made, an atom, and the list of (position, HTML) of the 
+    atoms. Styling delimiters are resolved in the order of STYLES, three 
+    delimiters first, then two and one, each in one sweep over the positions
+    of the delimiters, matching the first closing delimiter after each 
+    opening one on its line
+
+    The HTML of the title, headings, sections and paragraph blocks is made
+    as parts, with the counters of the blocks left as fields, and kept in
+    blockCache if given, any mapping with get() and put(), by the digest of
+    the text of the block and the settings. Unchanged blocks of a page are
+    so taken from the cache, and only counted again
+
+    """
+    STYLES = (
+        (3, "*_`", '<span style="font-weight:bold;font-style:italic"><code>', "</code></span>"),
+        # Order matters here, catch double ** and __ as bold & italic, `` as italic
+        (2, "*_", '<span style="font-weight:bold;font-style:italic">', "</span>"),
+        (2, "_`", '<span style="font-style:italic"><code>', "</code></span>"),
+        (2, "*`", '<span style="font-weight:bold"><code>', "</code></span>"),
+        (1, "*", '<span style="font-weight:bold">', "</span>"),
+        (1, "_", '<span style="font-style:italic">', "</span>"),
+        (1, "`", "<code>", "</code>"),
+        )
+    _delimitersRE = re.compile(r"[*_`]+")
+    _jsURLRE = re.compile(r"[^():]+\([^()]*\)")
+    _jsInvalidRE = re.compile(r"[^A-Za-z0-9_\-'\.;()]")
+    _fieldRE = re.compile(r"\{(\w*)\}")
+    
+    def __init__(self, settings, blockCache=None):
+        self.jsLinks = settings["JAVASCRIPT_LINK_SPAN"] == "YES"
+        self.jsPre = settings["JAVASCRIPT_LINK_PRE"]
+        self.jsPost = settings["JAVASCRIPT_LINK_POST"]
+        self.newsListing = os.path.splitext(os.path.basename(settings["sourceFilePath"]))[0] == "news"
+        self.sourceName = ""
+        self.imageLinkMarker = ""
+        self.blockCache = blockCache
+        # Settings the HTML of blocks depends on, part of their cache keys
+        self.memoConfig = [self.jsLinks, self.jsPre, self.jsPost, self.newsListing]
+    @staticmethod
+    def _is_word(c):
+        return c.isalnum() or c == "_"
+    @classmethod
+    def style(cls, s, atomsL):
+        """
+        Returns styled text s with atoms atomsL, its styling delimiters 
+        replaced with atoms of the tags of their styles
+        
+        """
+        for n, chars, openTag, closeTag in cls.STYLES:
+            runsL = [mo.span() for mo in cls._delimitersRE.finditer(s)]
+            if not runsL: break
+            sLen = len(s)
+            candL = [k for a, b in runsL for k in range(a, b-n+1) 
+                                        if all(c in chars for c in s[k:k+n])]
+            closersL = [k for k in candL if k+n == sLen or not cls._is_word(s[k+n])]
+            if not closersL: continue
+            breaksL = [mo.start() for mo in re.finditer("\n", s)] if "\n" in s else []
+            matchesL = []
+            pos = 0
+            for k in candL:
+                if k < pos or k+n >= sLen or s[k+n] == " " or k and cls._is_word(s[k-1]):
+                    continue
+                i = bisect.bisect_left(closersL, k+n+1)
+                if i == len(closersL): break # No closer for this or later openers
+                j = closersL[i]
+                i = bisect.bisect_left(breaksL, k+n+1)
+                if i < len(breaksL) and breaksL[i] < j: continue # Not on one line
+                matchesL.append((k, j))
+                pos = j + n
+            if not matchesL: continue
+            outL = []
+            newAtomsL = []
+            outLen = 0
+            ai = 0
+            pos = 0
+            for k, j in matchesL + [(sLen, None)]:
+                for a, b, tag in ((pos, k, openTag), (k+n, j, closeTag)):
+                    if b is None: break
+                    while ai < len(atomsL) and atomsL[ai][0] < b:
+                        newAtomsL.append((outLen + atomsL[ai][0] - a, atomsL[ai][1]))
+                        ai += 1
+                    outL.append(s[a:b])
+                    outLen += b - a
+                    if b == sLen: break
+                    newAtomsL.append((outLen, tag))
+                    outL.append("\0")
+                    outLen += 1
+                pos = (j or 0) + n
+            s = "".join(outL)
+            atomsL = newAtomsL
+        return s, atomsL
+    @staticmethod
+    def join(s, atomsL):
+        """ Returns the HTML of styled text s with atoms atomsL """
+        if not atomsL: return s
+        outL = []
+        pos = 0
+        for p, tag in atomsL:
+            outL.append(s[pos:p])
+            outL.append(tag)
+            pos = p + 1
+        outL.append(s[pos:])
+        return "".join(outL)
+    @classmethod
+    def style_text(cls, tT):
+        """
+        Converts inline text styling, bold, italic, monospaced (<code>)
+        
+        We use <span> for a sense of CSS 'neutrality'
+        
+        """
+        if not cls._delimitersRE.search(tT): return tT
+        return cls.join(*cls.style(tT, []))
+    @classmethod
+    def unstyle(cls, tT):
+        """
+        Deletes styling markup from text, as (?<!\\w)[*_`]+([^ ].*?)[*_`]+(?!\\w)
+        replaced by \\1 would, but finding the closing delimiters once instead
+        of again for each opening one, in the rest of its line
+        
+        A delimiter run can close from its start up to a delimiter followed
+        by no word character. The text after an opening run starts after its
+        last delimiter, or last but one if a space follows, and failing a 
+        closing run later on the line, is the one delimiter before its own
+        
+        """
+        runsL = [] # (start, end, end of closing) of delimiter runs
+        tLen = len(tT)
+        for mo in cls._delimitersRE.finditer(tT):
+            a, b = mo.span()
+            if b < tLen and cls._is_word(tT[b]): c = max(tT.rfind("*", a+1, b), tT.rfind("`", a+1, b), a)
+            else: c = b
+            runsL.append((a, b, c))
+        if not runsL: return tT
+        closersL = [i for i, x in enumerate(runsL) if x[2] > x[0]] # Runs that can close
+        closesL = [runsL[i][2] for i in closersL]
+        breaksL = [mo.start() for mo in re.finditer("\n", tT)] if "\n" in tT else []
+        outL = []
+        pos = 0 # End of the text copied to outL
+        k = 0 # Position of the next opening delimiter
+        ri = 0
+        while ri < len(runsL):
+            a, b, c = runsL[ri]
+            k = max(k, a)
+            while k < b and k and cls._is_word(tT[k-1]): k += 1
+            if k < b:
+                end = None
+                start = b if b < tLen and tT[b] != " " else b - 1
+                if start > k: # Closing in a later run on the line
+                    i = bisect.bisect_right(closesL, start + 1)
+                    if i < len(closersL):
+                        i = closersL[i]
+                        j = max(runsL[i][0], start + 1)
+                        n = bisect.bisect_left(breaksL, start + 1)
+                        if n == len(breaksL) or breaksL[n] >= j: end = runsL[i][2]
+                if end is None and c - 2 > k: # Closing in this run, text one delimiter
+                    start, j, end, i = c - 2, c - 1, c, ri
+                if end is not None:
+                    outL.append(tT[pos:k])
+                    outL.append(tT[start:j])
+                    pos = k = end
+                    ri = i
+                    continue
+            ri += 1
+        outL.append(tT[pos:])
+        return "".join(outL)
+    @staticmethod
+    def _url(url):
+        """ Returns URL in an href or src attribute, http:// added to www. """
+        return "http://" + url if url.startswith("www.") else url
+    def _error(self, message):
+        raise QuicknrError("Error: File '"+self.sourceName+"' contains" + message)
+    def _check_js_call(self, url):
+        if self._jsInvalidRE.search(url):
+            self._error(" an invalid\n       Javascript function call. Correct and try again.\n"
+                        "       Quit.")
+    def _check_image_link(self, url):
+        if self.imageLinkMarker in url:
+            self._error(" one or more\n       image link sequences of more than two [] parts.\n"
+                        "       Correct and try again.\n       Quit.")
+    def _check_url(self, url):
+        if '"' in url:
+            self._error("\n       an invalid URL. Correct and try again.\n       Quit.")
+    def _inline(self, text):
+        """ Returns HTML of the text of a block, its links and styling converted """
+        sL = []
+        atomsL = []
+        sLen = 0
+        def _atom(tag):
+            nonlocal sLen
+            atomsL.append((sLen, tag))
+            sL.append("\0")
+            sLen += 1
+        def _text(tT, tAtomsL=()):
+            nonlocal sLen
+            atomsL.extend((sLen + p, tag) for p, tag in tAtomsL)
+            sL.append(tT)
+            sLen += len(tT)
+        for tok in QLMLexer.inline(text, self.jsLinks):
+            if tok[0] == "text":
+                _text(tok[1])
+            elif tok[0] == "link": # Text styled on its own first
+                _atom('<a href="{}">'.format(self._url(tok[2])))
+                _text(*self.style(tok[1], []))
+                _atom("</a>")
+            elif tok[0] == "jslink":
+                _atom('<span class="js_call" onclick="{}">'.format(self.jsPre+tok[2]+self.jsPost))
+                _text(tok[1])
+                _atom("</span>")
+            else:
+                _atom('<span class="js_call" onclick="{}"></span>'.format(
+                                                            self.jsPre+tok[1]+self.jsPost))
+        return self.join(*self.style("".join(sL), atomsL))
+    def _link_type(self, sT):
+        """
+        Return link type of text: link, image, YTvideo
+        
+        """
+        if "youtube.com" in sT.lower() or "youtu.be" in sT.lower(): return "YTvideo"
+        for x in [".jpg",".png",".gif",".svg"]:
+            if sT.lower().endswith(x) or sT.split(self.imageLinkMarker)[0].lower().endswith(x):
+                return "image"
+        return "link"
+    @classmethod
+    def _parts(cls, template, *values):
+        """
+        Returns the parts of a template, a list of text and counter field 
+        names in turn, starting and ending with text. The {} fields of the
+        template are filled with the values, and the named fields left to be
+        filled by _fill() with the counts of the block
+        
+        """
+        partsL = [""]
+        vi = 0
+        for i, x in enumerate(cls._fieldRE.split(template)):
+            if i % 2 == 0:
+                partsL[-1] += x
+            elif x:
+                partsL.extend([x, ""])
+            else:
+                partsL[-1] += values[vi]
+                vi += 1
+        return partsL
+    @staticmethod
+    def _concat(piecesL):
+        """ Returns the parts of pieces joined in order, each text or parts """
+        partsL = []
+        chunksL = []
+        for p in piecesL:
+            if isinstance(p, str):
+                chunksL.append(p)
+                continue
+            chunksL.append(p[0])
+            for i in range(1, len(p), 2):
+                partsL.extend(["".join(chunksL), p[i]])
+                chunksL = [p[i+1]]
+        partsL.append("".join(chunksL))
+        return partsL
+    @staticmethod
+    def _fill(partsL, fields):
+        """ Returns parts with the fields in the fields dict filled in """
+        outL = []
+        chunksL = [partsL[0]]
+        for i in range(1, len(partsL), 2):
+            if partsL[i] in fields:
+                chunksL.append(str(fields[partsL[i]]))
+            else:
+                outL.extend(["".join(chunksL), partsL[i]])
+                chunksL = []
+            chunksL.append(partsL[i+1])
+        outL.append("".join(chunksL))
+        return outL
+    @staticmethod
+    def _count(counts, kinds):
+        """ Returns the fields of a block counted in counts, for each of kinds """
+        fields = {}
+        for k in kinds:
+            counts[k] = counts.get(k, 0) + 1
+            fields[k] = counts[k]
+            fields[k + "_oe"] = counts[k]%2 and "odd" or "even"
+        return fields
+    def _memo(self, key, make):
+        """
+        Returns the (counter kinds, parts) of the block of key from the block
+        cache, making them with make() and caching them if not found
+        
+        """
+        if self.blockCache is None: return make()
+        digest = hashlib.md5(json.dumps([self.memoConfig, self.imageLinkMarker, key]).encode()).hexdigest()
+        entry = self.blockCache.get(digest)
+        if entry is None:
+            entry = make()
+            self.blockCache.put(digest, entry)
+        return entry
+    def _paragraph(self, pType, pT):
+        """
+        Returns the counter kinds and the parts of the HTML of a paragraph 
+        block, its counters being p for paragraphs, i images, v videos, l 
+        lists, c code, d definitions and f image floats, and s its section
+        
+        """
+        kinds = ""
+        
+        # --------------------- Link block types: link, image, video
+        if pType == "link":
+            linkType = self._link_type(pT[1:-1])
+            # Separate link text and link URL
+            if " " in pT:
+                linkText, linkURL = pT[1:-1].rsplit(maxsplit=1)
+            else:
+                if linkType != "image" and linkType != "YTvideo":
+                    linkText = pT[1:-1]
+                else:
+                    linkText = ""
+                linkURL = pT[1:-1] # May not equal linkText later
+            self._check_url(linkURL)
+            # Escape quotes, not done earlier
+            origLinkText = linkText[:] # Copy to preserve original for comparing
+            linkText = linkText.replace("'", "&#x27;").replace('"', "&quot;")
+            # Handle different link block types
+            if linkType == "link":
+                kinds = "p"
+                if self.jsLinks and self._jsURLRE.match(linkURL):
+                    if origLinkText == linkURL: linkText = " " # Prevent empty tag
+                    self._check_js_call(linkURL)
+                    linkURL = self.jsPre + linkURL + self.jsPost
+                    pT = '<p class="p_{p} link_p {p_oe} section_{s}"><span class="js_call" onclick="{}">{}</span></p>'
+                    partsL = self._parts(pT, linkURL, self.join(*self.style(linkText, [])))
+                else:
+                    pT = '<p class="p_{p} link_p {p_oe} section_{s}"><a href="{}">{}</a></p>'
+                    partsL = self._parts(pT, self._url(linkURL),
+                                        self.join(*self.style(*self.style(linkText, []))))
+            elif linkType == "image":
+                kinds = "i"
+                clickLinkURL = "" # Handle images as links
+                if self.imageLinkMarker in linkURL:
+                    linkURL, clickLinkURL = linkURL.split(self.imageLinkMarker, maxsplit=1)
+                    self._check_image_link(clickLinkURL)
+                pT = '<div class="imgblock imgblock_{i} {i_oe} section_{s}">\n'
+                clickClose = ""
+                if clickLinkURL:
+                    if self.jsLinks and self._jsURLRE.match(clickLinkURL):
+                        self._check_js_call(clickLinkURL)
+                        clickLinkURL = self.jsPre + clickLinkURL + self.jsPost
+                        pT = '<div class="imgblock link_img imgblock_{i} {i_oe} section_{s}">\n'
+                        pT += '<span class="js_call" onclick="{}">\n'
+                        clickClose = '</span>\n'
+                    else:
+                        clickLinkURL = self._url(clickLinkURL)
+                        pT = '<div class="imgblock link_img imgblock_{i} {i_oe} section_{s}">\n<a href="{}">\n'
+                        clickClose = '</a>\n'
+                piecesL = [self._parts(pT, clickLinkURL)]
+                piecesL.append('<img src="{}" alt="{}" />\n'.format(self._url(linkURL),
+                                            self.join(*self.style(self.unstyle(linkText), []))))
+                piecesL.append(clickClose)
+                if linkText: 
+                    piecesL.append('<p class="imgcaption">{}</p>\n'.format(self.style_text(linkText)))
+                piecesL.append('</div>')
+                partsL = self._concat(piecesL)
+            elif linkType == "YTvideo":
+                kinds = "v"
+                # Need the space between <iframe> tags for xml formatter
+                pT = '<div class="ytvideo vidblock_{v} {v_oe} section_{s}">\n<iframe src="{}" '
+                pT += 'frameborder="0" allowfullscreen="allowfullscreen"> </iframe>\n'
+                pT += '</div>'
+                partsL = self._parts(pT, self._url(linkURL))
+        
+        # --------------------- Import and Python directives
+        elif pType == "directive":
+            partsL = [self._inline(pT)] # Not converted to HTML
+        
+        # --------------------- Lists
+        elif pType == "ulist" or pType == "olist":
+            kinds = "l"
+            liCount = 0 # List item count
+            npT1 = ""
+            itemRE = r"(?m)^\*[ ]+(.+)$" if pType == "ulist" else r"(?m)^\d+\.?[ ]+(.+)$"
+            for x in re.findall(itemRE, pT):
+                liCount += 1
+                npT = '<li class="li_{} {}">{}</li>\n'
+                npT1 += npT.format(liCount, liCount%2 and "odd" or "even", self._inline(x))
+            tag = pType == "ulist" and "ul" or "ol"
+            pT = '<{} class="list_{l} {l_oe} section_{s}">\n{}</{}>'
+            partsL = self._parts(pT, tag, npT1, tag)
+        
+        # --------------------- Code block
+        elif pType == "code":
+            kinds = "c"
+            pT1 = pT.split(":", 1)[0]
+            npT = '<div class="{} codeblock codeblock_{c} {c_oe} section_{s}">\n{}\n</div>'
+            pT = '<pre class="code">' + pT.split()[-1] + '</pre>' # Token of its content
+            dClass = pT1.lower()
+            if dClass != "code": dClass = "code "+dClass
+            partsL = self._parts(npT, dClass, pT)
+        
+        # --------------------- Note: etc. definition
+        elif pType == "definition":
+            kinds = "d"
+            pT1 = pT.split(":", 1)[0]; pT = QLMLexer._labelRE.sub("", pT)
+            npT = '<dl class="{} dlblock dlblock_{d} {d_oe} section_{s}">\n'
+            npT += '<dt>{}</dt>\n<dd>{}</dd>\n</dl>'
+            dClass = pT1.lower()
+            if " " in dClass: dClass = "definition"
+            partsL = self._parts(npT, dClass, self._inline(pT1), self._inline(pT))
+        
+        # --------------------- Image float before paragraph
+        elif pType == "float":
+            kinds = "fp"
+            linkURL, ppT = pT[1:].split("]", maxsplit=1)
+            ppT = ppT.strip()
+            # Image part of paragraph
+            if " " in linkURL:
+                linkText, linkURL = linkURL.rsplit(maxsplit=1)
+                linkText = linkText.replace("'", "&#x27;").replace('"', "&quot;")
+            else:
+                linkText = ""
+            self._check_url(linkURL)
+            clickLinkURL = "" # Handle images as links
+            if self.imageLinkMarker in linkURL:
+                linkURL, clickLinkURL = linkURL.split(self.imageLinkMarker, maxsplit=1)
+                self._check_image_link(clickLinkURL)
+            divT = '<div class="imgfloat imgfloat_{f} {f_oe} section_{s}">\n'
+            clickClose = ""
+            if clickLinkURL:
+                if self.jsLinks and self._jsURLRE.match(clickLinkURL):
+                    self._check_js_call(clickLinkURL)
+                    clickLinkURL = self.jsPre + clickLinkURL + self.jsPost
+                    divT = '<div class="imgfloat link_img imgfloat_{f} {f_oe} section_{s}">\n'
+                    divT += '<span class="js_call" onclick="{}">\n'
+                    clickClose = '</span>\n'
+                else:
+                    clickLinkURL = self._url(clickLinkURL)
+                    divT = '<div class="imgfloat link_img imgfloat_{f} {f_oe} section_{s}">\n<a href="{}">\n'
+                    clickClose = '</a>\n'
+            if self.newsListing:
+                divT = divT.replace('<div class="imgfloat', 
+                            '<div style="background-image:url(\'{}\')" class="imgfloat', 1)
+                piecesL = [self._parts(divT, linkURL, clickLinkURL)]
+            else:
+                piecesL = [self._parts(divT, clickLinkURL)]
+                piecesL.append('<img src="{}" alt="{}" />\n'.format(self._url(linkURL),
+                                            self.join(*self.style(self.unstyle(linkText), []))))
+            piecesL.append(clickClose)
+            if linkText: 
+                piecesL.append('<p class="imgcaption">{}</p>\n'.format(self.style_text(linkText)))
+            piecesL.append('</div>\n')
+            # Text part of paragraph
+            pT = '<p class="p_{p} img_p {p_oe} section_{s}">{}</p>'
+            pT = self._parts(pT, self._inline(ppT))
+            # Image and text combo, an empty image div of news listing dropped
+            if self.newsListing and not clickLinkURL and not linkText:
+                partsL = pT
+            else:
+                partsL = self._concat(piecesL + [pT])
+        
+        # --------------------- Paragraph
+        else:
+            kinds = "p"
+            npT = '<p class="p_{p} {p_oe} section_{s}">{}</p>'
+            partsL = self._parts(npT, self._inline(pT))
+        return kinds, partsL
+    def _section(self, paragraphs):
+        """
+        Returns the counter kinds and the parts of the HTML of a section of 
+        paragraph blocks, the paragraphs counted within it
+        
+        """
+        counts = {}
+        piecesL = [self._parts('<div class="section {s_oe} section_{s}">\n')]
+        for x in paragraphs:
+            kinds, partsL = self._memo(x, lambda: self._paragraph(*x))
+            piecesL.append(self._fill(partsL, self._count(counts, kinds)))
+            piecesL.append("\n")
+        piecesL[-1] = "\n</div>"
+        return "s", self._concat(piecesL)
+    def render(self, lexer):
+        """
+        Returns the HTML of the blocks of the page text of lexer
+        
+        """
+        self.sourceName = lexer.sourceName
+        self.imageLinkMarker = lexer.imageLinkMarker
+        blocksL = lexer.blocks()
+        rL = []
+        counts = {} # Section/heading counter, 0-indexed for no headings
+        for i, (bType, b) in enumerate(blocksL):
+            if bType == "title":
+                kinds, partsL = self._memo(("title", b), 
+                                lambda: ("", ['<h1 class="title">%s</h1>' % self._inline(b)]))
+                rL.append(partsL[0])
+            elif bType == "heading":
+                kinds, partsL = self._memo(("heading", b), lambda: ("s", self._parts(
+                                '<h2 class="heading {s_oe} heading_{s}">{}</h2>', self._inline(b))))
+                fields = self._count(counts, kinds)
+                # Surround heading & section pairs with div
+                if len(blocksL) > i+1 and blocksL[i+1][0] == "section":
+                    partsL = self._concat([self._parts('<div class="headed_section {s_oe} section_{s}">\n'),
+                                            partsL])
+                rL.append(self._fill(partsL, fields)[0])
+            else:
+                if b:
+                    kinds, partsL = self._memo(("section", b), lambda: self._section(b))
+                    fields = {"s": counts.get("s", 0), "s_oe": counts.get("s", 0)%2 and "odd" or "even"}
+                    b = self._fill(partsL, fields)[0]
+                else: # Empty section dropped, with the line break before it
+                    b = ""
+                    if rL: rL[-1] = rL[-1][:-1]
+                if i and blocksL[i-1][0] == "heading": b += "\n</div>"
+                rL.append(b)
+            rL[-1] += "\n"
+        return "".join(rL)
+
+# Per-file converter of the current run, set by Quicknr() before a pool of
+# worker processes is forked, so that the workers inherit it
+_poolConverter = None
+
+def _pool_convert(ctx):
+    """
+    Converts one source in a worker process of the --jobs pool, returning the
+    converter result. An error exit in the worker is passed back to the parent
+    
+    """
+    try:
+        return _poolConverter(ctx)
+    except SystemExit: # Message already printed by the worker
+        return dict(quit=True)
+
 def Quicknr():
     """
     Quicknr - Fast and powerful Python application for the making and updating of 
@@ -95,7 +2007,7 @@ def Quicknr():
     
     """
     
-    print("\n===================== QUICKNR 2.0.2 =====================\n")
+    print("\n===================== QUICKNR {} =====================\n".format(QUICKNR_VERSION))
     
     # --------------------- App defaults
     
@@ -142,8 +2054,13 @@ def Quicknr():
                     FTP_ACCT = "",
                     FTP_DEBUG = "0",
                     FTP_PASSIVE = "YES",
+                    FTP_CONNECTIONS = "4",
                     ALWAYS_XHTML_TAGS = "NO",
+                    BUILD_CACHE_SIZE = "50",
+                    CHANGE_DETECTION = "STAT",
+                    PRECOMPRESS = "NO",
                     FILE_SIZE_LIMIT = True,
+                    siteConfig = None, # Typed settings, SiteConfig of the values above
                     siteDir = "", # Path
                     siteFolder = "", # Name
                     sourceFilePath = "",
@@ -163,18 +2080,21 @@ def Quicknr():
                 "       Quit.")
         sys.exit()
     
-    # Prepare list for <pre> handling
-    preContentL = []
-    
-    # Prepare list for Javascript link function argument handling
-    #jsLinkContentL = []
-    
     # Boolean toggle for 'page_sources/news.txt' updating conversion
     updateNewsList = False
     
     # Boolean toggle for 'page_sources/news.txt' to be rebuilt
     rebuildNewsList = False
     
+    # SiteSnapshot of the website folder, shared by the scans of a run
+    siteSnap = None
+    
+    # ImportFiles cache of the "config/import" folder, shared by the pages of a run
+    importFiles = None
+    
+    # Profiler of the stages of the run, with the --profile option
+    profiler = None
+    
     # News list item block to be filled with data and inserted into news posts
     newsListItemBlock = """
 <!-- Quicknr-news-list-item-block
@@ -246,16 +2166,59 @@ def Quicknr():
         argParser.add_argument("-a","--allupload", # Bool optional argument
                             action="store_true", # Avoid None
                             help="Upload all contents of 'public_html'")
-        return argParser.parse_args() # Namespace object
+        # Upload only the files that differ from those on the server
+        argParser.add_argument("--sync", # Bool optional argument
+                            action="store_true", # Avoid None
+                            help="Upload the files of 'public_html' that differ from those on "
+                                 "the server, and offer to delete server files not found locally")
+        # Convert sources in a pool of worker processes
+        argParser.add_argument("--jobs", # Int optional argument
+                            type=int, default=1, metavar="N",
+                            help="Convert sources in N parallel processes (0 for one per CPU)")
+        # Keep running, converting sources as they change
+        argParser.add_argument("-w","--watch", # Bool optional argument
+                            action="store_true", # Avoid None
+                            help="Watch mode, convert sources whenever they or the config change")
+        # Work on the named website, without the websites menu
+        argParser.add_argument("--site", # String optional argument
+                            default="", metavar="FOLDER",
+                            help="Work on the website of this folder name, without the menu")
+        # Serve pages rendered from sources on request, for preview
+        argParser.add_argument("-p","--preview", # Int optional argument, port
+                            type=int, nargs="?", const=8000, default=None, metavar="PORT",
+                            help="Preview mode, serve pages rendered from sources on "
+                                 "http://127.0.0.1:PORT (default 8000)")
+        # Time the stages of the run per file, and write a trace of them
+        argParser.add_argument("--profile", # Int optional argument, top pages
+                            type=int, nargs="?", const=10, default=None, metavar="N",
+                            help="Profile the stages of the run, listing the N slowest pages "
+                                 "(default 10), and write a Chrome trace of them to "
+                                 "'quicknr_private/quicknr_profile.json'")
+        cliArgs = argParser.parse_args() # Namespace object
+        if cliArgs.jobs < 0: _say_error("Error: Number of jobs cannot be negative.\n       Quit.")
+        return cliArgs
     
     def _say_quit():
         """
         Simple quit
         
         """
+        _profile_report()
         print("Quit.")
         sys.exit()
     
+    def _profile_report():
+        """
+        Prints the profile of the run and writes its trace file, if profiling
+        
+        """
+        nonlocal profiler
+        if not profiler: return
+        profiler.uninstall(globals())
+        profiler.report(cliArgs.profile, 
+                        os.path.join(CD["siteDir"], "quicknr_private/quicknr_profile.json"))
+        profiler = None
+    
     def _say_error(message):
         """
         Error message and exit, or raise exception to provide traceback
@@ -267,22 +2230,38 @@ def Quicknr():
         else:
             raise QuicknrError("\n"+message)
         
-    def _file_size_and_hash(fPath):
+    def _file_size_and_hash(fPath, legacy=False):
         """
-        Return file size and hash as a tuple
+        Return file size, hash and stat data as a tuple
+        
+        The hash is a 40 digit BLAKE2 digest of the file, or if legacy is true,
+        the 32 digit MD5 digest of its text used in records of earlier versions
         
         """
         filePath = os.path.join(CD["siteDir"], fPath)
-        fS = os.path.getsize(filePath) # Bytes
+        st = os.stat(filePath) # Before reading, so any later edit changes the stat
+        fS = st.st_size # Bytes
         if CD["FILE_SIZE_LIMIT"] and fS > 1100000: # Let's stay sane
             _say_error( "Error: File '"+fPath+"' is over 1MB in size,\n" + \
                         "         too large for publication.\n" + \
                         "       Reduce the size to under 1MB and try again.\n" + \
                         "       Quit.")
-        with open(filePath, mode="r") as f:
-            fT = f.read()
-        fH = hashlib.md5(fT.encode()).hexdigest()
-        return (str(fS), fH)
+        if legacy:
+            with open(filePath, mode="r") as f:
+                fT = f.read()
+            fH = hashlib.md5(fT.encode()).hexdigest()
+        else:
+            with open(filePath, mode="rb") as f:
+                fH = hashlib.blake2b(f.read(), digest_size=20).hexdigest()
+        return (str(fS), fH, _stat_data(st))
+    
+    def _stat_data(st):
+        """
+        Returns stat data field of data record: modification and status change
+        times in nanoseconds, and inode number, colon-separated
+        
+        """
+        return "{}:{}:{}".format(st.st_mtime_ns, st.st_ctime_ns, st.st_ino)
 
     def _html_escape_noamp(tT, quote=True):
         """
@@ -356,11 +2335,18 @@ def Quicknr():
                     "       Further instructions will then appear.\n"
                     "       Quit.")
     
-    def _ui_get_site_dir():
+    def _say_record_conflicts(conflicts):
+        """ Prints the paths of record changes dropped, see RecordStore """
+        for x in conflicts:
+            print("  Record of '{}' changed by another process, not changed here.".format(x))
+    
+    def _ui_get_site_dir(siteFolder=""):
         """
         Prompts the user with list of websites, offers the option of 
         creating a new one, and returns the website folder name
         
+        If siteFolder is given, that website is worked on without the menu
+        
         """        
         def _create_new_website():
             """
@@ -509,9 +2495,14 @@ def Quicknr():
                 prompt += "or N to create a new website (or Q to quit): "
                 customOption = "Create a new website"
                 wL.sort()
-                # Prompt user with menu of choices
-                wL.sort()
-                workSite = _ui_list_menu(wL, "Websites", prompt, customOption, "N")
+                if siteFolder: # Named on commandline
+                    if siteFolder not in wL:
+                        _say_error( "Error: Website folder '%s' not found.\n"
+                                    "       Quit." % siteFolder)
+                    workSite = siteFolder
+                else:
+                    # Prompt user with menu of choices
+                    workSite = _ui_list_menu(wL, "Websites", prompt, customOption, "N")
                 if workSite == customOption:
                     workSite = _create_new_website()
                 elif not workSite:
@@ -530,8 +2521,7 @@ def Quicknr():
                     wdf = os.path.join(qnrDir, 
                                     "websites/"+workSite+"/quicknr_private/quicknr_data.txt")
                     if os.path.exists(wdf):
-                        with open(wdf, mode="r") as f: fT = f.read()
-                        if not re.match(workSite, fT):
+                        if not re.match(workSite, RecordStore.load(wdf).siteFolder):
                             _data_file_corrupted_quit(workSite)
                     else:
                         with open(wdf, mode="w") as f: f.write(workSite+"\n")
@@ -545,51 +2535,77 @@ def Quicknr():
                         "       Then Quicknr will not overwrite old HTML news files.\n" + \
                         "       Quit.")
             else: # No websites in folder
+                if siteFolder:
+                    _say_error( "Error: Website folder '%s' not found.\n"
+                                "       Quit." % siteFolder)
                 print("  There are no websites to work on.\n  Let's create one.")
                 workSite = _create_new_website()
         else: # No 'websites' folder, create it and try again
             os.mkdir(os.path.join(qnrDir, "websites"))
-            return _ui_get_site_dir()
+            return _ui_get_site_dir(siteFolder)
         return workSite
     
     # --------------------- CONTENT OBTAINING FUNCTIONS ---------------------
     # Obtain settings, snippets and content for later HTML file building
     
-    def _import_files(pT):
+    def _import_files(pT, importsL=None):
         """
         Imports files from the "config/import" directory into html page text if it
         contains '@import: "file-to-import"' directives (placed there from HTML 
         head and tail snippets, or even from the source)
         
         See the "config.txt" for details of the naming convention used by the 
-        import system
+        import system. Import files are taken from the import files cache, the
+        directives replaced in one pass, those of imported files as they are 
+        inserted. A file importing itself, directly or not, is an error
+        
+        If importsL is a list, the names of the imported files are appended to it
         
         """
-        sys.setrecursionlimit(500) # Limit to stay safe
-        while True:
-            if "@import: " not in pT: return pT
-            mo = re.search(r"@import:\s+['\"](.*?)['\"]\n*", pT)
-            if not mo: return pT # Syntax error, give up silently
-            fT = "" # !Needed if empty/non-matching file name (then drop directive)
-            if mo.group(1): # We have a file name
-                imFname = mo.group(1)
-                # Drop extensions on import and target to compare base names only
-                if "__" in imFname: imFname = imFname.split("__", maxsplit=1)[1]
-                imFname = os.path.splitext(imFname)[0]
-                sbName = os.path.splitext(os.path.basename(CD["sourceFilePath"]))[0]
-                if imFname == sbName or imFname == "all" or (imFname == "newspost" and \
-                    os.path.split(os.path.dirname(CD["sourceFilePath"]))[1] == "news"):
-                        importPath = os.path.join(CD["siteDir"],"config/import/"+mo.group(1))
-                        if not os.access(importPath, os.F_OK):
-                            _say_error( "Error: File '{}' not found for import.\n"
-                                        "       Quit.".format(mo.group(1)))
-                        with open(importPath) as f: fT = f.read()
-                        mc = re.match(r"(?m)(^#.*?$\n*)+", fT) # Ignore comments at top
-                        if mc: fT = fT[mc.end():]
-                        if "@import:" in fT:
-                            fT = _import_files(fT) # Recurse
-            pT = pT[:mo.start()]+fT+pT[mo.end():] # Insert, dropping directive
-        return pT
+        if "@import: " not in pT: return pT
+        importDir = os.path.join(CD["siteDir"], "config/import")
+        if importFiles is None or importFiles.importDir != importDir: _refresh_import_files()
+        basesS, importsD = importFiles.for_page(CD["sourceFilePath"])
+        chainL = [] # Names of the files being imported, outermost first
+        
+        def _insert(mo):
+            """ Returns the text of the import directive match, dropped if not for the page """
+            imName = mo.group(1)
+            # Empty or non-matching file name, drop directive
+            if not imName or ImportFiles.base_name(imName) not in basesS: return ""
+            if imName in chainL:
+                _say_error( "Error: Import file '{}' imports itself:\n"
+                            "       {}\n"
+                            "       Quit.".format(imName, " > ".join(chainL + [imName])))
+            fT = importsD.get(imName)
+            if fT is None: # Not a file of the folder itself
+                importPath = os.path.join(importDir, imName)
+                if not os.access(importPath, os.F_OK):
+                    _say_error( "Error: File '{}' not found for import.\n"
+                                "       Quit.".format(imName))
+                fT = ImportFiles.read(importPath)
+            if importsL is not None: importsL.append(imName)
+            if "@import: " in fT:
+                chainL.append(imName)
+                fT = ImportFiles.directiveRE.sub(_insert, fT)
+                chainL.pop()
+            return fT
+        
+        return ImportFiles.directiveRE.sub(_insert, pT)
+    
+    def _refresh_import_files():
+        """
+        Loads the import files cache of the website, or reads again the files
+        changed since it was loaded. Called once per build, and per page 
+        rendered by the preview server
+        
+        """
+        nonlocal importFiles
+        importDir = os.path.join(CD["siteDir"], "config/import")
+        if importFiles is None or importFiles.importDir != importDir:
+            importFiles = ImportFiles(importDir)
+        else:
+            importFiles.refresh()
     
     def _validate_correct_CD():
         """
@@ -645,103 +2661,37 @@ def Quicknr():
         # Leave out server values
         if CD["FTP_DEBUG"] not in ["0","1","2"]: _ve("FTP_DEBUG")
         if CD["FTP_PASSIVE"] not in ["YES","NO"]: _ve("FTP_PASSIVE")
+        if not re.match(r"[1-9]\d*\Z", CD["FTP_CONNECTIONS"]): _ve("FTP_CONNECTIONS")
         if CD["ALWAYS_XHTML_TAGS"] not in ["YES","NO"]: _ve("ALWAYS_XHTML_TAGS")
+        if not re.match(r"\d+\Z", CD["BUILD_CACHE_SIZE"]): _ve("BUILD_CACHE_SIZE")
+        if CD["CHANGE_DETECTION"] not in ["STAT","GIT"]: _ve("CHANGE_DETECTION")
+        if CD["PRECOMPRESS"] not in ["YES","NO"]: _ve("PRECOMPRESS")
         if CD["FILE_SIZE_LIMIT"] not in [True, False]: _ve("FILE_SIZE_LIMIT")
     
     def _get_site_config(CD):
         """
         Reads config.txt file from the website config folder, updating settings dict
         
+        The settings are also kept typed and read-only, in the SiteConfig object 
+        of the "siteConfig" key
+        
         """
         
         prevCWD = os.getcwd()
         os.chdir(CD["siteDir"]) # Change CWD to website
         
         with open("config/config.txt", "r") as f: cT = f.read()
-        rS = r"(?:\s|['\"])*$\n(^(?:.|\n)*?)['\"]{3}"
-        rP = r"\s*['\"]?(.*?)['\"]?\s*?\n"
-        if re.search(r"(?m)^HTML_HEAD:",cT):
-            CD["HTML_HEAD"] = re.search(r"(?m)^HTML_HEAD:"+rS,cT).group(1)
-        if re.search(r"(?m)^HTML_TAIL:",cT):
-            CD["HTML_TAIL"] = re.search(r"(?m)^HTML_TAIL:"+rS,cT).group(1)
-        if re.search(r"(?m)^HTML_TITLE:",cT):
-            CD["HTML_TITLE"] = re.search(r"(?m)^HTML_TITLE:"+rP,cT).group(1)
-        if re.search(r"(?m)^HTML_TITLE_SEPARATOR:",cT):
-            CD["HTML_TITLE_SEPARATOR"] = re.search(r"(?m)^HTML_TITLE_SEPARATOR:"+rP,cT).group(1)
-            CD["HTML_TITLE_SEPARATOR"] = _html_escape_noamp(CD["HTML_TITLE_SEPARATOR"])
-        if re.search(r"(?m)^HTML_WEBSITE_NAME:",cT):
-            CD["HTML_WEBSITE_NAME"] = re.search(r"(?m)^HTML_WEBSITE_NAME:"+rP,cT).group(1)
-            CD["HTML_WEBSITE_NAME"] = _html_escape_noamp(CD["HTML_WEBSITE_NAME"], quote=False)
-        if re.search(r"(?m)^HTML_PAGE_TITLE:",cT): # Will be escaped
-            CD["HTML_PAGE_TITLE"] = re.search(r"(?m)^HTML_PAGE_TITLE:"+rP,cT).group(1)
-        if re.search(r"(?m)^PAGE_FILE_EXTENSION:",cT):
-            CD["PAGE_FILE_EXTENSION"] = re.search(r"(?m)^PAGE_FILE_EXTENSION:"+rP,cT).group(1)
-        if re.search(r"(?m)^QLM_OR_MARKDOWN:",cT):
-            CD["QLM_OR_MARKDOWN"] = re.search(r"(?m)^QLM_OR_MARKDOWN:"+rP,cT).group(1)
-        if re.search(r"(?m)^MARKDOWN_TITLING:",cT):
-            CD["MARKDOWN_TITLING"] = re.search(r"(?m)^MARKDOWN_TITLING:"+rP,cT).group(1)
-        if re.search(r"(?m)^HTML_TAG_ID:",cT):
-            CD["HTML_TAG_ID"] = re.search(r"(?m)^HTML_TAG_ID:"+rP,cT).group(1)
-        if re.search(r"(?m)^NEWS_LIST_ITEMS:",cT):
-            CD["NEWS_LIST_ITEMS"] = re.search(r"(?m)^NEWS_LIST_ITEMS:"+rP,cT).group(1)
-        if re.search(r"(?m)^NEWS_LIST_TITLE:",cT):
-            CD["NEWS_LIST_TITLE"] = re.search(r"(?m)^NEWS_LIST_TITLE:"+rP,cT).group(1)
-        if re.search(r"(?m)^NEWS_BLURB_LENGTH:",cT):
-            CD["NEWS_BLURB_LENGTH"] = re.search(r"(?m)^NEWS_BLURB_LENGTH:"+rP,cT).group(1)
-        if re.search(r"(?m)^NEWS_MORE_PHRASE:",cT):
-            CD["NEWS_MORE_PHRASE"] = re.search(r"(?m)^NEWS_MORE_PHRASE:"+rP,cT).group(1)
-        if re.search(r"(?m)^NEWS_LIST_LINK:",cT):
-            CD["NEWS_LIST_LINK"] = re.search(r"(?m)^NEWS_LIST_LINK:"+rP,cT).group(1)
-        if re.search(r"(?m)^NEWS_LIST_LINK_POSITION:",cT):
-            CD["NEWS_LIST_LINK_POSITION"] = re.search(r"(?m)^NEWS_LIST_LINK_POSITION:"+rP,cT).group(1)
-        if re.search(r"(?m)^NEWS_LIST_LINK_PREFIX:",cT):
-            CD["NEWS_LIST_LINK_PREFIX"] = re.search(r"(?m)^NEWS_LIST_LINK_PREFIX:"+rP,cT).group(1)
-        if re.search(r"(?m)^NEWS_DATE_FORMAT:",cT):
-            CD["NEWS_DATE_FORMAT"] = re.search(r"(?m)^NEWS_DATE_FORMAT:"+rP,cT).group(1)
-        if re.search(r"(?m)^NEWS_DATE_FROM_FILENAME:",cT):
-            CD["NEWS_DATE_FROM_FILENAME"] = re.search(r"(?m)^NEWS_DATE_FROM_FILENAME:"+rP,cT).group(1)
-        if re.search(r"(?m)^NEWS_PREV_LINK:",cT):
-            CD["NEWS_PREV_LINK"] = re.search(r"(?m)^NEWS_PREV_LINK:"+rP,cT).group(1)
-        if re.search(r"(?m)^NEWS_NEXT_LINK:",cT):
-            CD["NEWS_NEXT_LINK"] = re.search(r"(?m)^NEWS_NEXT_LINK:"+rP,cT).group(1)
-        if re.search(r"(?m)^NEWS_LIST_THUMBS:",cT):
-            CD["NEWS_LIST_THUMBS"] = re.search(r"(?m)^NEWS_LIST_THUMBS:"+rP,cT).group(1)
-        if re.search(r"(?m)^NEWS_LIST_THUMB_SIZE:",cT):
-            CD["NEWS_LIST_THUMB_SIZE"] = re.search(r"(?m)^NEWS_LIST_THUMB_SIZE:"+rP,cT).group(1)
-        if re.search(r"(?m)^NEWS_LIST_THUMB_SQUARE:",cT):
-            CD["NEWS_LIST_THUMB_SQUARE"] = re.search(r"(?m)^NEWS_LIST_THUMB_SQUARE:"+rP,cT).group(1)
-        if re.search(r"(?m)^JAVASCRIPT_LINK_SPAN:",cT):
-            CD["JAVASCRIPT_LINK_SPAN"] = re.search(r"(?m)^JAVASCRIPT_LINK_SPAN:"+rP,cT).group(1)
-        if re.search(r"(?m)^JAVASCRIPT_LINK_PRE:",cT):
-            CD["JAVASCRIPT_LINK_PRE"] = re.search(r"(?m)^JAVASCRIPT_LINK_PRE:"+rP,cT).group(1)
-        if re.search(r"(?m)^JAVASCRIPT_LINK_POST:",cT):
-            CD["JAVASCRIPT_LINK_POST"] = re.search(r"(?m)^JAVASCRIPT_LINK_POST:"+rP,cT).group(1)
-        if re.search(r"(?m)^META_EDIT:",cT):
-            CD["META_EDIT"] = re.search(r"(?m)^META_EDIT:"+rP,cT).group(1)
-        if re.search(r"(?m)^META_DESCRIPTION:",cT):
-            CD["META_DESCRIPTION"] = re.search(r"(?m)^META_DESCRIPTION:"+rP,cT).group(1)
-        if re.search(r"(?m)^META_BASE_URL:",cT):
-            CD["META_BASE_URL"] = re.search(r"(?m)^META_BASE_URL:"+rP,cT).group(1)
-        if re.search(r"(?m)^DEBUG_ERRORS:",cT):
-            CD["DEBUG_ERRORS"] = re.search(r"(?m)^DEBUG_ERRORS:"+rP,cT).group(1)
-        if re.search(r"(?m)^FTP_SERVER:",cT):
-            CD["FTP_SERVER"] = re.search(r"(?m)^FTP_SERVER:"+rP,cT).group(1)
-        if re.search(r"(?m)^FTP_PATH:",cT):
-            CD["FTP_PATH"] = re.search(r"(?m)^FTP_PATH:"+rP,cT).group(1)
-        if re.search(r"(?m)^FTP_USERNAME:",cT):
-            CD["FTP_USERNAME"] = re.search(r"(?m)^FTP_USERNAME:"+rP,cT).group(1)
-        if re.search(r"(?m)^FTP_PASSWORD:",cT):
-            CD["FTP_PASSWORD"] = re.search(r"(?m)^FTP_PASSWORD:"+rP,cT).group(1)
-        if re.search(r"(?m)^FTP_ACCT:",cT):
-            CD["FTP_ACCT"] = re.search(r"(?m)^FTP_ACCT:"+rP,cT).group(1)
-        if re.search(r"(?m)^FTP_DEBUG:",cT):
-            CD["FTP_DEBUG"] = re.search(r"(?m)^FTP_DEBUG:"+rP,cT).group(1)
-        if re.search(r"(?m)^FTP_PASSIVE:",cT):
-            CD["FTP_PASSIVE"] = re.search(r"(?m)^FTP_PASSIVE:"+rP,cT).group(1)
-        if re.search(r"(?m)^ALWAYS_XHTML_TAGS:",cT):
-            CD["ALWAYS_XHTML_TAGS"] = re.search(r"(?m)^ALWAYS_XHTML_TAGS:"+rP,cT).group(1)
+        settings = SiteConfig.parse(cT)
+        if "HTML_TITLE_SEPARATOR" in settings:
+            settings["HTML_TITLE_SEPARATOR"] = _html_escape_noamp(settings["HTML_TITLE_SEPARATOR"])
+        if "HTML_WEBSITE_NAME" in settings:
+            settings["HTML_WEBSITE_NAME"] = _html_escape_noamp(settings["HTML_WEBSITE_NAME"], 
+                                                                                    quote=False)
+        CD.update(settings) # HTML_PAGE_TITLE will be escaped
         os.chdir(prevCWD)
         _validate_correct_CD()
+        # Typed settings, validated and corrected by now
+        CD["siteConfig"] = SiteConfig(CD)
         return CD
     
     def _get_pages_folders(siteDir):
@@ -770,7 +2720,7 @@ def Quicknr():
             htmlDirs.append(os.path.join(htmlDirs[0], "news"))
         return [sourcesDirs, htmlDirs]
         
-    def _get_pages_files(sourcesDirs, htmlDirs, qnrDT):
+    def _get_pages_files(sourcesDirs, htmlDirs, qnrRS, refreshD=None):
         """
         Returns a list of lists:
             sL - List of source files, relative to sources dir, no file extension
@@ -779,65 +2729,129 @@ def Quicknr():
             sLxC - Full source paths that have a counterpart and differ from record
             hL - List of HTML files, relative to html dir, no file extension
         
+        Sources are only hashed if their size or stat data differ from record,
+        in a pool of threads. If refreshD is a dict, it is filled with relative
+        paths of sources that were hashed and found unchanged, and 2-item lists
+        of their current hash and stat data, for _refresh_records()
+        
+        With CHANGE_DETECTION set to GIT, only sources reported by Git as 
+        changed since the last scan are checked against the record
+        
         """
-        def _source_changed(sourcePath, qnrDT, qnrDTL):
-            """
-            Returns true if the source doc does not match record in data file
-            
-            """
-            # Need the relative path, with extension
-            rfP = os.path.relpath(sourcePath, CD["siteDir"])
-            if rfP not in qnrDT:
-                # Source not in record, but has HTML counterpart, report as changed
-                return True
-            sF, hF = _file_size_and_hash(rfP)
-            for x in qnrDTL:
-                xL = x.split("\t")
-                if xL[0] == rfP and (xL[2] != sF or xL[3] != hF):
-                    return True
-            return False
-            
         sL = []; sLx = []; sLxN = []; sLxC = []; hL = []
-        qnrDTL = qnrDT.splitlines()[1:] # Prepare for _source_changed()
+        gitChangedS = None
+        if CD["CHANGE_DETECTION"] == "GIT":
+            gitChangedS = _get_git_changed_files(sourcesDirs)
+        statD = {} # Stat results of sources
         for sDir in sourcesDirs:
-            for f in os.listdir(sDir):
+            for f in siteSnap.files(os.path.relpath(sDir, CD["siteDir"])):
                 if os.path.splitext(f)[1] in [".txt", ".mdml", ".html", ".php", ".htm"]:
                     fP = os.path.join(sDir, f)
-                    if CD["FILE_SIZE_LIMIT"] and os.path.getsize(fP) > 1100000:
+                    st = siteSnap.stat(os.path.relpath(fP, CD["siteDir"]))
+                    if CD["FILE_SIZE_LIMIT"] and st.st_size > 1100000:
                         _say_error( "Error: Source file '"+f+"' is over 1MB in size," + \
                                     " too large for publication.\n" + \
                                     "       Reduce the size to under 1MB and try again.\n"+\
                                     "       Quit.")
                     sLx.append(fP)
                     sL.append(os.path.splitext(os.path.relpath(fP, sourcesDirs[0]))[0])
+                    statD[fP] = st
         for hDir in htmlDirs:
-            for f in os.listdir(hDir):
+            for f in siteSnap.files(os.path.relpath(hDir, CD["siteDir"])):
                 if os.path.splitext(f)[1] in [".html", ".php", ".htm"]:
                     fP = os.path.join(hDir, f)
-                    if CD["FILE_SIZE_LIMIT"] and os.path.getsize(fP) > 1100000:
+                    if CD["FILE_SIZE_LIMIT"] and \
+                                siteSnap.stat(os.path.relpath(fP, CD["siteDir"])).st_size > 1100000:
                         _say_error( "Error: HTML file '"+f+"' is over 1MB in size," + \
                                     " too large for publication.\n" + \
                                     "       Reduce the size to under 1MB and try again.\n"+\
                                     "       Quit.")
                     hL.append(os.path.splitext(os.path.relpath(fP, htmlDirs[0]))[0])
-        if not hL and sLx:
-            sLxN = sLx[:]
-        elif sL:
-            for i, x in enumerate(sL):
-                if x not in hL:
-                    sLxN.append(sLx[i])
-                elif _source_changed(sLx[i], qnrDT, qnrDTL):
-                    sLxC.append(sLx[i])
+        hS = set(hL)
+        toHashL = [] # 3-item lists of full and relative path, and record
+        for i, x in enumerate(sL):
+            if x not in hS:
+                sLxN.append(sLx[i])
+                continue
+            rfP = os.path.relpath(sLx[i], CD["siteDir"])
+            rec = qnrRS.get(rfP)
+            if not rec or not rec.hash:
+                # Source not in record, but has HTML counterpart, report as changed
+                sLxC.append(sLx[i])
+            elif gitChangedS is not None and rfP not in gitChangedS and rec.size != "0":
+                continue # Unchanged according to Git, and not marked as changed
+            elif rec.size != str(statD[sLx[i]].st_size) or \
+                                            rec.stat != _stat_data(statD[sLx[i]]):
+                toHashL.append([sLx[i], rfP, rec])
+        # Hash the files whose size or stat data changed, MD5 if recorded so
+        def _hash(item):
+            return _file_size_and_hash(item[1], legacy=len(item[2].hash) == 32)
+        if len(toHashL) > 1:
+            with ThreadPoolExecutor(min(32, (os.cpu_count() or 1) + 4)) as ex:
+                hashedL = list(ex.map(_hash, toHashL))
+        else:
+            hashedL = [_hash(x) for x in toHashL]
+        for (fP, rfP, rec), (sF, hF, tF) in zip(toHashL, hashedL):
+            if rec.size != sF or rec.hash != hF:
+                sLxC.append(fP)
+            elif refreshD is not None: # Unchanged, but stat data (or hash type) is not
+                if len(hF) == 32: hF = _file_size_and_hash(rfP)[1]
+                refreshD[rfP] = [hF, tF]
         sL.sort(); sLx.sort(); sLxN.sort(); sLxC.sort(); hL.sort()
         return [sL, sLx, sLxN, sLxC, hL]
     
+    def _refresh_records(qnrRS, refreshD):
+        """
+        Updates the hash and stat data of source records in the record store 
+        from refreshD, see _get_pages_files()
+        
+        """
+        for x in refreshD:
+            if x in qnrRS: qnrRS.update(x, hash=refreshD[x][0], stat=refreshD[x][1])
+    
+    def _get_git_changed_files(sourcesDirs):
+        """
+        Returns set of paths, relative to website folder, of the files in the 
+        sources folder that Git reports as changed since the commit recorded 
+        at the last scan, or untracked. Returns None if there is no recorded 
+        commit or Git cannot tell, so that all sources are checked
+        
+        """
+        headPath = os.path.join(CD["siteDir"], "quicknr_private/quicknr_git_head.txt")
+        if not os.path.exists(headPath): return None
+        with open(headPath, mode="r") as f: head = f.read().strip()
+        if not head: return None
+        try:
+            gT = subprocess.run(["git", "diff", "--name-only", "--relative", head], 
+                        cwd=sourcesDirs[0], capture_output=True, text=True, check=True).stdout
+            gT += subprocess.run(["git", "ls-files", "--others", "--exclude-standard"], 
+                        cwd=sourcesDirs[0], capture_output=True, text=True, check=True).stdout
+        except (OSError, subprocess.CalledProcessError):
+            return None
+        return {os.path.relpath(os.path.join(sourcesDirs[0], x), CD["siteDir"]) \
+                                                    for x in gT.splitlines() if x}
+    
+    def _record_git_head(sourcesDirs):
+        """
+        Records the current Git commit of the sources folder, for the next scan
+        to start from, see _get_git_changed_files()
+        
+        """
+        headPath = os.path.join(CD["siteDir"], "quicknr_private/quicknr_git_head.txt")
+        try:
+            head = subprocess.run(["git", "rev-parse", "HEAD"], cwd=sourcesDirs[0], 
+                                    capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            head = "" # Not a Git work tree, or no commits yet
+        with open(headPath, mode="w") as f: f.write(head + "\n")
+    
     def _save_image_thumbnail(filePath):
         """
         Resizes the image file to thumbnail, assumes img module available
         Returns thumb file path
         
         """
-        size = int(CD["NEWS_LIST_THUMB_SIZE"]), int(CD["NEWS_LIST_THUMB_SIZE"])
+        size = CD["siteConfig"].NEWS_LIST_THUMB_SIZE, CD["siteConfig"].NEWS_LIST_THUMB_SIZE
         if not os.path.exists(filePath):
             _say_error( "Error: File '{}' not found.\n"
                         "       Thumbnail could not be created. Check your image links.\n"
@@ -882,83 +2896,27 @@ def Quicknr():
         """
         Converts inline text styling, bold, italic, monospaced (<code>)
         
-        We use <span> for a sense of CSS 'neutrality', and easier 
-        processing with regex
-        
         """
-        tT = re.sub(r"(?<!\w)[*_`]{3}([^ ].*?)[*_`]{3}(?!\w)", 
-            r'<span style="font-weight:bold;font-style:italic"><code>\1</code></span>', tT)
-        # Order matters here, catch double ** and __ as bold & italic, `` as italic
-        tT = re.sub(r"(?<!\w)[*_]{2}([^ ].*?)[*_]{2}(?!\w)", 
-            r'<span style="font-weight:bold;font-style:italic">\1</span>', tT)
-        tT = re.sub(r"(?<!\w)[_`]{2}([^ ].*?)[_`]{2}(?!\w)", 
-            r'<span style="font-style:italic"><code>\1</code></span>', tT)
-        tT = re.sub(r"(?<!\w)[*`]{2}([^ ].*?)[*`]{2}(?!\w)", 
-            r'<span style="font-weight:bold"><code>\1</code></span>', tT)
-        tT = re.sub(r"(?<!\w)\*([^ ].*?)\*(?!\w)", r'<span style="font-weight:bold">\1</span>', tT)
-        tT = re.sub(r"(?<!\w)_([^ ].*?)_(?!\w)", r'<span style="font-style:italic">\1</span>', tT)
-        tT = re.sub(r"(?<!\w)`([^ ].*?)`(?!\w)", r"<code>\1</code>", tT)
-        return tT
+        return QLMRenderer.style_text(tT)
         
     def _delete_inline_styling(tT):
         """
         Deletes styling markup from text
         
         """
-        tT = re.sub(r"(?<!\w)[*_`]+([^ ].*?)[*_`]+(?!\w)", r"\1", tT)
-        return tT
-    
-    def _process_inline_markup(rT):
-        """
-        Converts inline markup to HTML and returns the text
-        
-        """
-        # --------------------- Links
-        if re.search(r"\[.+?\]", rT):
-            
-            # Javascript links as <span>
-            if CD["JAVASCRIPT_LINK_SPAN"] == "YES":                
-                x = '<span class="js_call" onclick="'+CD["JAVASCRIPT_LINK_PRE"]
-                x += '\\2'+CD["JAVASCRIPT_LINK_POST"]+'">\\1</span>'
-                rT = re.sub(r"\[(.+?)[ ]+([A-Za-z0-9_\-'\.;]+\([A-Za-z0-9_\-'\.;]*\))\]", x, rT)
-                
-                x = '<span class="js_call" onclick="'+CD["JAVASCRIPT_LINK_PRE"]
-                x += '\\1'+CD["JAVASCRIPT_LINK_POST"]+'"></span>'
-                rT = re.sub(r"\[([A-Za-z0-9_\-'\.;]+\([A-Za-z0-9_\-'\.;]*\))\]", x, rT)
-                
-            # Regular links as <a>
-            rT = re.sub(r"\[(.+?)[ ]+(\S+?)\]", r'<a href="\2">\1</a>', rT)
-            rT = re.sub(r"\[(\S+?)\]", r'<a href="\1">\1</a>', rT)
-        
-        # --------------------- Bold, italic and monospace in linked text
-        def _inline_style_links(mo):
-            """ Returns inline styled matches """
-            return mo.group(1) + _bold_italic_mono(mo.group(2)) + mo.group(3)
-        rT = re.sub(r"(>)([^<]+?)(</a>)", _inline_style_links, rT)
-
-        # Delete styling in alt attributes, styling not valid here
-        def _delete_inline_styling_call(mo):
-            """ Deletes styling markup from matches """
-            tT = _delete_inline_styling(mo.group(2))
-            return mo.group(1) + tT + mo.group(3)
-        rT = re.sub(r"( alt=\")([^\"]+)(\")", _delete_inline_styling_call, rT)
-        
-        # Correct http/www.
-        rT = re.sub(r"(href|src)=\"www\.", r'\1="http://www.', rT)
-        
-        # --------------------- Styling outside links
-        rT = _bold_italic_mono(rT)
-        return rT
+        return QLMRenderer.unstyle(tT)
         
 
-    def _plaintext_to_html(text, fX, relfPath):
+    def _plaintext_to_html(text, fX, relfPath, placeholders, blockCache=None):
         """
         Converts QLM (or Markdown if configured) plain text to HTML and returns it
         
+        Contents of code blocks are protected in the placeholders registry of
+        the file, to be put back into the finished HTML. The HTML of QLM 
+        blocks is taken from and kept in blockCache, if given
+        
         """
         nonlocal CD
-        nonlocal preContentL
-        #nonlocal jsLinkContentL
         
         if markdownModule and (fX == ".mdml" or CD["QLM_OR_MARKDOWN"] == "MARKDOWN"):
             # A compromise attempt at titling a Markdown page: first para up to 80 chars
@@ -971,343 +2929,13 @@ def Quicknr():
             return None
         
         # --------------------- Convert text with Quicknr Light Markup
-        
-        title = ""
-        titleAppear = True
-        blocks = [] # List of 2-item lists of block & type ("title", "heading", "section")
-        
-        def _delete_leading_spaces(mo):
-            """
-            Deletes leading spaces in match object
-            
-            """
-            return re.sub(r"\n[ ]+", r"\n", mo.group())
-        
-        def _link_type(sT):
-            """
-            Return link type of text: link, image, YTvideo
-            
-            """
-            if "youtube.com" in sT.lower() or "youtu.be" in sT.lower(): return "YTvideo"
-            for x in [".jpg",".png",".gif",".svg"]:
-                if sT.lower().endswith(x) or sT.split("Quicknr?=IL=?Quicknr")[0].lower().endswith(x):
-                    return "image"
-            return "link"
-        
-        # --------------------- Text cleaning
-        # Convert tabs to 4 spaces
-        nT = text.replace("\t", "    ")
-        # Quit if double quotes in URLs
-        if re.search(r'\[(?:[^\[\]\n]+[ ])?[^ "\[\]\n]*?"[^ \[\]\n]*?\]', nT):
-            _say_error( "Error: File '"+relfPath+"' contains\n"
-                        "       an invalid URL. Correct and try again.\n"
-                        "       Quit.")
-        # Add line breaks at start/end (for sections)
-        nT = "\n\n"+nT+"\n\n"
-        # Convert any <> around URLs to [] ??
-        #nT = re.sub(r"<[ ]*((?:\S+?\.)+\S+?)[ ]*>", r"[\1]", nT)
-        # Escape HTML characters
-        nT = _html_escape_noamp(nT, quote=False)
-        # Revert &amp; back to & in links
-        #nT = re.sub(r"(\[[^\]\n]*?[^ \]\n]+?)&amp;([^ \]\n]+\])", r"\1&\2", nT)
-        # Protect code blocks, into their list
-        for x in nT.strip().split("\n\n"):
-            if re.match(r"(?i)code(?:-\w+)?:\s[ ]*\S",x):
-                x = re.sub(r"\A\S[^:\n]*:\s?", "", x)
-                preContentL.append(x)
-        if preContentL:
-            nT = re.sub(r"(?mi)(^code(?:-\w+)?:\s)(.+\n)+(?=\n)", r"\1Quicknr?=preText=?Quicknr\n", nT)
-        # Protect Javascript link function arguments, into their list
-        #for x in nT.strip().split("\n\n"):
-            #for y in re.finditer(r"\[[^\[\]\n]+\(([^\n]*?)\);?\]",x):
-                #jsLinkContentL.append(y.group(1))
-        #if jsLinkContentL:
-            #nT = re.sub(r"(?m)(\[[^\[\]\n]+\()[^\n]*?(\);?\])", r"\1Quicknr?=jsLinkArgs=?Quicknr\2", nT)
-        # Delete trailing spaces (not line breaks)
-        nT = re.sub(r"(?m)[ ]+$", "", nT)
-        # Delete spaces within [] boundaries
-        nT = re.sub(r"(\[)[ ]+", r"\1", nT)
-        nT = re.sub(r"[ ]+(\])", r"\1", nT)
-        # Delete single or double quotes surrounding link in []
-        nT = re.sub(r"(\[)([^\]]+[ ])?([\"'])([^ \]]+)\3(\])", r"\1\2\4\5", nT)
-        # Delete any duplicate brackets
-        nT = re.sub(r"(\[|\])\1+", "\1", nT)
-        # Unify image link pointing to link
-        nT = re.sub(r"(\.jpg|\.png|\.gif|\.svg)\]\[", r"\1Quicknr?=IL=?Quicknr", nT)
-        # Delete leading spaces in lists
-        nT = re.sub(r"(?:\n+[ ]*\*[ ].+)(?:\n+[ ]*\*[ ].+)+", 
-                                    _delete_leading_spaces, nT)
-        nT = re.sub(r"(?:\n+[ ]*\d+\.?[ ].+)(?:\n+[ ]*\d+\.?[ ].+)+", 
-                                    _delete_leading_spaces, nT)
-        # Delete duplicate spaces after list prefixes
-        nT = re.sub(r"(?m)^(\*[ ]|\d+\.?[ ])[ ]+", r"\1", nT)
-        # Insert any missing line break before list (corrected next)
-        nT = re.sub(r"((?:\n+[ ]*\*[ ].+)(?:\n+[ ]*\*[ ].+)+)", r"\n\1", nT)
-        nT = re.sub(r"((?:\n+[ ]*\d+\.?[ ].+)(?:\n+[ ]*\d+\.?[ ].+)+)", r"\n\1", nT)
-        # Delete empty lines in lists
-        nT = re.sub(r"(?<=\n)(\*[ ].+\n)\n+(?=\*[ ])", r"\1", nT)
-        nT = re.sub(r"(?<=\n)(\d+\.?[ ].+\n)\n+(?=\d+\.?[ ])", r"\1", nT)
-        # Max two line breaks
-        nT = re.sub(r"(\n\n)\n+", r"\1", nT)
-        
-        # --------------------- Title
-        mo = re.match(r"\n*[ ][ ]+\S.{0,80}\n\n+", nT)
-        if mo:
-            title = mo.group().strip()
-            if title.startswith("[") and title.endswith("]"):
-                titleAppear = False
-                title = title[1:-1]
-        if title:
-            if titleAppear: blocks.append([title, "title"])
-            # Update config
-            CD["HTML_PAGE_TITLE"] = title # Already escaped, and will be again
-            nT = re.sub(r"\A\s*\S.*", "", nT)
-        
-        # --------------------- Headings sections
-        while True:
-            mo = re.search(r"\n\n+([ ][ ]+\S.*)\n\n+", nT) # !No length limit
-            if mo:
-                tS = nT[:mo.start(1)]
-                if tS.strip(): blocks.append([tS, "section"])
-                nT = nT[mo.end(1):]
-                blocks.append([mo.group(1).strip(), "heading"])
-            else:
-                blocks.append([nT, "section"])
-                # nT now consumed and transfered to blocks
-                break
-        
-        # --------------------- Process blocks
-        sCount = 0 # Section/heading counter, 0-indexed for no headings
-        for i, b in enumerate(blocks):
-            if b[1] == "title":
-                blocks[i][0] = '<h1 class="title">%s</h1>' % b[0]
-            if b[1] == "heading":
-                sCount += 1
-                hhh = '<h2 class="heading {} heading_{}">{}</h2>'
-                blocks[i][0] = hhh.format(sCount%2 and "odd" or "even",sCount,b[0]) 
-            if b[1] == "section":
-                # Delete leading spaces in section
-                sT = re.sub(r"(?m)^[ ]+", "", b[0])
-                nS = "" # New section
-                pCount = 0 # Paragraph block counter, 1-indexed within section
-                dCount = 0 # Definition list count
-                cCount = 0 # Code block count
-                iCount = 0 # Image block count
-                fCount = 0 # Image float count
-                vCount = 0 # Video count
-                lCount = 0 # List count
-                for pT in sT.split("\n\n"):
-                    if not pT.strip(): continue
-                    
-                    # --------------------- Link block types: link, image, video
-                    if pT and pT.startswith("[") and pT.endswith("]") and \
-                                    "[" not in pT[1:-1] and "]" not in pT[1:-1]:
-                        linkType = _link_type(pT[1:-1])
-                        # Separate link text and link URL
-                        if " " in pT:
-                            linkText, linkURL = pT[1:-1].rsplit(maxsplit=1)
-                        else:
-                            if linkType != "image" and linkType != "YTvideo":
-                                linkText = pT[1:-1]
-                            else:
-                                linkText = ""
-                            linkURL = pT[1:-1] # May not equal linkText later
-                        if re.search(r'["]', linkURL):
-                            _say_error( "Error: File '"+relfPath+"' contains\n"
-                                        "       an invalid URL. Correct and try again.\n"
-                                        "       Quit.")
-                        # Escape quotes, not done earlier
-                        origLinkText = linkText[:] # Copy to preserve original for comparing
-                        linkText = linkText.replace("'", "&#x27;").replace('"', "&quot;")
-                        # Handle different link block types
-                        if linkType == "link":
-                            pCount += 1
-                            if CD["JAVASCRIPT_LINK_SPAN"] == "YES" and re.match(r"[^():]+\([^()]*\)",linkURL):
-                                if origLinkText == linkURL: linkText = " " # Prevent empty tag
-                                if re.search(r"[^A-Za-z0-9_\-'\.;()]", linkURL):
-                                    _say_error( "Error: File '"+relfPath+"' contains an invalid\n"
-                                                "       Javascript function call. Correct and try again.\n"
-                                                "       Quit.")
-                                linkURL = CD["JAVASCRIPT_LINK_PRE"] + linkURL + CD["JAVASCRIPT_LINK_POST"]
-                                pT = '<p class="p_{} link_p {} section_{}"><span class="js_call" onclick="{}">{}</span></p>'
-                                pT = pT.format(pCount,pCount%2 and "odd" or "even",sCount,linkURL,linkText)
-                            else:
-                                pT = '<p class="p_{} link_p {} section_{}"><a href="{}">{}</a></p>'
-                                pT = pT.format(pCount,pCount%2 and "odd" or "even",sCount,linkURL,linkText)
-                        elif linkType == "image":
-                            clickLinkURL = "" # Handle images as links
-                            if "Quicknr?=IL=?Quicknr" in linkURL:
-                                linkURL, clickLinkURL = linkURL.split("Quicknr?=IL=?Quicknr", maxsplit=1)
-                                if "Quicknr?=IL=?Quicknr" in clickLinkURL:
-                                    _say_error( "Error: File '"+relfPath+"' contains one or more\n"
-                                                "       image link sequences of more than two [] parts.\n"
-                                                "       Correct and try again.\n"
-                                                "       Quit.")
-                            iCount += 1
-                            pT = '<div class="imgblock imgblock_{} {} section_{}">\n'
-                            if clickLinkURL:
-                                if CD["JAVASCRIPT_LINK_SPAN"] == "YES" and re.match(r"[^():]+\([^()]*\)",clickLinkURL):
-                                    if re.search(r"[^A-Za-z0-9_\-'\.;()]", clickLinkURL):
-                                        _say_error( "Error: File '"+relfPath+"' contains an invalid\n"
-                                                    "       Javascript function call. Correct and try again.\n"
-                                                    "       Quit.")
-                                    clickLinkURL = CD["JAVASCRIPT_LINK_PRE"] + clickLinkURL + CD["JAVASCRIPT_LINK_POST"]
-                                    pT = '<div class="imgblock link_img imgblock_{} {} section_{}">\n<span class="js_call"'
-                                    pT += ' onclick="{}">\n'
-                                else:
-                                    pT = '<div class="imgblock link_img imgblock_{} {} section_{}">\n<a href="{}">\n'
-                            pT += '<img src="{}" alt="{}" />\n'
-                            if clickLinkURL:
-                                pT = pT.format(iCount,iCount%2 and "odd" or "even",
-                                                sCount,clickLinkURL,linkURL,linkText)
-                            else:
-                                pT = pT.format(iCount,iCount%2 and "odd" or "even",
-                                                sCount,linkURL,linkText)
-                            if clickLinkURL:
-                                if '<span class="js_call"' in pT:
-                                    pT += '</span>\n'
-                                else:
-                                    pT += '</a>\n'
-                            if linkText: pT += '<p class="imgcaption">{}</p>\n'.format(linkText)
-                            pT += '</div>'
-                        elif linkType == "YTvideo":
-                            vCount += 1
-                            # Need the space between <iframe> tags for xml formatter
-                            pT = '<div class="ytvideo vidblock_{} {} section_{}">\n<iframe src="{}" '
-                            pT += 'frameborder="0" allowfullscreen="allowfullscreen"> </iframe>\n'
-                            pT = pT.format(vCount,vCount%2 and "odd" or "even",sCount,linkURL)
-                            pT += '</div>'
-                    
-                    # --------------------- Import and Python directives
-                    elif re.match(r"(?m)(?:@python:|@import:)[ ]+['\"][^'\"]+['\"][ ]*$", pT):
-                        pass # Don't convert directives to HTML
-                    
-                    # --------------------- Lists
-                    elif len(re.findall(r"(?m)^\*[ ]", pT)) > 1: # Unordered list
-                        lCount += 1
-                        liCount = 0 # List item count
-                        npT1 = ""
-                        for x in re.findall(r"(?m)^\*[ ]+(.+)$", pT):
-                            liCount += 1
-                            npT = '<li class="li_{} {}">{}</li>\n'
-                            npT1 += npT.format(liCount, liCount%2 and "odd" or "even", x)
-                        pT = '<ul class="list_{} {} section_{}">\n{}</ul>'
-                        pT = pT.format(lCount, lCount%2 and "odd" or "even", sCount, npT1)
-                    elif len(re.findall(r"(?m)^\d+\.?[ ]", pT)) > 1: # Ordered list
-                        lCount += 1
-                        liCount = 0
-                        npT1 = ""
-                        for x in re.findall(r"(?m)^\d+\.?[ ]+(.+)$", pT):
-                            liCount += 1
-                            npT = '<li class="li_{} {}">{}</li>\n'
-                            npT1 += npT.format(liCount, liCount%2 and "odd" or "even", x)
-                        pT = '<ol class="list_{} {} section_{}">\n{}</ol>'
-                        pT = pT.format(lCount, lCount%2 and "odd" or "even", sCount, npT1)
-                    
-                    # --------------------- Code block (must come before the next test)
-                    elif "Quicknr?=preText=?Quicknr" in pT and pT.lower().startswith("code"):
-                        cCount += 1
-                        pT1 = pT.split(":", 1)[0]
-                        npT = '<div class="{} codeblock codeblock_{} {} section_{}">\n{}\n</div>'
-                        pT = '<pre class="code">Quicknr?=preText=?Quicknr</pre>'
-                        dClass = pT1.lower()
-                        if dClass != "code": dClass = "code "+dClass
-                        pT = npT.format(dClass,cCount,cCount%2 and "odd" or "even",sCount,pT)
-                    
-                    # --------------------- Note: etc. definition
-                    elif re.match(r"(?:\w+:\s*\S)|(?:\S[^:\n]*:\n[ ]*\S)",pT):
-                        dCount += 1
-                        pT1 = pT.split(":", 1)[0]; pT = re.sub(r"\A\S[^:\n]*:\s?", "", pT)
-                        npT = '<dl class="{} dlblock dlblock_{} {} section_{}">\n'
-                        npT += '<dt>{}</dt>\n<dd>{}</dd>\n</dl>'
-                        dClass = pT1.lower()
-                        if " " in dClass: dClass = "definition"
-                        pT = npT.format(dClass,dCount,dCount%2 and "odd" or "even",sCount,pT1,pT)
-                    
-                    # --------------------- Image float before paragraph
-                    elif re.match(r"\[.+?(?:\.jpg|\.png|\.gif|\.svg)(?:Quicknr\?=IL=\?Quicknr[^\]]+)?\][ ]*\S.+",pT):
-                        linkURL, ppT = pT[1:].split("]", maxsplit=1)
-                        ppT = ppT.strip()
-                        # Image part of paragraph
-                        if " " in linkURL:
-                            linkText, linkURL = linkURL.rsplit(maxsplit=1)
-                            linkText = linkText.replace("'", "&#x27;").replace('"', "&quot;")
-                        else:
-                            linkText = ""
-                        if re.search(r'["]', linkURL):
-                            _say_error( "Error: File '"+relfPath+"' contains\n"
-                                        "       an invalid URL. Correct and try again.\n"
-                                        "       Quit.")
-                        clickLinkURL = "" # Handle images as links
-                        if "Quicknr?=IL=?Quicknr" in linkURL:
-                            linkURL, clickLinkURL = linkURL.split("Quicknr?=IL=?Quicknr", maxsplit=1)
-                            if "Quicknr?=IL=?Quicknr" in clickLinkURL:
-                                _say_error( "Error: File '"+relfPath+"' contains one or more\n"
-                                            "       image link sequences of more than two [] parts.\n"
-                                            "       Correct and try again.\n"
-                                            "       Quit.")
-                        fCount += 1;
-                        ipT = '<div class="imgfloat imgfloat_{} {} section_{}">\n'
-                        if clickLinkURL:
-                            if CD["JAVASCRIPT_LINK_SPAN"] == "YES" and re.match(r"[^():]+\([^()]*\)",clickLinkURL):
-                                if re.search(r"[^A-Za-z0-9_\-'\.;()]", clickLinkURL):
-                                    _say_error( "Error: File '"+relfPath+"' contains an invalid\n"
-                                                "       Javascript function call. Correct and try again.\n"
-                                                "       Quit.")
-                                clickLinkURL = CD["JAVASCRIPT_LINK_PRE"] + clickLinkURL + CD["JAVASCRIPT_LINK_POST"]
-                                ipT = '<div class="imgfloat link_img imgfloat_{} {} section_{}">\n<span class="js_call"'
-                                ipT += ' onclick="{}">\n'
-                            else:
-                                ipT = '<div class="imgfloat link_img imgfloat_{} {} section_{}">\n<a href="{}">\n'
-                        if os.path.splitext(os.path.basename(CD["sourceFilePath"]))[0] == "news":
-                            ipT = re.sub(r'(<div )(class="imgfloat)', 
-                                    '\\1style="background-image:url(\'{}\')" \\2'.format(linkURL), ipT)
-                        else:
-                            ipT += '<img src="{}" alt="{}" />\n'.format(linkURL,linkText)
-                        if clickLinkURL:
-                            ipT = ipT.format(fCount,fCount%2 and "odd" or "even",sCount,clickLinkURL)
-                        else:
-                            ipT = ipT.format(fCount,fCount%2 and "odd" or "even",sCount)
-                        if clickLinkURL:
-                            if '<span class="js_call"' in ipT:
-                                ipT += '</span>\n'
-                            else:
-                                ipT += '</a>\n'
-                        if linkText: ipT += '<p class="imgcaption">{}</p>\n'.format(linkText)
-                        ipT += '</div>'
-                        # Text part of paragraph
-                        pCount += 1
-                        pT = '<p class="p_{} img_p {} section_{}">{}</p>'
-                        pT = pT.format(pCount, pCount%2 and "odd" or "even", sCount, ppT)
-                        # Image and text combo
-                        pT = ipT + "\n" + pT
-                    
-                    # --------------------- Paragraph
-                    else:
-                        pCount += 1
-                        npT = '<p class="p_{} {} section_{}">{}</p>'
-                        pT = npT.format(pCount,pCount%2 and "odd" or "even",sCount,pT)
-                    # Combine with new section
-                    nS = nS + pT + "\n"
-                hhh = '<div class="section {} section_{}">\n{}\n</div>'
-                blocks[i][0] = hhh.format(sCount%2 and "odd" or "even",sCount,nS[:-1])
-        # Combine blocks
-        rT = ""
-        sCount = 0
-        for i, x in enumerate(blocks):
-            # Surround heading & section pairs with div
-            if x[1] == "heading":
-                sCount += 1
-                if len(blocks) > i+1 and blocks[i+1][1] == "section":
-                    hhh = '<div class="headed_section {} section_{}">\n{}'
-                    x[0] = hhh.format(sCount%2 and "odd" or "even",sCount,x[0])
-                    blocks[i+1][0] += '\n</div>'
-            rT += x[0] + "\n"
-        
-        # --------------------- Delete empty sections
-        rT = re.sub(r"\s*<div [^>]+>\s*</div>", "", rT)
-        # --------------------- Process inline markup
-        rT = _process_inline_markup(rT)
+        lexer = QLMLexer(text, relfPath, placeholders)
+        try:
+            rT = QLMRenderer(CD, blockCache).render(lexer)
+        except QuicknrError as e:
+            _say_error(e.message)
+        if lexer.title:
+            CD["HTML_PAGE_TITLE"] = lexer.title # Already escaped, and will be again
         
         # Final wrap (penultimate actually; by default, head snippet adds <div class="page">)
         # Place file name in class for main div (if it is "html clean")
@@ -1328,27 +2956,23 @@ def Quicknr():
             rT = "<div class=\"user_content "+docN+"\">\n"+rT+hCode+"</div>\n"
         return rT
     
-    def _get_file_record_date(filePath, wT=""):
+    def _get_file_record_date(filePath, records=None):
         """
-        Returns the date recorded with the relative file path in quicknr_data.txt
+        Returns the date recorded with the relative file path in quicknr_data.txt,
+        from the RecordStore of the file if given
         The return is a date object or None
         
         """
+        if records is None:
+            records = RecordStore.load(os.path.join(CD["siteDir"], 
+                                                    "quicknr_private/quicknr_data.txt"))
         # If record exists, obtain its date
-        if not wT:
-            with open(os.path.join(CD["siteDir"], "quicknr_private/quicknr_data.txt"), mode="r") as f:
-                wT = f.read()
-        rfP = os.path.relpath(filePath, CD["siteDir"])
-        if rfP in wT:
-            for x in wT.splitlines()[1:]:
-                if x.split("\t")[0] == rfP:
-                    ods = x.split("\t")[1]; ot = ods.split("_")[1]; ods = ods.split("_")[0]
-                    oh, omin, osec = ot.split("-") # Hour, minute, second
-                    oy, om, od = ods.split("-") # Year, month, day
-                    return dt.datetime(int(oy),int(om),int(od),int(oh),int(omin),int(osec))
-            else: # No break
-                _data_file_corrupted_quit(CD["siteFolder"])
-        else: return None
+        rec = records.get(os.path.relpath(filePath, CD["siteDir"]))
+        if not rec: return None
+        try:
+            return rec.date()
+        except ValueError:
+            _data_file_corrupted_quit(CD["siteFolder"])
     
     def _get_date_from_filename(filePath, mode="record"):
         """
@@ -1392,7 +3016,7 @@ def Quicknr():
             elif mode == "news_list":
                 return dt.date.today().strftime("%Y-%b-%d")
     
-    def _news_date_stamp(text, wdataT):
+    def _news_date_stamp(text, wdataRS):
         """
         Inserts the current date, in a format set by the configuration, at the
         start of the <div class="user_content"> tag, if the file being
@@ -1404,7 +3028,7 @@ def Quicknr():
         
         """
         if os.path.split(os.path.dirname(CD["sourceFilePath"]))[1] == "news":
-            dDate = _get_file_record_date(CD["sourceFilePath"], wdataT)
+            dDate = _get_file_record_date(CD["sourceFilePath"], wdataRS)
             if dDate:
                 dTime = dDate.strftime(CD["NEWS_DATE_FORMAT"])
             else:
@@ -1441,10 +3065,11 @@ def Quicknr():
                 return imgURL
         return ""
     
-    def _get_news_post_thumb_url(newsT):
+    def _get_news_post_thumb_url(newsT, makeThumb=True):
         """
         Returns either the thumb or full-size image URL for first image in news post,
         depending on whether a thumb is available, or PIL can be used to create it
+        (unless makeThumb is False)
         
         Returns empty if no image found
         
@@ -1470,7 +3095,7 @@ def Quicknr():
                 if os.path.exists(os.path.join(CD["siteDir"], "public_html/"+thumbPath+x+fXt)):
                     return thumbPath+x+fXt
             # Thumb file not found, try to create it, if PIL available
-            if imgModule:
+            if imgModule and makeThumb:
                 tP = _save_image_thumbnail(os.path.join(CD["siteDir"],"public_html/"+imgURL))
                 return os.path.relpath(tP, os.path.join(CD["siteDir"], "public_html/"))
             else:
@@ -1478,60 +3103,6 @@ def Quicknr():
         else:
             return ""
 
-    def _indent_html_tree(text):
-        """
-        Returns HTML text as indented tree
-        
-        """
-        # Record line numbers of lines with opening and closing tags:
-            # For every opener, qualify it by searching for a matching closer:
-                # If closer found, increase indent level for content down from opener
-                # If no closer found, keep indent level as is
-            # For every closer down, decrease indent level for it and for content down
-        # Apply indents to the lines, not if text content
-        
-        # Remove leading whitespace before tags at line starts
-        text = re.sub(r"(?m)^\s+(<)", r"\1", text)
-        
-        indentsL = []
-        indentLevel = 0
-        tL = text.splitlines()
-        for i, tLine in enumerate(tL):
-            mo = re.match(r"<(\w+|!--)", tLine)
-            if mo:
-                if "</"+mo.group(1)+">" not in tLine: # Not closed inline
-                    if len(tL) > i+1: # Account for possibly last line (redundant?)
-                        mo1 = re.search(r"(?m)^</"+mo.group(1)+">", "\n".join(tL[i+1:]))
-                        if mo1:
-                            # Check for an inline closer before mo1, not a nester
-                            checkT = "\n".join(tL[i+1:])[:mo1.start()]
-                            mo2 = re.search(r"</"+mo.group(1)+">",checkT)
-                            if mo2:
-                                if "<"+mo.group(1) not in checkT[:mo2.start()]:
-                                    continue
-                            # mo is confirmed as an opener, increase indent for lines down
-                            indentLevel += 1
-                            indentsL.append([i+1, indentLevel])
-                        # else: No change to indentsL, keep existing indent
-            else:
-                mo = re.match(r"</\w", tLine)
-                if mo:
-                    # mo is confirmed as a closer, decrease indent
-                    indentLevel -= 1
-                    indentsL.append([i, indentLevel])
-            # If neither opener nor closer found, it is content text that won't be indented
-        indentLevel = 0
-        for i, tLine in enumerate(tL[:]): # Copy
-            for x in indentsL:
-                if i == x[0]: # indent level change
-                    indentLevel = x[1]
-                    #break # Don't break, need to consider all
-            if tLine.startswith("<"): # Not content text
-                tL[i] = "  "*max(0,indentLevel) + tLine
-            # else: Content text, not indenting
-        text = "\n".join(tL)
-        return text
-    
     def _set_title_from_filename(filename):
         """
         Sets CD["HTML_PAGE_TITLE"] to the title derived from filename
@@ -1545,7 +3116,7 @@ def Quicknr():
             title = filename.replace("-", " ").replace("_", " ").title()
         CD["HTML_PAGE_TITLE"] = html.escape(title)
     
-    def _get_news_listing_items(fxNC, htmlDirs, wdataT):
+    def _get_news_listing_items(fxNC, htmlDirs, wdataRS, makeThumbs=True):
         """
         Returns components of the news item source text:
             - date (in "%Y-%b-%d" format)
@@ -1563,33 +3134,20 @@ def Quicknr():
         nhTitle = CD["HTML_PAGE_TITLE"]
         # ...but the unescape doesn't catch everything, so we correct
         #nhTitle = re.sub(r"&amp;([A-Za-z0-9#]{2,8};)", r"&\1", nhTitle)
-        nhFP = "" # First paragraph
         with open(fxNC, mode="r") as f: fT = f.read()
         # Get first image URL from news post (for <meta> cards), could be empty
         nhImg = _get_news_post_img_url(fT)
         # Get first image URL from news post (if thumbs are enabled), thumb if possible
         nhImgThumb = ""; nhImgThumbLink = ""
         if CD["NEWS_LIST_THUMBS"] == "YES":
-            nhImgThumb = _get_news_post_thumb_url(fT)
+            nhImgThumb = _get_news_post_thumb_url(fT, makeThumbs)
             if nhImgThumb: nhImgThumbLink = "[" + nhImgThumb + "]"
-        # Get first paragraph; skip directives, link paragraphs, img floats, blocks
-        #   and headings
-        fT = re.sub(r"(?:@import:|@python:) \"[^\"\n]*\"", "", fT)
-        fT = re.sub(r"(?m)^\[[^\n]+?\]$", "", fT)
-        fT = re.sub(r"(?m)^\[[^\n]+?(?:\.jpg|\.png|\.gif|\.svg)\] (\S)",r"\1",fT)
-        fT = re.sub(r"(?ms)^(?:(?:\w+:\s*\S)|(?:\S[^:\n]*:\n[ ]*\S)).+?$(?=\n\n)", "", fT)
-        mo = re.search(r"(?ms)^\S.+?$(?=\n\n)", fT) # Corrected to allow line breaks
-        if mo: nhFP = mo.group()
-        # Get rid of any links in first paragraph
-        if "[" in nhFP and "]" in nhFP:
-            nhFP = re.sub(r"\[+[ ]*([^ \]]+)[ ]*\]+", r"\1", nhFP)
-            nhFP = re.sub(r"\[+[ ]*([^\]]+?)[ ]+[^ \]]+[ ]*\]+", r"\1", nhFP)
-        elif len(nhFP) > int(CD["NEWS_BLURB_LENGTH"]): # Nicely shorten by word
-            nhFP = nhFP[:int(CD["NEWS_BLURB_LENGTH"])].rsplit(maxsplit=1)[0]+"..."
+        # First paragraph, links taken out or shortened
+        nhFP = news_post_blurb(fT, CD["siteConfig"].NEWS_BLURB_LENGTH)
         nhPath = os.path.relpath(CD["htmlFilePath"], htmlDirs[0])
         if nhImgThumbLink: nhImgThumbLink += "[" + nhPath + "] " # Make thumb link to post
         # Date: get record or from filename or today's
-        dD = _get_file_record_date(fxNC, wdataT)
+        dD = _get_file_record_date(fxNC, wdataRS)
         if dD:
             dDS = dD.strftime("%Y-%b-%d")
         else:
@@ -1673,24 +3231,421 @@ def Quicknr():
                                         '<meta \\1 content="'+ogURL+'" />', hT)
         return hT
 
-    def _convert_sources_to_html(sourcesDirs, htmlDirs, sLxNC, wdataT):
+    def _load_user_functions():
+        """
+        Imports the "user_functions.py" file of the website as a module and
+        returns the UserFunctions registry of its functions
+        
+        """
+        if not os.path.exists(os.path.join(CD["siteDir"], "config/user_functions.py")):
+            _say_error("Error: 'user_functions.py' file is missing. Quit.")
+        return UserFunctions(os.path.join(CD["siteDir"], "config/user_functions.py"))
+    
+    def _render_source(ctx, sourcesDirs, htmlDirs, wdataRS, userFunctions):
+        """
+        Converts the source file of a conversion context to HTML, without 
+        writing it. Returns a dict of the HTML text, the source and HTML file 
+        paths relative to the website folder, any news listing item and the
+        calls of user functions made, or None if the file could not be 
+        converted
+        
+        The context holds a copy of the settings dict for the file alone, so
+        files can be converted in any process without sharing state. Text
+        protected from conversion, the contents of <pre> blocks, is kept in a
+        Placeholders registry of the file and put back in one scan at the end
+        
+        """
+        nonlocal CD
+        CD = ctx["CD"] # Helper functions read and update the settings via CD
+        fxNC = ctx["sourcePath"]
+        fX = os.path.splitext(fxNC)[1]
+        relfxNC = os.path.relpath(fxNC, CD["siteDir"])
+        docType = "" # Clear docType declaration
+        with open(fxNC, mode="r") as f:
+            hT = f.read()
+        placeholders = Placeholders(hT)
+        newsLinkMarker = placeholders.marker("newsLink")
+        # Protect links in news files before we prepend ../ to links from snippets
+        if os.path.split(os.path.dirname(fxNC))[1] == "news":
+            hT = re.sub(r"(\[(?:[^\]]+[ ])?)([^ \]]+\])", lambda mo: mo.group(1) + 
+                                                    newsLinkMarker + mo.group(2), hT)
+        # Update CD with source file path
+        CD["sourceFilePath"] = fxNC
+        # Keep file extension, will change later if ".txt"/".mdml"
+        hF = os.path.join(htmlDirs[0], os.path.relpath(fxNC, sourcesDirs[0]))
+        # Process only if source is ".txt" or ".mdml"
+        if fX == ".txt" or fX == ".mdml":
+            # Updates CD html page title
+            hT = _plaintext_to_html(hT, fX, relfxNC, placeholders, ctx.get("blockCache"))
+            if not hT: return None # Markdown processing attempt without module
+            # Update CD html head snippet with title
+            _enter_html_title()
+            # Change source ".txt"/".mdml" extension to HTML config preference
+            hF = os.path.splitext(hF)[0] + CD["PAGE_FILE_EXTENSION"]
+        else:
+            # File types other than ".txt"/".mdml" get title from filename
+            _set_title_from_filename(os.path.splitext(os.path.basename(fxNC))[0])
+            _enter_html_title()
+        # Store doctype, we may need it later
+        if re.match(r"\s*<!DOCTYPE[^>]+>", CD["HTML_HEAD"]):
+            docType = re.match(r"\s*<!DOCTYPE[^>]+>\n", CD["HTML_HEAD"]).group()
+            
+        # Combine with snippets
+        hT = CD["HTML_HEAD"] + hT + CD["HTML_TAIL"]
+        # Update CD with html file path
+        CD["htmlFilePath"] = hF
+        # Date stamp for news, using original date from record if editing old news
+        hT = _news_date_stamp(hT, wdataRS)
+        
+        # Get imports, before <meta>/<link> tags are edited, so they can be
+        #   imported conditionally first
+        importsL = []
+        hT = _import_files(hT, importsL)
+        # Inputs the page depends on, besides its source, for the dependencies file
+        depsL = ["snippet:HTML_HEAD", "snippet:HTML_TAIL"] + ["import:" + x for x in importsL]
+        depsL.extend(["config:title", "config:content", "config:meta"])
+        if os.path.split(os.path.dirname(fxNC))[1] == "news" or \
+                                fxNC == os.path.join(sourcesDirs[0], "news.txt"):
+            depsL.append("config:news")
+        
+        # --------------------- Meta tag edits
+        if CD["META_EDIT"] == "YES":
+            if os.path.splitext(os.path.basename(fxNC))[0] != "index":
+                # Edit Open Graph and Twitter card <meta> titles
+                # Home page is left at pre-existing value
+                hT = _edit_card_titles(hT)
+            if CD["META_BASE_URL"]:
+                # Edit canonical <link> and OG URL <meta> tags to page URL
+                docPath = os.path.relpath(CD["htmlFilePath"], htmlDirs[0])
+                hT = _edit_canonical_url(hT, docPath)
+        
+        # --------------------- If news post, prepare for listing "news.txt" 
+        #                           & get data for <meta> cards
+        if os.path.split(os.path.dirname(fxNC))[1] == "news":
+            # We read plain text original, so not affected by links protection above
+            dDS, nhTitle, nhPath, nhImg, nhImgThumb, nhImgThumbLink, nhFP = \
+                            _get_news_listing_items(fxNC, htmlDirs, wdataRS, ctx["makeThumbs"])
+            
+            # --------------------- Edit news <meta> tags in HTML, OG and Twitter
+            if CD["META_EDIT"] == "YES":
+                hT = _edit_meta_cards(hT, nhTitle, nhFP, nhPath, nhImg)
+                    
+        # Prepend local links with "../" if file in news subfolder
+        if os.path.split(os.path.dirname(fxNC))[1] == "news":
+            hT = re.sub(r"((?:href|src)=\")(?!(?:\.\./|http:|https:|file:|ftp:|javascript:|mailto:))", 
+                                                                r"\1../",hT)
+            hT = re.sub(r"((?:href|src)=\")\.\./(#)", r"\1\2", hT) # Correction (for bug?)
+            hT = re.sub(r"(?:\.\./)?" + re.escape(newsLinkMarker), "", hT) # Ditto
+            hT = re.sub(r"((?:href|src)=\")(www\.)", r"\1http://\2", hT)
+            
+        # Process user functions. Their directives are found in one scan, done 
+        #   again only if a function changes the text after its directive or
+        #   enters a directive before it
+        functionTimesD = {}
+        if "@python:" in hT:
+            tT = hT # Text as last scanned, ending as hT from the next directive on
+            matchesL = list(UserFunctions.directiveRE.finditer(tT))
+            k = 0
+            while k < len(matchesL):
+                mo = matchesL[k]
+                i = len(hT) - len(tT) + mo.start()
+                # Lose the directive
+                hT = hT[:i] + hT[i+len(mo.group()):]
+                if mo.group(1): # We have a function name
+                    if mo.group(1) not in userFunctions:
+                        _say_error( "Error: Function '{}' not found in 'user_functions.py'.\n"
+                                    "       Quit.".format(mo.group(1)))
+                    depsL.append("python:" + mo.group(1))
+                    # No exception handling at this level
+                    hT = userFunctions.call(mo.group(1), hT, i, CD, timesD=functionTimesD)
+                    if not hT:
+                        _say_error( "Error: Processing aborted on '{}', no text available.\n"
+                                    "       Check that a Python function is not failing to return.\n"
+                                    "       Quit.".format(relfxNC))
+                k += 1
+                if k < len(matchesL):
+                    j = len(hT) - len(tT) + matchesL[k].start()
+                    if j >= 0 and hT.find("@python:", 0, j) == -1 and \
+                                                hT.endswith(tT[matchesL[k].start():]):
+                        continue
+                elif "@python:" not in hT:
+                    break
+                tT = hT
+                matchesL = list(UserFunctions.directiveRE.finditer(tT))
+                k = 0
+            
+        # Enter IDs in DIV, P, H1-6, IMG, IFRAME, DL, DT, DD, OL, UL, and LI
+        if CD["HTML_TAG_ID"] == "YES":
+            idCount = 0
+            def _id_generator(mo):
+                """Enters numerical series of IDs into tags"""
+                nonlocal idCount
+                if ' id="' in mo.group():
+                    return mo.group()
+                else:
+                    idCount += 1
+                    return r'{} id="id{}"{}'.format(mo.group(1),idCount,mo.group(2))
+            hT = re.sub(r"(<(?:div|p|h\d|img|iframe|dl|dt|dd|ol|ul|li)(?:[ ][^>]*?)??)(/?>)", 
+                                                                _id_generator, hT)
+        
+        # Put back spaces at /> tag ends (id generating above)
+        hT = re.sub(r"(?<![ ])(/>)", r" \1", hT)
+        hT = re.sub(r" ( id=\")", r"\1", hT)
+        # Remove empty lines & whitespace between tags
+        hT = re.sub(r">\s*\n\s*<",">\n<",hT)
+        # Remove whitespace between closing tag and punctuation
+        hT = re.sub(r"(</[^>]+>)\s+(?=[,.?!'\"\)])", r"\1", hT)
+        # Remove whitespace at start of <p> block 
+        # for Chrome's handling of white-space CSS
+        hT = re.sub(r"(<p [^>]+>)\s+", r"\1", hT)
+        
+        hT = indent_html_tree(hT)
+        # Bring in <pre> code text (protected earlier, escaped already)
+        hT = placeholders.restore(hT)
+        # Correct overzealous char entity conversion of &
+        hT = re.sub(r"&amp;([A-Za-z0-9#]{2,8};)", r"&\1", hT)
+        # Remove whitespace around &nbsp;
+        hT = re.sub(r"\s*(&nbsp;)\s*", r"\1", hT)
+        
+        # --------------------- Fill out and insert news list item block
+        if os.path.split(os.path.dirname(fxNC))[1] == "news":
+            if nhImgThumb:
+                nlib = newsListItemBlock.replace("DATE_TEXT", dDS)
+                nlib = nlib.replace("THUMB_URL", nhImgThumb)
+            else: # No thumbnail
+                nlib = newsListItemBlockNoThumb.replace("DATE_TEXT", dDS)
+            nlib = nlib.replace("POST_URL", nhPath)
+            nlib = nlib.replace("HEADING_TEXT", 
+                    _bold_italic_mono(_html_escape_noamp(nhTitle, quote=False)))
+            nlib = nlib.replace("BLURB_TEXT", 
+                    _bold_italic_mono(_html_escape_noamp(nhFP, quote=False)))
+            nlib = nlib.replace("MORE_TEXT", CD["NEWS_MORE_PHRASE"])
+            # Place news list item block into news post HTML
+            hT = re.sub(r"(<div class=\"user_content[^>]+?>)",r'\1{}'.format(nlib),hT)
+        
+        # --------------------- Final
+        # HTML5 tags correction from Quicknr's internal XHTML
+        if CD["ALWAYS_XHTML_TAGS"] == "NO":
+            if re.match(r"(?i)\s*<\s*!\s*doctype\s+html\s*>", hT):
+                hT = re.sub(r"\s*/>", ">", hT)
+        # Return both source and html relative paths, any news listing data and
+        #   the inputs used
+        newsItem = None
+        if os.path.split(os.path.dirname(fxNC))[1] == "news":
+            newsItem = [dDS, nhTitle, nhPath, nhImgThumbLink, nhFP]
+        return dict(sourcePath=relfxNC, 
+                    htmlPath=os.path.relpath(hF, CD["siteDir"]), 
+                    html=hT,
+                    newsItem=newsItem,
+                    deps=sorted(set(depsL)),
+                    functionTimes=functionTimesD)
+    
+    def _write_page(hP, hT):
+        """ Writes the HTML text hT of a page to its file, of path relative to siteDir """
+        with open(os.path.join(CD["siteDir"], hP), mode="w") as f: f.write(hT)
+    
+    def _post_build_hook(userFunctions, pagesD, htmlDirs):
+        """
+        Calls the post-build hook function of "user_functions.py" once, with
+        the dict pagesD of the HTML texts of the pages converted in the run,
+        by path relative to the website folder, a dict of the other pages in
+        the HTML folders, by path, each a dict of its "size" and "mtime", and
+        the settings dict. The function returns a dict of new texts of any
+        of these pages, by path, or None, and the texts are written here
+        
+        Returns the list of paths of the pages changed and written
+        
+        """
+        othersD = {}
+        for d in htmlDirs:
+            with suppress(FileNotFoundError):
+                for e in os.scandir(d):
+                    relP = os.path.relpath(e.path, CD["siteDir"])
+                    if e.is_file() and os.path.splitext(e.name)[1] in (".html", ".htm", ".php") \
+                                                                    and relP not in pagesD:
+                        st = e.stat()
+                        othersD[relP] = dict(size=st.st_size, mtime=st.st_mtime)
+        print("\n  Running post-build hook '{}' on {} converted pages.".format(
+                                                    UserFunctions.POST_BUILD_HOOK, len(pagesD)))
+        editsD = userFunctions.call_hook(pagesD, othersD, CD) or {}
+        for x in editsD:
+            if x not in pagesD and x not in othersD:
+                _say_error( "Error: Post-build hook returned a page not in the website:\n"
+                            "       {}\n"
+                            "       Quit.".format(x))
+        editedL = []
+        for x, hT in sorted(editsD.items()):
+            if x in pagesD:
+                if hT == pagesD[x]: continue
+            else: # Written only if changed, so not uploaded again for nothing
+                with open(os.path.join(CD["siteDir"], x), mode="r") as f:
+                    if hT == f.read(): continue
+            _write_page(x, hT)
+            editedL.append(x)
+            print("  Edited by post-build hook:\n       " + x)
+        return editedL
+    
+    def _convert_sources_to_html(sourcesDirs, htmlDirs, sLxNC, wdataRS, jobs=1):
         """
         Converts source ".txt"/".mdml" files that are either new or the user
         has changed, to HTML. Also concatenates any HTML source files with
         configuration snippets into output HTML files without conversion
         
+        If jobs is greater than 1, the files are converted in a pool of that
+        many worker processes, each file from its own conversion context.
+        Updates of the news listing and the list of converted files are then
+        merged back here, in the same order as when converting one by one
+        
+        Returns the list of converted files, and a dict of the converted 
+        source paths and the inputs each depends on
+        
         """
         nonlocal CD
-        nonlocal preContentL
-        #nonlocal jsLinkContentL
-        nonlocal rebuildNewsList
+        global _poolConverter
+        
+        userFunctions = _load_user_functions()
+        _refresh_import_files() # Before any workers fork, so they share it
+        # Texts of the converted pages are kept for the post-build hook, if any
+        keepHTML = userFunctions.hook is not None
+        pagesD = {}
+        
+        # Build cache of converted pages, keyed by digest of all conversion input
+        buildCache = None
+        if CD["siteConfig"].BUILD_CACHE_SIZE:
+            buildCache = BuildCache(os.path.join(CD["siteDir"], "quicknr_private/build_cache"),
+                                    CD["siteConfig"].BUILD_CACHE_SIZE*1000000)
+            # Input common to all pages: version, settings, user functions and imports
+            cacheBase = hashlib.sha256(QUICKNR_VERSION.encode())
+            if markdownModule: # Version string, a submodule in older versions
+                mdVersion = getattr(markdown, "__version__", "")
+                if not isinstance(mdVersion, str): mdVersion = getattr(markdown, "version", "")
+                cacheBase.update(b"markdown " + mdVersion.encode())
+            # Server and debug settings, and paths of this machine, don't affect output
+            for g in SiteConfig.OUTPUT_GROUPS:
+                cacheBase.update(CD["siteConfig"].fingerprint(g).encode())
+            with open(os.path.join(CD["siteDir"], "config/user_functions.py"), mode="rb") as f:
+                cacheBase.update(f.read())
+            importsL = [] # List of 2-item lists of import file name and contents
+            importDir = os.path.join(CD["siteDir"], "config/import")
+            for x in sorted(os.listdir(importDir)):
+                if os.path.isfile(os.path.join(importDir, x)):
+                    with open(os.path.join(importDir, x), mode="rb") as f:
+                        importsL.append([x, f.read()])
+        
+        def _build_cache_key(fxNC):
+            """ Returns the build cache key of source file """
+            h = cacheBase.copy()
+            h.update(os.path.relpath(fxNC, CD["siteDir"]).replace(os.sep, "/").encode() + b"\0")
+            with open(fxNC, mode="rb") as f: h.update(f.read())
+            # Imports that may apply to the source, by import naming convention
+            sbName = os.path.splitext(os.path.basename(fxNC))[0]
+            isNews = os.path.split(os.path.dirname(fxNC))[1] == "news"
+            for imName, imBytes in importsL:
+                imFname = imName
+                if "__" in imFname: imFname = imFname.split("__", maxsplit=1)[1]
+                imFname = os.path.splitext(imFname)[0]
+                if imFname == sbName or imFname == "all" or (imFname == "newspost" and isNews):
+                    h.update(b"\0" + imName.encode() + b"\0" + imBytes)
+            # News posts are stamped with their recorded date, or if new with the
+            # date of the file name, or today's
+            if isNews:
+                dDate = _get_file_record_date(fxNC, wdataRS)
+                if dDate: h.update(str(dDate).encode())
+                elif CD["NEWS_DATE_FROM_FILENAME"] != "YES":
+                    h.update(dt.date.today().isoformat().encode())
+            return h.hexdigest()
+        
+        def _block_cache_key(fxNC):
+            """ Returns the build cache key of the QLM blocks of source file """
+            h = hashlib.sha256(QUICKNR_VERSION.encode() + b"\0blocks\0")
+            h.update(os.path.relpath(fxNC, CD["siteDir"]).replace(os.sep, "/").encode())
+            return h.hexdigest()
         
-        # Execute user functions file
-        if os.path.exists(os.path.join(CD["siteDir"], "config/user_functions.py")):
-            with open(os.path.join(CD["siteDir"], "config/user_functions.py")) as f:
-                userFunctions = f.read()
-            exec(userFunctions)
-        else: _say_error("Error: 'user_functions.py' file is missing. Quit.")
+        def _thumb_found(ctx, result):
+            """
+            Returns True if the news listing thumbnail of a cached news post is
+            found where the cached page has it, made again if missing
+            
+            """
+            if CD["NEWS_LIST_THUMBS"] != "YES": return True
+            with open(ctx["sourcePath"], mode="r") as f: fT = f.read()
+            thumb = _get_news_post_thumb_url(fT, ctx["makeThumbs"])
+            dDS, nhTitle, nhPath, nhImgThumbLink, nhFP = result["newsItem"]
+            return nhImgThumbLink == ("[" + thumb + "][" + nhPath + "] " if thumb else "")
+        
+        def _convert_source_file(ctx):
+            """
+            Renders the source file of a conversion context, or takes it from the 
+            build cache, and writes the HTML file. Returns the render results, 
+            without the HTML text, or None
+            
+            """
+            if buildCache:
+                cacheKey = _build_cache_key(ctx["sourcePath"])
+                result = buildCache.get(cacheKey)
+                if result and "deps" not in result: result = None # Cached by older version
+                if result and result["newsItem"] and not _thumb_found(ctx, result): result = None
+                if result: result["cached"] = True
+            if not buildCache or not result:
+                if buildCache: # Blocks of the previous render of the page
+                    blocksKey = _block_cache_key(ctx["sourcePath"])
+                    ctx["blockCache"] = BlockMemo(buildCache.get(blocksKey))
+                result = _render_source(ctx, sourcesDirs, htmlDirs, wdataRS, userFunctions)
+                if not result: return None
+                if buildCache:
+                    buildCache.put(cacheKey, result)
+                    if ctx["blockCache"].used: buildCache.put(blocksKey, ctx["blockCache"].used)
+            _write_page(result["htmlPath"], result["html"] if keepHTML else result.pop("html"))
+            if profiler: result["profile"] = profiler.take() # Passed back from workers
+            return result
+        
+        def _update_news_listing(newsItem):
+            """
+            Enters the listing item of a converted news post into the news listing 
+            source file "news.txt", replacing any previous item of the post
+            
+            """
+            nonlocal rebuildNewsList
+            
+            dDS, nhTitle, nhPath, nhImgThumbLink, nhFP = newsItem
+            # Construct news listing item; linked heading and a para: title, img & intro
+            nhMore = " ["+CD["NEWS_MORE_PHRASE"]+" "+nhPath+"]"
+            # If no intro, save news list from breakdown with link
+            if not nhFP: nhMore = "&nbsp;["+"Read the article"+" "+nhPath+"]"
+            nhNItem = "   _"+dDS+"_ ["+nhTitle+" "+nhPath+"]\n\n"+\
+                                nhImgThumbLink+nhFP+nhMore
+            # --------------------- News listing source file
+            nlT = ""
+            if not rebuildNewsList:
+                if os.path.exists(os.path.join(sourcesDirs[0], "news.txt")):
+                    with open(os.path.join(sourcesDirs[0], "news.txt"), mode="r") as f:
+                        nlT = f.read()
+            rebuildNewsList = False # Re-set variable, must only be considered once
+            if not nlT:
+                nlT = "   "+CD["NEWS_LIST_TITLE"]+"\n\n"
+            else:
+                # Replace title with preference
+                nlT = re.sub(r"\A\s*.+\n", "   "+CD["NEWS_LIST_TITLE"]+"\n", nlT)
+            # Insert updated news item in its slot, replacing original
+            if nhPath in nlT:
+                nlL = nlT.split("\n\n")
+                for i, x in enumerate(nlL):
+                    if nhPath in x: # Got the first occurrence, replace it
+                        nlT = "\n\n".join(nlL[:i])+"\n\n"+nhNItem+"\n\n"+"\n\n".join(nlL[i+2:])
+                        break
+            else: # New news item, place it between title and first old item
+                nlT = nlT.split("\n\n")[0]+"\n\n"+nhNItem+"\n\n"+nlT.split("\n\n",maxsplit=1)[1]
+            # Shorten list length to config preference by dropping last news item
+            niCount = len(nlT.split("\n\n")[1:-1])
+            if niCount > 2*CD["siteConfig"].NEWS_LIST_ITEMS:
+                niCount = niCount - (2*CD["siteConfig"].NEWS_LIST_ITEMS) + 1
+                nlT = "\n\n".join(nlT.split("\n\n")[:-niCount])+"\n\n"
+            # Tidy up, just in case
+            nlT = re.sub(r"[ ]+\n", "\n", nlT)
+            nlT = re.sub(r"(\n\n)\n+", r"\1", nlT)
+            # Write news listing file
+            with open(os.path.join(sourcesDirs[0], "news.txt"), mode="w") as f:
+                f.write(nlT)
         
         # Sort old news according to date, for correct listing
         sLxNC1 = []
@@ -1698,8 +3653,8 @@ def Quicknr():
         nNL = [] # New news files not in record
         for x in sLxNC:
             if os.path.split(os.path.dirname(x))[1] == "news":
-                if os.path.relpath(x, CD["siteDir"]) in wdataT:
-                    wD = _get_file_record_date(x, wdataT)
+                if os.path.relpath(x, CD["siteDir"]) in wdataRS:
+                    wD = _get_file_record_date(x, wdataRS)
                     oNL.append([wD.strftime("%Y-%m-%d_%H-%M-%S"), x])
                 else:
                     nNL.append(x)
@@ -1712,267 +3667,109 @@ def Quicknr():
         sLxNC1.extend(nNL)
         sLxNC = sLxNC1[:]
         
-        if updateNewsList:
-            sLxNC.append(os.path.join(sourcesDirs[0], "news.txt"))
-        convertedFiles = []
-        for i, fxNC in enumerate(sLxNC):
-            fX = os.path.splitext(fxNC)[1]
-            relfxNC = os.path.relpath(fxNC, CD["siteDir"])
-            # Markdown not supported for news
-            if os.path.split(os.path.dirname(fxNC))[1] == "news" and \
-                        (fX == ".mdml" or CD["QLM_OR_MARKDOWN"] == "MARKDOWN"):
-                print("       File '%s' not converted, Markdown not supported for news." % relfxNC)
-                continue
-            preContentL = [] # Clear list of <pre> instances
-            #jsLinkContentL = [] # Ditto js link args
-            docType = "" # Clear docType declaration
-            print("\n  Converting to HTML (file {} of {}):".format(i+1, len(sLxNC)))
-            print("       " + relfxNC)
-            with open(fxNC, mode="r") as f:
-                hT = f.read()
-            # Protect links in news files before we prepend ../ to links from snippets
-            if os.path.split(os.path.dirname(fxNC))[1] == "news":
-                hT = re.sub(r"(\[(?:[^\]]+[ ])?)([^ \]]+\])", r"\1Quicknr__newsLink__Quicknr\2", hT)
-            # Update CD with source file path
-            CD["sourceFilePath"] = fxNC
-            # Keep file extension, will change later if ".txt"/".mdml"
-            hF = os.path.join(htmlDirs[0], os.path.relpath(fxNC, sourcesDirs[0]))
-            # Process only if source is ".txt" or ".mdml"
-            if fX == ".txt" or fX == ".mdml":
-                # Updates CD html page title
-                hT = _plaintext_to_html(hT, fX, relfxNC)
-                if not hT: continue # Markdown processing attempt without module
-                # Update CD html head snippet with title
-                _enter_html_title()
-                # Change source ".txt"/".mdml" extension to HTML config preference
-                hF = os.path.splitext(hF)[0] + CD["PAGE_FILE_EXTENSION"]
+        newsListPath = os.path.join(sourcesDirs[0], "news.txt")
+        if updateNewsList: # Once, after the news posts
+            sLxNC = [x for x in sLxNC if x != newsListPath] + [newsListPath]
+        # Markdown not supported for news
+        skipL = [x for x in sLxNC if os.path.split(os.path.dirname(x))[1] == "news" and \
+                        (os.path.splitext(x)[1] == ".mdml" or CD["QLM_OR_MARKDOWN"] == "MARKDOWN")]
+        # News listing is converted last, from the items merged before it
+        poolL = [x for x in sLxNC if x not in skipL and x != newsListPath]
+        siteCD = CD # Settings of the website, copied into every conversion context
+        def _new_context(fxNC):
+            """ Returns picklable conversion context of source file """
+            return dict(CD=dict(siteCD), sourcePath=fxNC, makeThumbs=True)
+        
+        if jobs == 0: jobs = os.cpu_count() or 1
+        pool = None
+        if jobs > 1 and len(poolL) > 1:
+            if "fork" in multiprocessing.get_all_start_methods():
+                _poolConverter = _convert_source_file # Inherited by forked workers
+                pool = multiprocessing.get_context("fork").Pool(min(jobs, len(poolL)))
+                # Results are returned in the order of the list
+                pooledResults = pool.imap(_pool_convert, [_new_context(x) for x in poolL])
+                print("\n  Converting in {} parallel processes.".format(min(jobs, len(poolL))))
             else:
-                # File types other than ".txt"/".mdml" get title from filename
-                _set_title_from_filename(os.path.splitext(os.path.basename(fxNC))[0])
-                _enter_html_title()
-            # Store doctype, we may need it later
-            if re.match(r"\s*<!DOCTYPE[^>]+>", CD["HTML_HEAD"]):
-                docType = re.match(r"\s*<!DOCTYPE[^>]+>\n", CD["HTML_HEAD"]).group()
-                
-            # Combine with snippets
-            hT = CD["HTML_HEAD"] + hT + CD["HTML_TAIL"]
-            # Update CD with html file path
-            CD["htmlFilePath"] = hF
-            # Date stamp for news, using original date from record if editing old news
-            hT = _news_date_stamp(hT, wdataT)
-            
-            # Get imports, before <meta>/<link> tags are edited, so they can be
-            #   imported conditionally first
-            hT = _import_files(hT)
-            
-            # --------------------- Meta tag edits
-            if CD["META_EDIT"] == "YES":
-                if os.path.splitext(os.path.basename(fxNC))[0] != "index":
-                    # Edit Open Graph and Twitter card <meta> titles
-                    # Home page is left at pre-existing value
-                    hT = _edit_card_titles(hT)
-                if CD["META_BASE_URL"]:
-                    # Edit canonical <link> and OG URL <meta> tags to page URL
-                    docPath = os.path.relpath(CD["htmlFilePath"], htmlDirs[0])
-                    hT = _edit_canonical_url(hT, docPath)
-            
-            # --------------------- If news post, prepare for listing "news.txt" 
-            #                           & get data for <meta> cards
-            if os.path.split(os.path.dirname(fxNC))[1] == "news":
-                # We read plain text original, so not affected by links protection above
-                dDS, nhTitle, nhPath, nhImg, nhImgThumb, nhImgThumbLink, nhFP = \
-                                        _get_news_listing_items(fxNC, htmlDirs, wdataT)
-                
-                # --------------------- Edit news <meta> tags in HTML, OG and Twitter
-                if CD["META_EDIT"] == "YES":
-                    hT = _edit_meta_cards(hT, nhTitle, nhFP, nhPath, nhImg)
-                        
-            # Prepend local links with "../" if file in news subfolder
-            if os.path.split(os.path.dirname(fxNC))[1] == "news":
-                hT = re.sub(r"((?:href|src)=\")(?!(?:\.\./|http:|https:|file:|ftp:|javascript:|mailto:))", 
-                                                                    r"\1../",hT)
-                hT = re.sub(r"((?:href|src)=\")\.\./(#)", r"\1\2", hT) # Correction (for bug?)
-                hT = re.sub(r"(?:\.\./)?Quicknr__newsLink__Quicknr", "", hT) # Ditto
-                hT = re.sub(r"((?:href|src)=\")(www\.)", r"\1http://\2", hT)
-                
-            # Process user functions
-            if "@python:" in hT:
-                while True:
-                    if not hT:
-                        _say_error( "Error: Processing aborted on '{}', no text available.\n"
-                                    "       Check that a Python function is not failing to return.\n"
-                                    "       Quit.".format(relfxNC))
-                    mo = re.search(r"@python:\s+['\"](.*?)['\"]\n*", hT)
-                    if not mo: break
-                    # Lose the directive
-                    hT = hT[:mo.start()]+hT[mo.end():]
-                    if mo.group(1): # We have a function name
-                        # No exception handling at this level
-                        hT = eval(mo.group(1) + "(hT, " + str(mo.start()) + ", CD)")
-                
-            # Enter IDs in DIV, P, H1-6, IMG, IFRAME, DL, DT, DD, OL, UL, and LI
-            if CD["HTML_TAG_ID"] == "YES":
-                idCount = 0
-                def _id_generator(mo):
-                    """Enters numerical series of IDs into tags"""
-                    nonlocal idCount
-                    if ' id="' in mo.group():
-                        return mo.group()
-                    else:
-                        idCount += 1
-                        return r'{} id="id{}"{}'.format(mo.group(1),idCount,mo.group(2))
-                hT = re.sub(r"(<(?:div|p|h\d|img|iframe|dl|dt|dd|ol|ul|li)(?:[ ][^>]*?)*?)(/?>)", 
-                                                                    _id_generator, hT)
-            
-            # Put back spaces at /> tag ends (id generating above)
-            hT = re.sub(r"(?<![ ])(/>)", r" \1", hT)
-            hT = re.sub(r" ( id=\")", r"\1", hT)
-            # Remove empty lines & whitespace between tags
-            hT = re.sub(r">\s*\n\s*<",">\n<",hT)
-            # Remove whitespace between closing tag and punctuation
-            hT = re.sub(r"(</[^>]+>)\s+(?=[,.?!'\"\)])", r"\1", hT)
-            # Remove whitespace at start of <p> block 
-            # for Chrome's handling of white-space CSS
-            hT = re.sub(r"(<p [^>]+>)\s+", r"\1", hT)
-            
-            hT = _indent_html_tree(hT)
-            # Bring in <pre> code text (protected earlier)
-            if preContentL:
-                for x in preContentL:
-                    #x = html.escape(x, quote=False) # Done already
-                    hT = hT.replace(">Quicknr?=preText=?Quicknr</pre>", ">" + x + "</pre>", 1)
-            # Bring in Javascript link argument text (protected earlier)
-            #if jsLinkContentL:
-                #for x in jsLinkContentL:
-                    ##x = html.escape(x, quote=False) # Done already
-                    #hT = hT.replace("(Quicknr?=jsLinkArgs=?Quicknr)", "(" + x + ")", 1)
-            # Correct overzealous char entity conversion of &
-            hT = re.sub(r"&amp;([A-Za-z0-9#]{2,8};)", r"&\1", hT)
-            # Remove whitespace around &nbsp;
-            hT = re.sub(r"\s*(&nbsp;)\s*", r"\1", hT)
-            
-            # --------------------- Fill out and insert news list item block
-            if os.path.split(os.path.dirname(fxNC))[1] == "news":
-                if nhImgThumb:
-                    nlib = newsListItemBlock.replace("DATE_TEXT", dDS)
-                    nlib = nlib.replace("THUMB_URL", nhImgThumb)
-                else: # No thumbnail
-                    nlib = newsListItemBlockNoThumb.replace("DATE_TEXT", dDS)
-                nlib = nlib.replace("POST_URL", nhPath)
-                nlib = nlib.replace("HEADING_TEXT", 
-                        _bold_italic_mono(_html_escape_noamp(nhTitle, quote=False)))
-                nlib = nlib.replace("BLURB_TEXT", 
-                        _bold_italic_mono(_html_escape_noamp(nhFP, quote=False)))
-                nlib = nlib.replace("MORE_TEXT", CD["NEWS_MORE_PHRASE"])
-                # Place news list item block into news post HTML
-                hT = re.sub(r"(<div class=\"user_content[^>]+?>)",r'\1{}'.format(nlib),hT)
-            
-            # --------------------- Final
-            # HTML5 tags correction from Quicknr's internal XHTML
-            if CD["ALWAYS_XHTML_TAGS"] == "NO":
-                if re.match(r"(?i)\s*<\s*!\s*doctype\s+html\s*>", hT):
-                    hT = re.sub(r"\s*/>", ">", hT)
-            # Write HTML file
-            with open(hF, mode="w") as f:
-                f.write(hT)
-            relhF = os.path.relpath(hF, CD["siteDir"])
-            # Return both source and html relative paths
-            convertedFiles.append(relhF)
-            convertedFiles.append(relfxNC)
-            print("  Converted file:\n       " + relhF)
-            
-            # --------------------- If this was a news post, list in "news.txt"
-            if os.path.split(os.path.dirname(fxNC))[1] == "news":
-                # Construct news listing item; linked heading and a para: title, img & intro
-                nhMore = " ["+CD["NEWS_MORE_PHRASE"]+" "+nhPath+"]"
-                # If no intro, save news list from breakdown with link
-                if not nhFP: nhMore = "&nbsp;["+"Read the article"+" "+nhPath+"]"
-                nhNItem = "   _"+dDS+"_ ["+nhTitle+" "+nhPath+"]\n\n"+\
-                                    nhImgThumbLink+nhFP+nhMore
-                # --------------------- News listing source file
-                nlT = ""
-                if not rebuildNewsList:
-                    if os.path.exists(os.path.join(sourcesDirs[0], "news.txt")):
-                        with open(os.path.join(sourcesDirs[0], "news.txt"), mode="r") as f:
-                            nlT = f.read()
-                rebuildNewsList = False # Re-set variable, must only be considered once
-                if not nlT:
-                    nlT = "   "+CD["NEWS_LIST_TITLE"]+"\n\n"
+                print("\n  Parallel conversion not available on this system, converting in sequence.")
+        convertedFiles = []
+        depsD = {}
+        try:
+            for i, fxNC in enumerate(sLxNC):
+                relfxNC = os.path.relpath(fxNC, CD["siteDir"])
+                if fxNC in skipL:
+                    print("       File '%s' not converted, Markdown not supported for news." % relfxNC)
+                    continue
+                print("\n  Converting to HTML (file {} of {}):".format(i+1, len(sLxNC)))
+                print("       " + relfxNC)
+                if pool and fxNC != newsListPath:
+                    result = next(pooledResults)
                 else:
-                    # Replace title with preference
-                    nlT = re.sub(r"\A\s*.+\n", "   "+CD["NEWS_LIST_TITLE"]+"\n", nlT)
-                # Insert updated news item in its slot, replacing original
-                if nhPath in nlT:
-                    nlL = nlT.split("\n\n")
-                    for i, x in enumerate(nlL):
-                        if nhPath in x: # Got the first occurrence, replace it
-                            nlT = "\n\n".join(nlL[:i])+"\n\n"+nhNItem+"\n\n"+"\n\n".join(nlL[i+2:])
-                            break
-                else: # New news item, place it between title and first old item
-                    nlT = nlT.split("\n\n")[0]+"\n\n"+nhNItem+"\n\n"+nlT.split("\n\n",maxsplit=1)[1]
-                # Shorten list length to config preference by dropping last news item
-                niCount = len(nlT.split("\n\n")[1:-1])
-                if niCount > 2*int(CD["NEWS_LIST_ITEMS"]):
-                    niCount = niCount - (2*int(CD["NEWS_LIST_ITEMS"])) + 1
-                    nlT = "\n\n".join(nlT.split("\n\n")[:-niCount])+"\n\n"
-                # Tidy up, just in case
-                nlT = re.sub(r"[ ]+\n", "\n", nlT)
-                nlT = re.sub(r"(\n\n)\n+", r"\1", nlT)
-                # Write news listing file
-                with open(os.path.join(sourcesDirs[0], "news.txt"), mode="w") as f:
-                    f.write(nlT)
-        return convertedFiles
-    
-    def _record_new_files(convertedFiles, qnrDataPath, fT):
+                    result = _convert_source_file(_new_context(fxNC))
+                    CD = siteCD
+                if not result: continue
+                if result.get("quit"): sys.exit() # Worker has reported the error
+                if profiler: profiler.add(result.pop("profile"))
+                convertedFiles.append(result["htmlPath"])
+                convertedFiles.append(result["sourcePath"])
+                if keepHTML: pagesD[result["htmlPath"]] = result.pop("html")
+                depsD[result["sourcePath"]] = result["deps"]
+                if result.get("cached"):
+                    print("  Converted file (unchanged, from build cache):\n       " + result["htmlPath"])
+                else:
+                    print("  Converted file:\n       " + result["htmlPath"])
+                    userFunctions.add_times(result["functionTimes"])
+                # --------------------- If this was a news post, list in "news.txt"
+                if result["newsItem"]:
+                    _update_news_listing(result["newsItem"])
+        finally:
+            CD = siteCD
+            if pool:
+                pool.terminate()
+                _poolConverter = None
+        if buildCache: buildCache.prune()
+        if pagesD: convertedFiles.extend(_post_build_hook(userFunctions, pagesD, htmlDirs))
+        if userFunctions.timesD: # Slowest first
+            print("\n  User function calls (calls, seconds):")
+            for name, (calls, seconds) in sorted(userFunctions.timesD.items(), 
+                                                        key=lambda x: -x[1][1]):
+                print("       {:<30} {:>6} {:>9.3f}".format(name, calls, seconds))
+        return convertedFiles, depsD
+    
+    def _record_new_files(convertedFiles, qnrRS):
         """
         Record converted source and resulting HTML files in quicknr_data.txt as 
-        tab-delimited fields. Overwrites pre-existing records of the same name
+        tab-delimited fields, through its RecordStore. Overwrites pre-existing 
+        records of the same name
         
-        Record format: filepath,time,size,hash,NOTUP|UP
+        Record format: filepath,time,size,hash,stat,NOTUP|UP
         
         filepath - relative to website folder
         time - date and time of entry, in 'Year-Month-Day_Hour-Min-Sec' format
         size - file size in bytes
         hash - hexadecimal digest of file contents
+        stat - modification and status change times in ns, and inode number
         NOTUP|UP - not uploaded|uploaded (HTML files only)
         
         """
         convertedFiles = list(set(convertedFiles)) # Get rid of duplicates ("news.txt")
         convertedFiles.sort()
-        nfRecords = []
-        recordsDeleted = False
-        fTL = fT.splitlines()[1:]
         for x in convertedFiles:
             d = dt.datetime.now().strftime("%Y-%m-%d_%H-%M-%S") # Must be here
-            sF, hF = _file_size_and_hash(x) # May quit, if file over 1MB
+            sF, hF, tF = _file_size_and_hash(x) # May quit, if file over 1MB
             if re.match(r".?public_html", x):
-                nfRecords.append(x+"\t"+d+"\t"+sF+"\t"+hF+"\tNOTUP")
+                qnrRS.put(DataRecord(x, d, sF, hF, tF, "NOTUP"))
             else: # Source file
                 # Get date of old news file instead of using today's
                 if os.path.split(os.path.dirname(x))[1] == "news":
-                    dD = _get_file_record_date(os.path.join(CD["siteDir"], x), fT)
+                    dD = _get_file_record_date(os.path.join(CD["siteDir"], x), qnrRS)
                     if dD:
                         d = dD.strftime("%Y-%m-%d_%H-%M-%S")
                     else: # New news file, no recorded date
                         if CD["NEWS_DATE_FROM_FILENAME"] == "YES":
                             d = _get_date_from_filename(x, mode="record")
-                nfRecords.append(x+"\t"+d+"\t"+sF+"\t"+hF)
-            if fTL: # Check for matching file names
-                if x in fT:
-                    for o in fTL:
-                        if o.split("\t", 1)[0] == x:
-                            fT = re.sub(r"(?m)^"+x+r"\t.+?\n", "", fT)
-                            recordsDeleted = True
-                            break # Only one match possible
-                    else: # No break
-                        _data_file_corrupted_quit(CD["siteFolder"])
-        if recordsDeleted:
-            with open(qnrDataPath, mode="w") as f: f.write(fT)
-        rT = "\n".join(nfRecords)
-        if rT[-1] != "\n": rT += "\n"
-        with open(qnrDataPath, mode="a") as f: f.write(rT)
-    
-    def _record_news_images(imgFiles, qnrDataPath):
+                qnrRS.put(DataRecord(x, d, sF, hF, tF))
+    
+    def _record_news_images(imgFiles, qnrRS):
         """
         Record news image files in quicknr_data.txt as tab-delimited fields if image
         is new or, if changed in size, overwrite pre-existing record of same name
@@ -1986,67 +3783,500 @@ def Quicknr():
         
         """
         d = dt.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        nfRecords = []
-        recordsDeleted = False
-        with open(qnrDataPath, mode="r") as f: fT = f.read()
-        fTL = fT.splitlines()[1:]
         for x in imgFiles:
-            filePath = os.path.join(CD["siteDir"], x)
-            sF = os.path.getsize(filePath) # Bytes
+            sF = siteSnap.stat(x).st_size # Bytes
             if CD["FILE_SIZE_LIMIT"] and sF > 1100000:
                 _say_error( "Error: File '"+x+"' is over 1MB in size,\n" + \
                             "         too large for publication.\n" + \
                             "       Reduce the size to under 1MB and try again.\n" + \
                             "       Quit.")
-            if x not in fT:
-                nfRecords.append(x+"\t"+d+"\t"+str(sF)+"\tNOTUP")
-            else: # Check for matching file name and changed size
-                for o in fTL:
-                    if o.split("\t")[0] == x:
-                        if o.split("\t")[2] != str(sF):
-                            nfRecords.append(x+"\t"+d+"\t"+str(sF)+"\tNOTUP")
-                            fT = re.sub(r"(?m)^"+x+r"\t.+?\n", "", fT)
-                            recordsDeleted = True
-                        break # Only one name match is possible
-                else: # No break
-                    _data_file_corrupted_quit(CD["siteFolder"])
-        if nfRecords:
-            if recordsDeleted:
-                with open(qnrDataPath, mode="w") as f: f.write(fT)
-            rT = "\n".join(nfRecords)
-            if rT[-1] != "\n": rT += "\n"
-            with open(qnrDataPath, mode="a") as f: f.write(rT)
-    
-    def _get_records_to_upload(qnrDataPath):
-        """
-        Looks for data file records of files to upload and returns them
-        Records of any non-existent files are removed from the data file
+            rec = qnrRS.get(x)
+            if not rec or rec.size != str(sF): # New, or changed in size
+                qnrRS.put(DataRecord(x, d, str(sF), upState="NOTUP"))
+    
+    def _precompress_files(qnrRS):
+        """
+        Writes compressed copies of the HTML, CSS, Javascript and SVG files in
+        "public_html", for servers that send them in place of the files: ".gz"
+        files, and ".br" files if the brotli module is available. With the
+        PRECOMPRESS setting of NO, removes the copies written before instead.
+        Returns True if any copies were written or removed
+        
+        A file is only read when its stat data differ from its record in the
+        file "quicknr_compressed.txt", and only compressed again when its hash
+        differs too, or a copy is missing. Copies written are recorded in the
+        data file as not uploaded, as news images are. Copies of files no
+        longer there are removed with their records, and so are ".br" files
+        without the module
+        
+        Record format: filepath,hash,stat
+        
+        filepath - file compressed, relative to website folder
+        hash - BLAKE2 digest of the file when compressed
+        stat - stat data of the file when last checked, see _stat_data()
+        
+        """
+        xts = [".html", ".htm", ".css", ".js", ".svg"]
+        variantsL = [".gz", ".br"] if brotliModule else [".gz"]
+        if CD["PRECOMPRESS"] != "YES": variantsL = []
+        compPath = os.path.join(CD["siteDir"], "quicknr_private/quicknr_compressed.txt")
+        if not variantsL and not os.path.exists(compPath): return False
+        oldD = {}
+        with suppress(OSError):
+            with open(compPath, mode="r") as f:
+                for x in f.read().splitlines()[1:]:
+                    xL = x.split("\t")
+                    if len(xL) == 3: oldD[xL[0]] = xL[1:]
+        d = dt.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        recordsD = {}
+        changed = False
+        for dp, dns, fns in siteSnap.walk("public_html") if variantsL else []:
+            for fn in fns:
+                if os.path.splitext(fn)[1] not in xts: continue
+                fP = os.path.relpath(os.path.join(dp, fn), CD["siteDir"])
+                statData = _stat_data(siteSnap.stat(fP))
+                rec = oldD.get(fP)
+                have = all(siteSnap.exists(fP + v) for v in variantsL)
+                if rec and rec[1] == statData and have:
+                    recordsD[fP] = rec
+                    continue
+                with open(os.path.join(CD["siteDir"], fP), mode="rb") as f: fB = f.read()
+                fH = hashlib.blake2b(fB, digest_size=20).hexdigest()
+                recordsD[fP] = [fH, statData]
+                if rec and rec[0] == fH and have: continue
+                # --------------------- Compress, with no name or time in gzip header
+                for v in variantsL:
+                    if v == ".gz":
+                        buf = io.BytesIO()
+                        with gzip.GzipFile(fileobj=buf, mode="wb", mtime=0) as gf: gf.write(fB)
+                        cB = buf.getvalue()
+                    else: cB = brotli.compress(fB)
+                    with open(os.path.join(CD["siteDir"], fP + v), mode="wb") as f: f.write(cB)
+                    qnrRS.put(DataRecord(fP + v, d, str(len(cB)), upState="NOTUP"))
+                changed = True
+        # --------------------- Remove copies of files gone, and out of date ".br"
+        for fP in set(oldD) | set(recordsD):
+            for v in [".gz", ".br"]:
+                if fP in recordsD and v in variantsL: continue
+                if siteSnap.exists(fP + v):
+                    with suppress(FileNotFoundError): os.remove(os.path.join(CD["siteDir"], fP + v))
+                    changed = True
+                qnrRS.remove(fP + v)
+        if not variantsL:
+            with suppress(FileNotFoundError): os.remove(compPath)
+            return changed
+        dL = [CD["siteFolder"]] + ["\t".join([k] + recordsD[k]) for k in sorted(recordsD)]
+        with open(compPath, mode="w") as f: f.write("\n".join(dL) + "\n")
+        return changed
+    
+    def _user_function_sources():
+        """
+        Returns dict of the names of functions (and classes) defined in 
+        "user_functions.py" and their source text, each preceded by the module 
+        code outside any definition, which all functions may depend on, and
+        followed by the source text of the other functions it names, and of
+        those they name in turn, in their order in the file
+        
+        Returns empty dict if the file cannot be parsed
         
         """
-        recordsToUpload = []; recordsDeleted = False
-        with open(qnrDataPath, mode="r") as f: fT = f.read()
-        for x in fT.splitlines()[1:]:
-            if os.path.exists(os.path.join(CD["siteDir"], x.split("\t", 1)[0])):
-                if "\tNOTUP" in x:
-                    recordsToUpload.append(x)
+        with open(os.path.join(CD["siteDir"], "config/user_functions.py"), mode="r") as f:
+            ufT = f.read()
+        try:
+            nodes = ast.parse(ufT).body
+        except SyntaxError:
+            return {} # Error will be reported on conversion
+        ufTL = ufT.splitlines(keepends=True)
+        ufD = OrderedDict(); namesD = {}; commonT = ""
+        for n in nodes:
+            # Lines of top level statement, including decorators, not comments after
+            start = min([n.lineno] + [d.lineno for d in getattr(n, "decorator_list", [])])
+            t = "".join(ufTL[start-1:n.end_lineno])
+            if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                ufD[n.name] = t
+                namesD[n.name] = {x.id for x in ast.walk(n) if isinstance(x, ast.Name)}
             else:
-                fT = fT.replace("\n"+x, "")
-                recordsDeleted = True
-        if recordsDeleted:
-            with open(qnrDataPath, mode="w") as f: f.write(fT)
-        return recordsToUpload
+                commonT += t
+        sourcesD = {}
+        for k in ufD:
+            # Functions named, followed to those they name
+            usedS = {k}; nameL = [k]
+            while nameL:
+                for x in namesD[nameL.pop()]:
+                    if x in ufD and x not in usedS:
+                        usedS.add(x)
+                        nameL.append(x)
+            sourcesD[k] = commonT + ufD[k] + "".join(ufD[x] for x in ufD if x in usedS and x != k)
+        return sourcesD
+    
+    def _input_hashes(inputs):
+        """
+        Returns dict of inputs and hexadecimal digests of their current contents
+        
+        Inputs are named by kind and name: "import:file-name" for import files,
+        "snippet:HTML_HEAD" or "snippet:HTML_TAIL" for configuration snippets,
+        "config:group-name" for groups of other settings (see SiteConfig) and 
+        "python:function-name" for user functions. Missing inputs get the
+        digest "missing"
+        
+        """
+        hD = {}; ufD = None
+        for x in inputs:
+            kind, name = x.split(":", maxsplit=1)
+            b = None
+            if kind == "import":
+                with suppress(OSError):
+                    with open(os.path.join(CD["siteDir"], "config/import/"+name), mode="rb") as f:
+                        b = f.read()
+            elif kind == "snippet":
+                if name in CD: b = CD[name].encode()
+            elif kind == "config":
+                if name in SiteConfig.GROUPS: b = CD["siteConfig"].fingerprint(name).encode()
+            elif kind == "python":
+                if ufD is None: ufD = _user_function_sources()
+                if name in ufD: b = ufD[name].encode()
+            hD[x] = hashlib.md5(b).hexdigest() if b is not None else "missing"
+        return hD
+    
+    def _read_dependencies():
+        """
+        Returns dict of source paths and the lists of inputs they depend on, and
+        dict of inputs and their digests when last recorded, from the 
+        dependencies file "quicknr_dependencies.txt"
+        
+        Record format: filepath,input,input... or =input,hash
+        
+        filepath - source file, relative to website folder
+        input - kind and name of input, see _input_hashes()
+        hash - hexadecimal digest of input contents
+        
+        """
+        depsD = {}; hashesD = {}
+        depsPath = os.path.join(CD["siteDir"], "quicknr_private/quicknr_dependencies.txt")
+        if not os.path.exists(depsPath): return depsD, hashesD
+        with open(depsPath, mode="r") as f:
+            for x in f.read().splitlines()[1:]:
+                xL = x.split("\t")
+                if x.startswith("="):
+                    if len(xL) == 2: hashesD[xL[0][1:]] = xL[1]
+                elif xL[0]:
+                    depsD[xL[0]] = xL[1:]
+        return depsD, hashesD
+    
+    def _record_dependencies(depsD):
+        """
+        Records the inputs that converted sources depend on in the dependencies
+        file, replacing their previous records, and the current digests of all
+        recorded inputs. Records of non-existent sources are removed
+        
+        """
+        oldDepsD = _read_dependencies()[0]
+        oldDepsD.update(depsD)
+        depsD = {k: v for k, v in oldDepsD.items() \
+                                if os.path.exists(os.path.join(CD["siteDir"], k))}
+        hashesD = _input_hashes(sorted({y for x in depsD.values() for y in x}))
+        dL = [CD["siteFolder"]]
+        dL.extend(["\t".join([k] + depsD[k]) for k in sorted(depsD)])
+        dL.extend(["=" + k + "\t" + hashesD[k] for k in sorted(hashesD)])
+        depsPath = os.path.join(CD["siteDir"], "quicknr_private/quicknr_dependencies.txt")
+        with open(depsPath, mode="w") as f: f.write("\n".join(dL) + "\n")
+    
+    def _get_dependent_sources(sourcePaths):
+        """
+        Returns sorted list of those full source paths whose recorded inputs 
+        (imports, settings and user functions) have changed since recorded
+        
+        """
+        depsD, hashesD = _read_dependencies()
+        if not hashesD: return []
+        currentD = _input_hashes(sorted(hashesD))
+        changed = {x for x in hashesD if currentD[x] != hashesD[x]}
+        if not changed: return []
+        return sorted([x for x in sourcePaths if \
+                    changed.intersection(depsD.get(os.path.relpath(x, CD["siteDir"]), []))])
+    
+    def _get_records_to_upload(qnrRS):
+        """
+        Looks for data file records of files to upload and returns their paths
+        Records of any non-existent files are removed from the data file
+        
+        """
+        for x in qnrRS:
+            if not siteSnap.exists(x.path): qnrRS.remove(x.path)
+        return qnrRS.to_upload()
+    
+    def _ftp_connect():
+        """
+        Returns FTP connection to the server, logged in and set up as configured
+        
+        """
+        # Port 21, unless given after the server name
+        ftpHost, ftpPort = re.match(r"(.*?)(?::(\d+))?\Z", CD["FTP_SERVER"]).groups()
+        fc = ftp.FTP()
+        try:
+            fc.connect(ftpHost, int(ftpPort or ftp.FTP_PORT))
+            fc.login(CD["FTP_USERNAME"], CD["FTP_PASSWORD"], CD["FTP_ACCT"])
+        except:
+            fc.close()
+            raise
+        if CD["FTP_PASSIVE"] == "NO":
+            fc.set_pasv(False) # Active mode
+        if CD["FTP_DEBUG"] == "1" or CD["FTP_DEBUG"] == "2":
+            fc.set_debuglevel(CD["siteConfig"].FTP_DEBUG)
+        fc.voidcmd("TYPE I") # Binary, set once for all transfers, see _ftp_store()
+        return fc
+    
+    def _ftp_store(fc, fN, f):
+        """
+        Stores file object f as fN in the current server folder, as storbinary()
+        would, but without setting binary type again, a round trip per file
+        
+        """
+        with fc.transfercmd("STOR "+fN) as conn:
+            while True:
+                buf = f.read(8192)
+                if not buf: break
+                conn.sendall(buf)
+        fc.voidresp()
+    
+    def _ftp_subfolders(fP):
+        """
+        Returns list of the server sub-folders of file path, relative to siteDir
+        
+        """
+        fD = os.path.dirname(fP)
+        subDs = []; splitfD = [fD]
+        if os.path.split(fD)[0]: # Head and tail, slash char in fD
+            while True:
+                splitfD = os.path.split(splitfD[0])
+                if splitfD[0]: subDs.append(splitfD[1])
+                else: break
+            subDs.reverse()
+        return subDs
     
-    def _manage_server_files(recordsToUse, workMode, qnrDataPath):
+    def _server_key(root):
+        """ Returns the user, server and FTP_PATH folder path root, as one line """
+        return "{}@{}\t{}".format(CD["FTP_USERNAME"], CD["FTP_SERVER"], root)
+    
+    def _read_server_dirs(root):
+        """
+        Returns set of the server folders, relative to the FTP_PATH folder of
+        path root, known to exist from earlier uploads to the server, as
+        recorded in the file "quicknr_server_dirs.txt", empty if recorded for
+        another server
+        
+        """
+        dirsPath = os.path.join(CD["siteDir"], "quicknr_private/quicknr_server_dirs.txt")
+        with suppress(OSError):
+            with open(dirsPath, mode="r") as f: dL = f.read().splitlines()
+            if dL and dL[0] == _server_key(root): return set(dL[1:])
+        return set()
+    
+    def _record_server_dirs(root, dirs):
+        """
+        Records the server folders known to exist, see _read_server_dirs()
+        
+        """
+        dirsPath = os.path.join(CD["siteDir"], "quicknr_private/quicknr_server_dirs.txt")
+        with open(dirsPath, mode="w") as f:
+            f.write("\n".join([_server_key(root)] + sorted(dirs)) + "\n")
+    
+    def _list_server_files(fc, root):
+        """
+        Returns dict of the files in the FTP_PATH folder tree, of path root,
+        by path relative to siteDir, with 2-item lists of their size and
+        modification time in seconds, None if not known, and set of the server
+        folders found, relative to root
+        
+        Each folder is listed once, with MLSD, or with LIST if the server has
+        no MLSD. LIST times are in the server's time zone, to the minute at
+        best, and are not kept
+        
+        """
+        unixRE = re.compile(r"([-dl])\S*\s+(?:\S+\s+){1,3}?(\d+)\s+\w{3}\s+\d{1,2}\s+[\d:]{4,5}\s(.*)\Z")
+        dosRE = re.compile(r"\d\d-\d\d-\d{2,4}\s+\d\d?:\d\d[AaPp][Mm]\s+(<DIR>|\d+)\s+(.*)\Z")
+        def _list(path):
+            """ Returns list of names and dicts of their MLSD facts, from LIST """
+            linesL = []
+            fc.retrlines("LIST " + path, linesL.append)
+            entriesL = []
+            for x in linesL:
+                mo = unixRE.match(x)
+                if mo:
+                    kind = {"-": "file", "d": "dir"}.get(mo.group(1), "") # Links left out
+                    entriesL.append((mo.group(3), {"type": kind, "size": mo.group(2)}))
+                    continue
+                mo = dosRE.match(x)
+                if mo:
+                    if mo.group(1) == "<DIR>": entriesL.append((mo.group(2), {"type": "dir"}))
+                    else: entriesL.append((mo.group(2), {"type": "file", "size": mo.group(1)}))
+            return entriesL
+        filesD = {}; dirsS = set()
+        mlsd = True
+        stack = [""]
+        while stack:
+            d = stack.pop()
+            path = root.rstrip("/") + "/" + d if d else root
+            entriesL = None
+            if mlsd:
+                try: entriesL = list(fc.mlsd(path, ["type", "size", "modify"]))
+                except ftp.error_perm as e:
+                    if str(e)[:3] not in ("500", "501", "502", "504"): raise
+                    mlsd = False # Not implemented
+            if entriesL is None: entriesL = _list(path)
+            for name, factsD in entriesL:
+                if name in (".", "..") or "/" in name: continue
+                rP = d + "/" + name if d else name
+                kind = factsD.get("type", "").lower()
+                if kind == "dir":
+                    dirsS.add(rP)
+                    stack.append(rP)
+                elif kind == "file":
+                    size = mtime = None
+                    with suppress(KeyError, ValueError): size = int(factsD["size"])
+                    with suppress(KeyError, ValueError): # UTC, fraction of seconds left out
+                        mtime = dt.datetime.strptime(factsD["modify"][:14], "%Y%m%d%H%M%S")\
+                                .replace(tzinfo=dt.timezone.utc).timestamp()
+                    filesD[os.path.join("public_html", *rP.split("/"))] = [size, mtime]
+        return filesD, dirsS
+    
+    def _compare_server_files(fc, root, localFiles, qnrRS):
+        """
+        Returns list of the local files, relative to siteDir, that differ from
+        the server copy, and sorted list of the server files not found locally
+        
+        A file differs if not on the server, if the size of the server copy is
+        not the same, if it has changed since the server copy was made, or if
+        it is marked as not uploaded in the data file. The server folders
+        found are recorded for the upload, see _read_server_dirs()
+        
+        """
+        print("  Listing files on server ...", end="")
+        serverD, dirsS = _list_server_files(fc, root)
+        print(" {} files found.".format(len(serverD)))
+        _record_server_dirs(root, dirsS)
+        notUpS = set(qnrRS.to_upload())
+        differL = []
+        for x in localFiles:
+            size, mtime = serverD.get(x, [None, None])
+            st = siteSnap.stat(x)
+            if x in notUpS or size != st.st_size or mtime is not None and int(st.st_mtime) > mtime:
+                differL.append(x)
+        localS = set(localFiles)
+        return differL, sorted(x for x in serverD if x not in localS)
+    
+    def _upload_files(fc, root, recordsToUse, qnrRS):
+        """
+        Uploads files over a pool of up to FTP_CONNECTIONS connections, fc in
+        the FTP_PATH folder, of path root, the first, and marks each as
+        uploaded in the data file as soon as it is done, in the journal
+        
+        Files are grouped by server folder. Folders not known to exist from
+        earlier uploads are made first, over fc, and a connection enters a
+        folder once, to upload all the files of it not yet taken by others,
+        largest first. It then goes on to the folder with the largest file
+        left, so that large files don't all end up last on one connection.
+        Additional connections the server refuses are done without. A failed
+        upload is raised once the other connections have stopped
+        
+        Upload states are flushed to the journal at most once a second, and
+        once more at the end, so a crash loses at most the last second of
+        them, and the connections don't wait on a synced write per file
+        
+        """
+        knownS = _read_server_dirs(root)
+        enteredS = set() # Folders entered, found or made
+        sizesD = {}
+        for x in recordsToUse:
+            with suppress(OSError): sizesD[x] = os.path.getsize(os.path.join(CD["siteDir"], x))
+        groupsD = OrderedDict() # Paths by server folder, largest first
+        for x in sorted(recordsToUse, key=lambda x: -sizesD.get(x, 0)):
+            groupsD.setdefault("/".join(_ftp_subfolders(x)), deque()).append(x)
+        def _parents(d):
+            """ Returns list of folder d and the folders it is in, top first """
+            dL = d.split("/")
+            return ["/".join(dL[:i+1]) for i in range(len(dL))] if d else []
+        def _path(d):
+            return root.rstrip("/") + "/" + d if d else root
+        # --------------------- Make missing folders, parents first
+        for d in sorted({y for x in groupsD for y in _parents(x)} - knownS):
+            with suppress(ftp.error_perm): fc.mkd(_path(d)) # Error if already there
+        failed = threading.Event()
+        lock = threading.Lock()
+        recordLock = threading.Lock() # Records and journal, kept apart from the queue
+        flushedL = [time.monotonic()] # Time of the last flush
+        def _next_file(d):
+            """ Returns (folder, path) of the next file, in folder d if any left """
+            with lock:
+                if d not in groupsD:
+                    if not groupsD: return None
+                    d = max(groupsD, key=lambda x: sizesD.get(groupsD[x][0], 0))
+                fP = groupsD[d].popleft()
+                if not groupsD[d]: del groupsD[d]
+                return d, fP
+        def _mark_uploaded(fP=None):
+            """ Marks file fP as uploaded, flushing if due, or flushes if fP is None """
+            with recordLock:
+                rec = qnrRS.get(fP) if fP else None
+                if rec and rec.upState: # Separate out argparse files
+                    qnrRS.update(fP, upState="UP")
+                if fP and time.monotonic() - flushedL[0] < 1: return
+                conflicts = qnrRS.flush()
+                flushedL[0] = time.monotonic()
+            for x in conflicts:
+                with lock: print("  File '{}' changed by another process, not marked as uploaded.".format(x))
+        def _upload_queued(wfc, d=None):
+            """ Uploads files until there are none left or one failed, d the folder """
+            try:
+                while not failed.is_set():
+                    nextFile = _next_file(d)
+                    if not nextFile: break
+                    if nextFile[0] != d:
+                        d = nextFile[0]
+                        try: wfc.cwd(_path(d))
+                        except ftp.error_perm: # Deleted since known
+                            for x in _parents(d):
+                                with suppress(ftp.error_perm): wfc.mkd(_path(x))
+                            wfc.cwd(_path(d))
+                        enteredS.add(d)
+                    fP = nextFile[1]
+                    with open(os.path.join(CD["siteDir"], fP), mode="rb") as uf:
+                        _ftp_store(wfc, os.path.basename(fP), uf)
+                    with lock: print("  Uploading file '{}' ... Done.".format(fP))
+                    _mark_uploaded(fP)
+            except:
+                failed.set()
+                raise
+        def _connect_upload():
+            """ Uploads files over a new connection, if the server allows it """
+            try: wfc = _ftp_connect()
+            except ftp.all_errors as e:
+                with lock: print("  Additional FTP connection not made: {}".format(e))
+                return
+            with wfc: _upload_queued(wfc)
+        workers = max(1, min(CD["siteConfig"].FTP_CONNECTIONS, len(recordsToUse)))
+        with ThreadPoolExecutor(workers) as ex:
+            futuresL = [ex.submit(_upload_queued, fc, "")]
+            futuresL.extend(ex.submit(_connect_upload) for i in range(workers - 1))
+        _mark_uploaded() # Upload states left since the last flush
+        _record_server_dirs(root, knownS | {y for x in enteredS for y in _parents(x)})
+        for x in futuresL: x.result() # Raises the first failure
+    
+    def _manage_server_files(recordsToUse, workMode, qnrRS):
         """
         If workMode = "upload"
             uploads files to server and updates data file
-            recordsToUse are expected to be data records
-                or file paths relative to siteDir
+            recordsToUse are expected to be file paths relative to siteDir
         
         If workMode = "delete"
             deletes files
             recordsToUse are expected to be file paths relative to siteDir
         
+        If workMode = "sync"
+            lists server files and returns the files that differ from them, and
+            the server files not found locally, see _compare_server_files()
+            recordsToUse are expected to be file paths relative to siteDir
+        
         """
         if not CD["FTP_SERVER"] or not CD["FTP_USERNAME"] or not CD["FTP_PATH"]:
             _say_error( "Error: No FTP server or username or path set in configuration.\n"
@@ -2054,94 +4284,52 @@ def Quicknr():
         if not CD["FTP_PASSWORD"]:
             CD["FTP_PASSWORD"] = getpass.getpass("Enter your FTP password (or Q to quit): ")
             if not CD["FTP_PASSWORD"] or CD["FTP_PASSWORD"] in "qQ": _say_quit()
-        with open(qnrDataPath, mode="r") as f: fT = f.read()
         print("Connecting to FTP server: {}".format(CD["FTP_SERVER"]))
         try:
-            with ftp.FTP(CD["FTP_SERVER"],CD["FTP_USERNAME"],CD["FTP_PASSWORD"],CD["FTP_ACCT"]) as fc:
+            with _ftp_connect() as fc:
                 # --------------------- Start FTP connection
-                if CD["FTP_PASSIVE"] == "NO":
-                    fc.set_pasv(False) # Active mode
-                if CD["FTP_DEBUG"] == "1" or CD["FTP_DEBUG"] == "2":
-                    fc.set_debuglevel(int(CD["FTP_DEBUG"]))
                 print("\n"+fc.getwelcome())
                 # Will throw error if path does not exist, cannot create dir
                 fc.cwd(CD["FTP_PATH"])
-                print("\n"+fc.pwd())
-                fc.dir(); print("")
-                for x in recordsToUse:
-                    if workMode == "upload":
-                        if x in fT: fP = x.split("\t", 1)[0]
-                        else: fP = x[:] # Copy
-                    elif workMode == "delete":
-                        fP = x[:]
-                    fN = os.path.basename(fP); fD = os.path.dirname(fP)
-                    # --------------------- Get sub-folders
-                    subDs = []; splitfD = [fD]
-                    if os.path.split(fD)[0]: # Head and tail, slash char in fD
-                        while True:
-                            splitfD = os.path.split(splitfD[0])
-                            if splitfD[0]: subDs.append(splitfD[1])
-                            else: break
-                        subDs.reverse()
-                        for a in subDs:
-                            try: fc.cwd(a)
-                            except:
-                                if workMode == "upload":
-                                    fc.mkd(a)
-                                    fc.cwd(a)
-                                elif workMode == "delete":
-                                    fc.quit()
-                                    _say_error( "Error: Directory '"+a+"' not found on server.\n"+\
-                                                "       File '"+x+"' not deleted.\n"+\
-                                                "       Quit.\n")
-                    print("\n"+fc.pwd())
-                    if workMode == "upload":
-                        # --------------------- Upload
-                        print("  Uploading file '{}' ...".format(fP), end="")
-                        with open(os.path.join(CD["siteDir"], fP), mode="rb") as uf:
-                            fc.storbinary("STOR "+fN, uf)
-                            print(" Done.")
-                    elif workMode == "delete":
-                        # --------------------- Delete
-                        print("  Deleting file '{}' ...".format(fP), end="")
-                        fc.delete(fN)
+                root = fc.pwd()
+                print("\n"+root+"\n")
+                if workMode == "upload":
+                    # --------------------- Upload
+                    _upload_files(fc, root, recordsToUse, qnrRS)
+                elif workMode == "delete":
+                    for x in recordsToUse:
+                        # --------------------- Delete, by path from root
+                        print("  Deleting file '{}' ...".format(x), end="")
+                        try: fc.delete("/".join(_ftp_subfolders(x) + [os.path.basename(x)]))
+                        except ftp.error_perm as e:
+                            fc.quit()
+                            _say_error( "Error: File '"+x+"' not deleted: "+str(e)+"\n"+\
+                                        "       Quit.\n")
                         print(" Done.")
-                    if subDs: fc.cwd("../"*len(subDs))
-                    if workMode == "upload":
-                        # --------------------- Update data file
-                        if x in fT and "\t" in x: # Separate out argparse files
-                            parts = fT.partition(x) # x is whole line from record
-                            fT = parts[0]+parts[1].rsplit("\t", 1)[0]+"\tUP"+parts[2]
+                elif workMode == "sync":
+                    # --------------------- List server files, and compare
+                    syncResult = _compare_server_files(fc, root, recordsToUse, qnrRS)
         except Exception as e:
             print(e) # No need for full trace, just print the error
             _say_quit()
         else:
             if workMode == "upload":
-                with open(qnrDataPath, mode="w") as f: f.write(fT)
                 print("\nUploading completed.")
             elif workMode == "delete":
                 print("\nFile deletion from server completed.")
+            elif workMode == "sync":
+                return syncResult
     
-    def _mark_all_changed(wdT):
+    def _mark_all_changed(wdataRS):
         """
         Marks all source files in data record as changed, to be converted again
+        The change is made to the records in memory only
         
         """
-        wL = wdT.splitlines()
-        if not wL[-1]: wL = wL[:-1] # Drop empty line at end
-        if len(wL) < 2:
-            return wdT # No record of files
         xts = [".txt", ".mdml", ".html", ".php", ".htm"]
-        changed = False
-        for i, x in enumerate(wL):
-            if i > 0 and "\t" in x: # Skip first line, site folder name
-                xL = x.split("\t")
-                if re.match(r".?page_sources", xL[0]) and os.path.splitext(xL[0])[1] in xts:
-                    # Change recorded file size to 0
-                    wL[i] = xL[0] + "\t" + xL[1] + "\t0\t" + "\t".join(xL[3:])
-                    changed = True
-        if changed: return "\n".join(wL) + "\n"
-        else: return wdT
+        for x in wdataRS:
+            if re.match(r".?page_sources", x.path) and os.path.splitext(x.path)[1] in xts:
+                x.size = "0" # Change recorded file size to 0
     
     def _get_files_for_upload(mode):
         """
@@ -2156,12 +4344,12 @@ def Quicknr():
         elif mode == "img": subPath = "public_html/res/img"
         else: return None
         rPaths = []
-        for dp, dns, fns in os.walk(os.path.join(CD["siteDir"], subPath)):
+        for dp, dns, fns in siteSnap.walk(subPath):
             for fn in fns:
                 rPaths.append(os.path.relpath(os.path.join(dp, fn), CD["siteDir"]))
         return rPaths
     
-    def _check_file_folder_names():
+    def _check_file_folder_names(relPaths=None):
         """
         Checks that all files in the website folder have file extensions
         and no spaces or html <>&"' characters in their names
@@ -2169,9 +4357,33 @@ def Quicknr():
         Conversely, checks that folders have no spaces, html characters and 
         no extensions
         
+        If a list of file paths relative to the website folder is given, only
+        those files are checked. Otherwise, the website snapshot is checked, 
+        skipping folders whose modification time is as recorded in the file
+        "quicknr_dirs.txt" when last found valid, as their names are unchanged
+        
         """
         fpL = []; spL = []; dxL = []; dsL = []; fhL = []; dhL = []
-        for dp, dn, fns in os.walk(CD["siteDir"]):
+        dirsPath = os.path.join(CD["siteDir"], "quicknr_private/quicknr_dirs.txt")
+        if relPaths is None:
+            checkedD = {} # Folder paths and modification times when last valid
+            with suppress(OSError):
+                with open(dirsPath, mode="r") as f:
+                    for x in f.read().splitlines()[1:]:
+                        xL = x.rsplit("\t", 1)
+                        if len(xL) == 2: checkedD[xL[0]] = xL[1]
+            dirMtimesD = siteSnap.dir_mtimes()
+            walkL = []
+            for dp, dn, fns in siteSnap.walk():
+                rd = os.path.relpath(dp, CD["siteDir"])
+                if rd == ".": rd = ""
+                # Names in a folder are unchanged while its modification time is
+                if checkedD.get(rd) != str(dirMtimesD.get(rd)):
+                    walkL.append((dp, dn, fns))
+        else:
+            walkL = [(os.path.join(CD["siteDir"], os.path.dirname(x)), [], [os.path.basename(x)]) 
+                                                                            for x in relPaths]
+        for dp, dn, fns in walkL:
             for d in dn:
                 if " " in d:
                     dsL.append(os.path.relpath(os.path.join(dp, d), CD["siteDir"]))
@@ -2223,30 +4435,25 @@ def Quicknr():
                         "           {}\n\n"
                         "       Fix and try again.\n"
                         "       Quit.".format(CD["siteFolder"],sp))
+        if relPaths is None: # All valid, record the folders as checked
+            with open(dirsPath, mode="w") as f:
+                f.write(CD["siteFolder"] + "\n")
+                for d in sorted(dirMtimesD): f.write(d + "\t" + str(dirMtimesD[d]) + "\n")
     
-    def _get_news_file_list(qnrDataPath):
+    def _get_news_file_list(qnrRS):
         """
         Returns list of 2-item lists of news date and HTML files, 
         matching sources from record, sorted by date
         
         """
-        with open(qnrDataPath, mode="r") as f: fT = f.read()
         nfL = [] # List of 2-item lists of news date and HTML file rel URL
-        for line in fT.splitlines()[1:]:
-            pfP = line.split("\t", maxsplit=1)[0]
-            if re.match(r".?page_sources", pfP) and os.path.split(os.path.dirname(pfP))[1] == "news":
-                # We allow Markdown files for any future compatibility
-                if os.path.splitext(pfP)[1] in [".txt", ".mdml"]:
-                    x = os.path.join(CD["siteDir"], pfP)
-                    wD = _get_file_record_date(x, fT)
-                    xbn = os.path.splitext(os.path.basename(x))[0] # No extension
-                    for y in fT.splitlines()[1:]:
-                        ypfP = y.split("\t", maxsplit=1)[0]
-                        if re.match(r".?public_html", ypfP) and os.path.split(os.path.dirname(ypfP))[1] == "news":
-                            ybn = os.path.splitext(os.path.basename(ypfP))[0] # No ext
-                            if ybn == xbn: # HTML file name matches txt source
-                                nfL.append([wD.strftime("%Y-%m-%d_%H-%M-%S"), os.path.basename(ypfP)])
-                                break
+        for rec in qnrRS.news_sources():
+            # We allow Markdown files for any future compatibility
+            if os.path.splitext(rec.path)[1] in [".txt", ".mdml"]:
+                hRec = qnrRS.counterpart(rec.path) # HTML file converted from source
+                if hRec:
+                    wD = _get_file_record_date(os.path.join(CD["siteDir"], rec.path), qnrRS)
+                    nfL.append([wD.strftime("%Y-%m-%d_%H-%M-%S"), os.path.basename(hRec.path)])
         nfL.sort()
         return nfL
     
@@ -2256,16 +4463,261 @@ def Quicknr():
         
         """
         for x in fList:
-            if "\t" in x: x = x.split("\t", maxsplit=1)[0]
             if os.path.split(os.path.dirname(x))[1] == "news" or \
                         os.path.splitext(os.path.basename(x))[0] == "news":
                 return True
         return False
     
     
+    def _convert_and_record(sourcesDirs, htmlDirs, sLxNC, qnrRS, jobs=1):
+        """
+        Converts the new and changed sources to HTML, records the converted 
+        files in the data file and their inputs in the dependencies file and, 
+        if news were converted, updates the list of news files in 
+        "res/js/news.js"
+        
+        """
+        nonlocal updateNewsList
+        
+        # Check for news items to be converted, then set "news.txt" to update too
+        updateNewsList = False
+        for x in sLxNC:
+            if os.path.split(os.path.dirname(x))[1] == "news":
+                updateNewsList = True
+                break
+        convertedFiles, depsD = _convert_sources_to_html(sourcesDirs,htmlDirs,sLxNC,qnrRS,jobs)
+        if convertedFiles: _record_new_files(convertedFiles, qnrRS)
+        if depsD: _record_dependencies(depsD)
+        # Records must be updated by this point, and they are
+        # If news were updated, update res/js/news.js for dynamic prev/next links
+        if updateNewsList:
+            # Get list of news files from record, sorted by date
+            newsFL = _get_news_file_list(qnrRS)
+            # Write file list to res/js/news.js
+            if newsFL:
+                jsfP = os.path.join(CD["siteDir"], "public_html/res/js/news.js")
+                jsfT = ""
+                if os.path.exists(jsfP): # If no news.js, its function must be elsewhere
+                    with open(jsfP, mode="r") as f:
+                        jsfT = f.read()
+                        jsfT = jsfT.split("//==DO_NOT_EDIT_THIS_LINE", maxsplit=1)[1]
+                for i,x in enumerate(newsFL):
+                    if not i: jsfT = '"'+x[1]+'"];\n\n//==DO_NOT_EDIT_THIS_LINE'+jsfT
+                    else: jsfT = '"' + x[1] + '", ' + jsfT
+                jsfT = '\nvar news_files_list = [' + jsfT
+                jsfT = '\nvar news_list_items = ' + CD["NEWS_LIST_ITEMS"] + ';' + jsfT
+                jsfT = '\nvar news_next_link_text = "' + CD["NEWS_NEXT_LINK"] + '";' + jsfT
+                jsfT = '\nvar news_prev_link_text = "' + CD["NEWS_PREV_LINK"] + '";' + jsfT
+                with open(jsfP, mode="w") as f: f.write(jsfT)
+    
+    def _watch_sources(sourcesDirs, htmlDirs, qnrDataPath, jobs=1):
+        """
+        Watch mode: keeps polling the sources, import files, "config.txt" and
+        "user_functions.py" of the website, converting only the sources that 
+        are affected by each change, without prompts. Runs until Ctrl-C
+        
+        A changed import, configuration or user functions file affects the 
+        sources recorded as using the changed file, settings or function in 
+        the dependencies file. Sources without a record are affected by any 
+        configuration or user functions change, and by import files named for
+        them by the import naming convention ("all", "newspost" or the source
+        name)
+        
+        """
+        nonlocal CD
+        
+        configPath = os.path.join(CD["siteDir"], "config/config.txt")
+        userFunctionsPath = os.path.join(CD["siteDir"], "config/user_functions.py")
+        importDir = os.path.join(CD["siteDir"], "config/import")
+        xts = [".txt", ".mdml", ".html", ".php", ".htm"]
+        
+        def _watch_state():
+            """ Returns dict of watched file paths and their (mtime, size) """
+            wD = {}
+            for d in sourcesDirs + [importDir]:
+                with suppress(OSError):
+                    for e in os.scandir(d):
+                        if e.is_file() and (d == importDir or os.path.splitext(e.name)[1] in xts):
+                            st = e.stat()
+                            wD[e.path] = (st.st_mtime_ns, st.st_size)
+            for x in [configPath, userFunctionsPath]:
+                with suppress(OSError):
+                    st = os.stat(x)
+                    wD[x] = (st.st_mtime_ns, st.st_size)
+            return wD
+        
+        def _affected_sources(changedL, wD):
+            """ Returns sorted list of source paths affected by changed files """
+            sourcesL = [x for x in wD if x not in (configPath, userFunctionsPath) and \
+                                                        os.path.dirname(x) != importDir]
+            affected = set()
+            depsD = _read_dependencies()[0]
+            unrecordedL = [x for x in sourcesL if os.path.relpath(x, CD["siteDir"]) not in depsD]
+            if configPath in changedL or userFunctionsPath in changedL or \
+                        [x for x in changedL if os.path.dirname(x) == importDir]:
+                affected.update(_get_dependent_sources(sourcesL))
+            for x in changedL:
+                if x == configPath or x == userFunctionsPath:
+                    affected.update(unrecordedL)
+                elif os.path.dirname(x) == importDir:
+                    imFname = os.path.basename(x)
+                    if "__" in imFname: imFname = imFname.split("__", maxsplit=1)[1]
+                    imFname = os.path.splitext(imFname)[0]
+                    for y in unrecordedL:
+                        if imFname == "all" or imFname == os.path.splitext(os.path.basename(y))[0] or \
+                                    (imFname == "newspost" and \
+                                        os.path.split(os.path.dirname(y))[1] == "news"):
+                            affected.add(y)
+                else:
+                    affected.add(x)
+            return sorted(affected)
+        
+        print("\n  Watching for changes to sources, imports, 'config.txt' and 'user_functions.py'.")
+        print("  Press Ctrl-C to quit.")
+        lastD = _watch_state()
+        try:
+            while True:
+                time.sleep(0.25)
+                wD = _watch_state()
+                changedL = sorted([x for x in wD if wD[x] != lastD.get(x)])
+                lastD = wD
+                if not changedL: continue # Nothing new, or files deleted only
+                try:
+                    _check_file_folder_names([os.path.relpath(x, CD["siteDir"]) for x in changedL])
+                    if configPath in changedL:
+                        print("\n  Configuration changed, reading it again.")
+                        CD = _get_site_config(CD)
+                    sLxNC = _affected_sources(changedL, wD)
+                    if sLxNC:
+                        qnrRS = RecordStore.load(qnrDataPath)
+                        _convert_and_record(sourcesDirs, htmlDirs, sLxNC, qnrRS, jobs)
+                        _say_record_conflicts(qnrRS.save())
+                        print("\n  Done, watching for changes.")
+                except QuicknrError as e: # Keep watching after an error in one source
+                    print(e)
+                    print("\n  Conversion aborted, watching for changes.")
+                except SystemExit:
+                    print("\n  Conversion aborted, watching for changes.")
+                # Files written by the conversion, such as "news.txt", are not changes
+                lastD = _watch_state()
+        except KeyboardInterrupt:
+            print("")
+            _say_quit()
+    
+    def _preview_server(sourcesDirs, htmlDirs, qnrDataPath, port):
+        """
+        Preview mode: serves the website on a local HTTP server, rendering each 
+        requested page from its source with the conversion pipeline. Nothing
+        is written to 'public_html' or the data file. Other files are served 
+        as they are from 'public_html'. Runs until Ctrl-C
+        
+        Rendered pages are kept in a bounded LRU cache, keyed by the hashes of 
+        the source, of the configuration and user functions, and of the import 
+        files, so pages are rendered again only when one of them changes. The
+        HTML of the QLM blocks of pages is kept in another, so an edited page
+        is rendered again only in its changed blocks
+        
+        """
+        siteCD = CD
+        pageCache = LRUCache(256)
+        blockCache = LRUCache(20000) # QLM blocks of all pages, edited pages reuse theirs
+        xts = [".txt", ".mdml", ".html", ".php", ".htm"]
+        configPaths = [ os.path.join(CD["siteDir"], "config/config.txt"),
+                        os.path.join(CD["siteDir"], "config/user_functions.py")]
+        importDir = os.path.join(CD["siteDir"], "config/import")
+        state = dict(configHash="", userFunctions=None)
+        
+        def _digest(paths):
+            """ Returns hex digest of the names and contents of files """
+            h = hashlib.md5()
+            for x in paths:
+                h.update(os.path.basename(x).encode() + b"\0")
+                with open(x, mode="rb") as f: h.update(f.read())
+                h.update(b"\0")
+            return h.hexdigest()
+        
+        def _source_for_url(urlPath):
+            """ Returns the source path of a page URL path, or None """
+            relP = urlPath.lstrip("/")
+            if not relP or relP.endswith("/"): relP += "index"
+            base, ext = os.path.splitext(relP)
+            if ext and ext not in [".html", ".htm", ".php"]: return None
+            for x in xts:
+                sP = os.path.normpath(os.path.join(sourcesDirs[0], base + x))
+                if os.path.dirname(sP) in sourcesDirs and os.path.isfile(sP):
+                    return sP
+            return None
+        
+        def _render_page(sourcePath):
+            """ Returns HTML text of the source, from cache if unchanged, and cache state """
+            nonlocal CD, siteCD
+            configHash = _digest(configPaths)
+            if configHash != state["configHash"]:
+                if state["configHash"]: # Changed while previewing
+                    CD = _get_site_config(siteCD)
+                    siteCD = CD
+                state["userFunctions"] = _load_user_functions()
+                state["configHash"] = configHash
+            importsHash = _digest(sorted([os.path.join(importDir, x) for x in os.listdir(importDir)
+                                            if os.path.isfile(os.path.join(importDir, x))]))
+            key = ( os.path.relpath(sourcePath, CD["siteDir"]), _digest([sourcePath]),
+                    configHash, importsHash)
+            hT = pageCache.get(key)
+            if hT is not None: return hT, "hit"
+            wdataRS = RecordStore.load(qnrDataPath)
+            _refresh_import_files()
+            ctx = dict(CD=dict(siteCD), sourcePath=sourcePath, makeThumbs=False,
+                        blockCache=blockCache)
+            try:
+                result = _render_source(ctx, sourcesDirs, htmlDirs, wdataRS, state["userFunctions"])
+            finally:
+                CD = siteCD
+            hT = result["html"] if result else "<p>Page could not be rendered.</p>"
+            pageCache.put(key, hT)
+            return hT, "miss"
+        
+        class _PreviewHandler(http.server.BaseHTTPRequestHandler):
+            """ Handles GET requests of the preview server """
+            def do_GET(self):
+                urlPath = unquote(urlsplit(self.path).path)
+                sourcePath = _source_for_url(urlPath)
+                cacheState = ""
+                try:
+                    if sourcePath:
+                        hT, cacheState = _render_page(sourcePath)
+                        body = hT.encode(); cType = "text/html; charset=utf-8"
+                    else:
+                        fP = os.path.realpath(os.path.join(htmlDirs[0], urlPath.lstrip("/")))
+                        if not fP.startswith(os.path.realpath(htmlDirs[0]) + os.sep) or \
+                                                                    not os.path.isfile(fP):
+                            self.send_error(404)
+                            return
+                        with open(fP, mode="rb") as f: body = f.read()
+                        cType = mimetypes.guess_type(fP)[0] or "application/octet-stream"
+                except (SystemExit, QuicknrError) as e: # Error printed or raised by conversion
+                    if isinstance(e, QuicknrError): print(e)
+                    self.send_error(500, "Conversion error, see the Quicknr console")
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", cType)
+                self.send_header("Content-Length", str(len(body)))
+                if cacheState: self.send_header("X-Quicknr-Cache", cacheState)
+                self.end_headers()
+                self.wfile.write(body)
+        
+        server = http.server.HTTPServer(("127.0.0.1", port), _PreviewHandler)
+        print("\n  Previewing website at http://127.0.0.1:{}/".format(port))
+        print("  Pages are rendered from sources on request. Press Ctrl-C to quit.\n")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
+            print("")
+            _say_quit()
+    
     # --------------------- TOOLS MODE ---------------------
     
-    def _tool_delete_news_post(qnrDataPath):
+    def _tool_delete_news_post(qnrRS):
         """
         Deletes a news post by deleting:
             * source text file
@@ -2280,7 +4732,7 @@ def Quicknr():
         # --------------------- Get news post to delete, source & html
         
         filesToDelete = []
-        nfL = os.listdir(os.path.join(CD["siteDir"], "page_sources/news"))
+        nfL = siteSnap.files("page_sources/news")
         if len(nfL) == 0:
             _say_error("Error: No news posts to delete.\n       Quit.")
         elif len(nfL) < 2:
@@ -2295,7 +4747,7 @@ def Quicknr():
         if not delF: _say_quit()
         filesToDelete.append(os.path.join(CD["siteDir"], "page_sources/news/"+delF))
         # Find HTML counterpart
-        for x in os.listdir(os.path.join(CD["siteDir"], "public_html/news")):
+        for x in siteSnap.files("public_html/news"):
             if os.path.splitext(x)[0] == os.path.splitext(delF)[0]:
                 filesToDelete.append(os.path.join(CD["siteDir"], "public_html/news/"+x))
                 break
@@ -2313,27 +4765,18 @@ def Quicknr():
         
         print("")
         relSFP = os.path.relpath(filesToDelete[0], CD["siteDir"])
-        with open(qnrDataPath, mode="r") as f: qdT = f.read()
-        qdTL = qdT.splitlines()
         # If HTML file exists, check if uploaded, attempt deletion on server or quit
         if len(filesToDelete) > 1:
             relHFP = os.path.relpath(filesToDelete[1], CD["siteDir"])
-            for i, x in enumerate(qdTL):
-                if relHFP in x:
-                    if x.rsplit("\t", maxsplit=1)[1] == "UP":
-                        # Quit if unable to delete (no connection usually)
-                        _manage_server_files([relHFP], "delete", qnrDataPath)
-                    del qdTL[i]
-                    break
-        # Delete source file from data
-        for i, x in enumerate(qdTL):
-            if relSFP in x:
-                del qdTL[i]
-                break
-        # Save modified data file
-        qdT = "\n".join(qdTL)
-        if qdT[-1] != "\n": qdT += "\n" # Because splitlines() != split()
-        with open(qnrDataPath, mode="w") as f: f.write(qdT)
+            rec = qnrRS.get(relHFP)
+            if rec:
+                if rec.upState == "UP":
+                    # Quit if unable to delete (no connection usually)
+                    _manage_server_files([relHFP], "delete", qnrRS)
+                qnrRS.remove(relHFP)
+        # Delete source file from data, and save modified data file
+        qnrRS.remove(relSFP)
+        _say_record_conflicts(qnrRS.save())
         # Delete files locally
         for x in filesToDelete: os.remove(x)
         if len(filesToDelete) > 1: # We assume html exists if in news list
@@ -2373,7 +4816,7 @@ def Quicknr():
                 "  Run Quicknr again, not in Tools mode, to update the news listing\n"
                 "    HTML file and upload it together with 'news.js'.\n")
     
-    def _tool_upgrade_config_file(qnrDataPath):
+    def _tool_upgrade_config_file(qnrRS):
         """
         Copies settings from the website "config.txt" file to a copy
         of the Quicknr "config.txt" file, presumed to be the latest version,
@@ -2418,7 +4861,7 @@ def Quicknr():
         with open(w_configPath, mode="w") as f: f.write(qT)
         print('\n  Website "config.txt" file has been upgraded, with your settings retained.\n')
     
-    def _tools(qnrDataPath):
+    def _tools(qnrRS):
         """
         Tools mode, for various admin tasks
         
@@ -2429,9 +4872,9 @@ def Quicknr():
         toolCmd = _ui_list_menu(cmdL, "Tools", prompt)
         if not toolCmd: _say_quit()
         if toolCmd == cmdL[0]:
-            _tool_delete_news_post(qnrDataPath)
+            _tool_delete_news_post(qnrRS)
         elif toolCmd == cmdL[1]:
-            _tool_upgrade_config_file(qnrDataPath)
+            _tool_upgrade_config_file(qnrRS)
         print("Quit.")
         sys.exit()
     
@@ -2443,26 +4886,59 @@ def Quicknr():
     if len(sys.argv) > 1:
         cliArgs = _parse_cli_args()
     # --------------------- Prompt for website
-    CD["siteFolder"] = _ui_get_site_dir() # May create website (& data file)
+    CD["siteFolder"] = _ui_get_site_dir(cliArgs.site if cliArgs else "") # May create website
     CD["siteDir"] = os.path.join(qnrDir, "websites/" + CD["siteFolder"])
     qnrDataPath = os.path.join(CD["siteDir"], "quicknr_private/quicknr_data.txt")
+    siteSnap = SiteSnapshot(CD["siteDir"]) # Listing of website files for this run
     _check_file_folder_names() # Quit if invalid names
-    with open(qnrDataPath, mode="r") as f: qnrDT = f.read()
+    qnrRS = RecordStore.load(qnrDataPath) # Records of the data file
     if cliArgs and cliArgs.convertall:
         # All sources to be converted again
-        qnrDT = _mark_all_changed(qnrDT)
+        _mark_all_changed(qnrRS)
         # Mark news.txt to be rebuilt
         rebuildNewsList = True
     # --------------------- Get site configuration settings
     CD = _get_site_config(CD)
     # --------------------- Scan source files for new or changed
     sourcesDirs, htmlDirs = _get_pages_folders(CD["siteDir"])
+    # --------------------- Watch mode, converting on changes until quit
+    if cliArgs and cliArgs.watch:
+        _watch_sources(sourcesDirs, htmlDirs, qnrDataPath, cliArgs.jobs) # Will quit
+    # --------------------- Preview mode, serving pages rendered on request until quit
+    if cliArgs and cliArgs.preview is not None:
+        _preview_server(sourcesDirs, htmlDirs, qnrDataPath, cliArgs.preview) # Will quit
+    # --------------------- Profile the stages of the run, if asked to
+    if cliArgs and cliArgs.profile is not None:
+        if cliArgs.profile < 1:
+            _say_error("Error: Number of pages to list must be 1 or more.\n       Quit.")
+        profiler = Profiler()
+        profiler.install(globals(), ["indent_html_tree"])
+        _relpath = lambda x, *args, **kwargs: os.path.relpath(x, CD["siteDir"])
+        _get_pages_files = profiler.wrap(_get_pages_files)
+        _file_size_and_hash = profiler.wrap(_file_size_and_hash, _relpath)
+        _render_source = profiler.wrap(_render_source, lambda ctx, *args: _relpath(ctx["sourcePath"]))
+        _plaintext_to_html = profiler.wrap(_plaintext_to_html)
+        _import_files = profiler.wrap(_import_files)
+        _save_image_thumbnail = profiler.wrap(_save_image_thumbnail, _relpath)
+        _record_new_files = profiler.wrap(_record_new_files)
+        _manage_server_files = profiler.wrap(_manage_server_files)
+        _write_page = profiler.wrap(_write_page, lambda hP, hT: hP)
+        qnrRS.save = profiler.wrap(qnrRS.save) # Data file written
+        qnrRS.flush = profiler.wrap(qnrRS.flush) # Journal appended to
     # sL - List of source files, relative to sources dir, no file extension
     # sLx - Full source paths with file extensions
     # sLxN - Full source paths that have no matching html counterpart
     # sLxC - Full source paths that have a counterpart and differ from record
     # hL - List of HTML files, relative to html dir, no file extension
-    sL, sLx, sLxN, sLxC, hL = _get_pages_files(sourcesDirs,htmlDirs,qnrDT)
+    # Sources found unchanged, with new stat data to record, none if all are marked changed
+    refreshD = None if cliArgs and cliArgs.convertall else {}
+    sL, sLx, sLxN, sLxC, hL = _get_pages_files(sourcesDirs,htmlDirs,qnrRS,refreshD)
+    if refreshD:
+        # Record them so they are not hashed again, here and in the journal
+        _refresh_records(qnrRS, refreshD)
+        _say_record_conflicts(qnrRS.flush())
+    # sLxD - Full source paths otherwise unchanged, whose recorded inputs have changed
+    sLxD = [x for x in _get_dependent_sources(sLx) if x not in sLxN and x not in sLxC]
     
     print("\n---------------------- Website: " + CD["siteFolder"] + "\n")
     
@@ -2475,11 +4951,12 @@ def Quicknr():
     
     # --------------------- Tools mode
     if cliArgs and cliArgs.tools:
-        _tools(qnrDataPath) # Will quit
+        _tools(qnrRS) # Will quit
     
     # --------------------- No new or changed sources to convert
-    elif not sLxN and not sLxC:
+    elif not sLxN and not sLxC and not sLxD:
         print("There are no new or updated source files to convert to HTML.")
+        if CD["CHANGE_DETECTION"] == "GIT": _record_git_head(sourcesDirs)
     # --------------------- Convert sources to HTML
     elif sLxN:
         print("These source files are yet to be converted to HTML pages:\n\n")
@@ -2487,6 +4964,10 @@ def Quicknr():
     if sLxC:
         print("These source files have changed since conversion to HTML pages:\n\n")
         for x in sLxC: print("     "+os.path.relpath(x, sourcesDirs[0]))
+    if sLxD:
+        print("These source files depend on changed imports, settings or Python functions:\n\n")
+        for x in sLxD: print("     "+os.path.relpath(x, sourcesDirs[0]))
+        sLxC = sorted(sLxC + sLxD)
     if sLxN or sLxC:
         while True:
             if sLxC:
@@ -2499,51 +4980,32 @@ def Quicknr():
         # New and changed together
         sLxNC = sLxN[:]
         sLxNC.extend(sLxC)
-        # Check for news items to be converted, then set "news.txt" to update too
-        for x in sLxNC:
-            if os.path.split(os.path.dirname(x))[1] == "news":
-                updateNewsList = True
-                break
-        convertedFiles = _convert_sources_to_html(sourcesDirs,htmlDirs,sLxNC,qnrDT)
-        if convertedFiles: _record_new_files(convertedFiles, qnrDataPath, qnrDT)
-        # Data file must be updated by this point, and it is
-        # If news were updated, update res/js/news.js for dynamic prev/next links
-        if updateNewsList:
-            # Get list of news files from record, sorted by date
-            newsFL = _get_news_file_list(qnrDataPath)
-            # Write file list to res/js/news.js
-            if newsFL:
-                jsfP = os.path.join(CD["siteDir"], "public_html/res/js/news.js")
-                jsfT = ""
-                if os.path.exists(jsfP): # If no news.js, its function must be elsewhere
-                    with open(jsfP, mode="r") as f:
-                        jsfT = f.read()
-                        jsfT = jsfT.split("//==DO_NOT_EDIT_THIS_LINE", maxsplit=1)[1]
-                for i,x in enumerate(newsFL):
-                    if not i: jsfT = '"'+x[1]+'"];\n\n//==DO_NOT_EDIT_THIS_LINE'+jsfT
-                    else: jsfT = '"' + x[1] + '", ' + jsfT
-                jsfT = '\nvar news_files_list = [' + jsfT
-                jsfT = '\nvar news_list_items = ' + CD["NEWS_LIST_ITEMS"] + ';' + jsfT
-                jsfT = '\nvar news_next_link_text = "' + CD["NEWS_NEXT_LINK"] + '";' + jsfT
-                jsfT = '\nvar news_prev_link_text = "' + CD["NEWS_PREV_LINK"] + '";' + jsfT
-                with open(jsfP, mode="w") as f: f.write(jsfT)
+        jobs = cliArgs.jobs if cliArgs else 1
+        _convert_and_record(sourcesDirs, htmlDirs, sLxNC, qnrRS, jobs)
+        if CD["CHANGE_DETECTION"] == "GIT": _record_git_head(sourcesDirs)
+        # Files have been written, list them again
+        siteSnap.rescan("page_sources")
+        siteSnap.rescan("public_html")
         print("\nDone.")
         
+    # --------------------- Compressed copies of files, for the server to send
+    if _precompress_files(qnrRS): # Or removed, with the setting of NO
+        siteSnap.rescan("public_html")
     # --------------------- Upload files to server
     # First, record news images if they are new (not yet in record) or changed in size
     newsImgDir = os.path.join(htmlDirs[0], "news/images")
-    if os.path.exists(newsImgDir):
+    if siteSnap.exists("public_html/news/images"):
         iXL = [".jpg",".png",".gif",".svg"]
         ifL = [] # List of image files
-        for x in os.listdir(newsImgDir):
+        for x in siteSnap.listdir("public_html/news/images"):
             if os.path.splitext(os.path.join(newsImgDir, x))[1] in iXL:
                 rIF = os.path.relpath(os.path.join(newsImgDir, x), CD["siteDir"])
                 ifL.append(rIF)
-        if ifL: _record_news_images(ifL, qnrDataPath)
+        if ifL: _record_news_images(ifL, qnrRS)
     # Ready to upload
-    filesToUpload = _get_records_to_upload(qnrDataPath) # Must run, deletes nonexistent
+    filesToUpload = _get_records_to_upload(qnrRS) # Must run, deletes nonexistent
     if cliArgs: # Order matters
-        if cliArgs.allupload: filesToUpload = _get_files_for_upload("all")
+        if cliArgs.allupload or cliArgs.sync: filesToUpload = _get_files_for_upload("all")
         elif cliArgs.resupload: filesToUpload.extend(_get_files_for_upload("res"))
         else:
             if cliArgs.stylesupload: filesToUpload.extend(_get_files_for_upload("css"))
@@ -2554,23 +5016,36 @@ def Quicknr():
     if _check_files_for_news(filesToUpload):
         if not cliArgs:
             filesToUpload.append("public_html/res/js/news.js")
-        elif not cliArgs.allupload and not cliArgs.resupload and not cliArgs.jsupload:
+        elif not cliArgs.allupload and not cliArgs.sync and not cliArgs.resupload \
+                and not cliArgs.jsupload:
             filesToUpload.append("public_html/res/js/news.js")
+    _say_record_conflicts(qnrRS.save()) # Data file written once, with all changes so far
+    orphansL = [] # Server files not found locally
+    if cliArgs and cliArgs.sync:
+        filesToUpload, orphansL = _manage_server_files(filesToUpload, "sync", qnrRS)
     if filesToUpload:
         filesToUpload.sort()
         print(  "\n  These files will now be uploaded:\n\n    " + \
-                "\n    ".join([x.split("\t", 1)[0] for x in filesToUpload]))
+                "\n    ".join(filesToUpload))
         while True:
             r = input("\nEnter Y to UPLOAD the files (or Q to quit): ")
             if not r or r in "qQ": _say_quit()
             elif r in "yY": break
-        _manage_server_files(filesToUpload, "upload", qnrDataPath)
-        if cliArgs and cliArgs.allupload: # Not handled in _manage_server_files()
-            with open(qnrDataPath, mode="r") as f: fT = f.read()
-            fT = re.sub(r"\tNOTUP", r"\tUP", fT)
-            with open(qnrDataPath, mode="w") as f: f.write(fT)
+        _manage_server_files(filesToUpload, "upload", qnrRS)
+        _say_record_conflicts(qnrRS.save()) # Upload states, merged from the journal
     else:
         print("There are no files marked for upload to server.")
+    if orphansL:
+        print(  "\n  These files on the server are not in 'public_html':\n\n    " + \
+                "\n    ".join(orphansL))
+        while True:
+            r = input("\nEnter Y to DELETE the files from the server, N to keep them (or Q to quit): ")
+            if not r or r in "qQ": _say_quit()
+            elif r in "nN": break
+            elif r in "yY":
+                _manage_server_files(orphansL, "delete", qnrRS)
+                break
+    _profile_report()
     
     # --------------------- Exit or continue in the loop
     while True:
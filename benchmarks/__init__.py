@@ -0,0 +1,6 @@
+"""
+Benchmarks of Quicknr, run from the Quicknr folder, for example:
+
+    python3 -m benchmarks.qlm_lexer
+
+"""
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Times the HTML indenter of Quicknr on pages of growing size
+
+Pages are made of the HTML of the QLM corpus pages, each converted and 
+following under a heading, in a page <div> as by the default snippets. Time
+per line should stay about level as the pages grow, the indenter listing
+the tag lines in one pass and bisecting the lists, O(n log n) in the 
+number of lines
+
+"""
+
+import sys, os, time, argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Quicknr_App import indent_html_tree
+from benchmarks.qlm_lexer import convert, make_page
+
+SIZES = (1000, 10000, 100000)
+
+def make_html(lines):
+    """
+    Returns HTML of about the number of lines given
+    
+    """
+    hT = ""
+    size = lines
+    while hT.count("\n") < lines: # Converted pages have fewer lines than sources
+        hT = '<div class="page">\n' + convert(make_page(size), "benchmark.txt") + "</div>\n"
+        size += lines
+    return hT
+
+def time_sizes(sizes, repeat):
+    """
+    Prints the best time of indenting pages of each size
+    
+    """
+    print("\n  {:>8}  {:>10}  {:>12}".format("Lines", "Seconds", "us per line"))
+    for size in sizes:
+        text = make_html(size)
+        lines = text.count("\n")
+        best = None
+        for x in range(repeat):
+            t0 = time.perf_counter()
+            indent_html_tree(text)
+            t = time.perf_counter() - t0
+            if best is None or t < best: best = t
+        print("  {:>8}  {:>10.3f}  {:>12.1f}".format(lines, best, best / lines * 1e6))
+
+def main():
+    parser = argparse.ArgumentParser(description="HTML indenter timing")
+    parser.add_argument("--repeat", type=int, default=3, help="timing runs per size")
+    args = parser.parse_args()
+    time_sizes(SIZES, args.repeat)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
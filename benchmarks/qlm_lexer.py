@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Checks the QLM converter against the corpus in qlm_corpus, and times it on
+pages of growing size
+
+Each .txt page of the corpus has the agreed HTML of its content in the 
+.html file of the same name, as made by the converter of Quicknr 2.0.2, 
+code blocks entered back in, but for links_one_line, of several links on a
+line, which that converter nested into one another. Conversion time per line should stay level as
+the pages grow, the conversion being linear in the size of the page
+
+"""
+
+import sys, os, time, argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Quicknr_App import QLMLexer, QLMRenderer
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "qlm_corpus")
+SIZES = (1000, 10000, 100000)
+
+def render(text, sourceFilePath):
+    """
+    Returns the lexer of a QLM page and the HTML of its content, as made by
+    Quicknr with the default settings, before the final wrap
+    
+    """
+    settings = {"JAVASCRIPT_LINK_SPAN": "YES", "JAVASCRIPT_LINK_PRE": "",
+                "JAVASCRIPT_LINK_POST": "", "sourceFilePath": sourceFilePath}
+    lexer = QLMLexer(text, os.path.basename(sourceFilePath))
+    return lexer, QLMRenderer(settings).render(lexer)
+
+def convert(text, sourceFilePath):
+    """
+    Returns the HTML of the content of a QLM page, code blocks entered back
+    
+    """
+    lexer, hT = render(text, sourceFilePath)
+    return lexer.placeholders.restore(hT)
+
+def check_corpus():
+    """
+    Converts the pages of the corpus and compares them with their HTML, 
+    returns the number of pages that differ
+    
+    """
+    failed = 0
+    for fN in sorted(os.listdir(CORPUS_DIR)):
+        if not fN.endswith(".txt"): continue
+        fP = os.path.join(CORPUS_DIR, fN)
+        with open(fP, encoding="utf-8") as f: text = f.read()
+        with open(os.path.splitext(fP)[0] + ".html", encoding="utf-8") as f: expected = f.read()
+        same = convert(text, fP) == expected
+        if not same: failed += 1
+        print("  {:<24}{}".format(fN, same and "identical" or "DIFFERENT"))
+    return failed
+
+def make_page(lines):
+    """
+    Returns a page of about the number of lines given, made of the corpus
+    pages without their titles, each following under a heading
+    
+    """
+    partsL = []
+    for fN in sorted(os.listdir(CORPUS_DIR)):
+        if not fN.endswith(".txt") or fN == "news.txt": continue
+        with open(os.path.join(CORPUS_DIR, fN), encoding="utf-8") as f: text = f.read()
+        partsL.append("  " + os.path.splitext(fN)[0] + "\n\n" + text.strip("\n").split("\n\n", 1)[-1])
+    pageL = ["   Benchmark page"]
+    count = 1
+    i = 0
+    while count < lines:
+        x = partsL[i % len(partsL)]
+        pageL.append(x)
+        count += x.count("\n") + 2
+        i += 1
+    return "\n\n".join(pageL) + "\n"
+
+def time_sizes(sizes, repeat):
+    """
+    Prints the best time of converting pages of each size to HTML, code 
+    blocks left protected
+    
+    """
+    print("\n  {:>8}  {:>10}  {:>12}".format("Lines", "Seconds", "us per line"))
+    for size in sizes:
+        text = make_page(size)
+        lines = text.count("\n")
+        best = None
+        for x in range(repeat):
+            t0 = time.perf_counter()
+            render(text, "benchmark.txt")
+            t = time.perf_counter() - t0
+            if best is None or t < best: best = t
+        print("  {:>8}  {:>10.3f}  {:>12.1f}".format(lines, best, best / lines * 1e6))
+
+def main():
+    parser = argparse.ArgumentParser(description="QLM converter corpus check and timing")
+    parser.add_argument("--check", action="store_true", help="check the corpus only")
+    parser.add_argument("--repeat", type=int, default=3, help="timing runs per size")
+    args = parser.parse_args()
+    print("\n  QLM corpus\n")
+    failed = check_corpus()
+    if not args.check: time_sizes(SIZES, args.repeat)
+    return failed and 1 or 0
+
+if __name__ == "__main__":
+    sys.exit(main())
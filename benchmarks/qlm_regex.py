@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Times the regular expressions of the QLM converter, the config.txt parser
+and the news listing blurb on adversarial inputs of growing size
+
+Each case feeds one pattern, through the code that applies it, an input
+made to make it backtrack: long runs of spaces or brackets, brackets and
+snippets never closed, paragraphs with no blank line after them. Inputs
+double in size twice, and time should double with them. A case whose time
+grows faster, by an exponent over GROWTH_LIMIT, or that runs over the time
+limit, is flagged
+
+"""
+
+import sys, os, time, math, argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Quicknr_App import QLMLexer, QLMRenderer, SiteConfig, news_post_blurb
+from benchmarks.qlm_lexer import convert
+
+GROWTH_LIMIT = 1.5 # Exponent of time in input size, 1 for linear
+NOISE = 0.005 # Seconds, growth of cases faster than this is not judged
+
+def _blocks(text):
+    return QLMLexer(text, "regex.txt").blocks()
+
+def _blurb(text):
+    return news_post_blurb(text, 300)
+
+# Name, patterns stressed, function applying them, input of size n
+CASES = (
+    ("spaces before ]", "QLMLexer._closeSpaceRE", _blocks,
+        lambda n: "[x" + " " * n + "y ]\n"),
+    ("quotes in brackets", "QLMLexer._delete_link_quotes", _blocks,
+        lambda n: "[a '" * n + "]\n"),
+    ("quotes, no ]", "QLMLexer._badURLRE", _blocks,
+        lambda n: "[a" + ' "b' * n + "\n"),
+    ("definitions", "QLMLexer._definitionRE", _blocks,
+        lambda n: "word: text\n" * n),
+    ("list items", "QLMLexer._orderedItemRE", _blocks,
+        lambda n: "* item\n1. item\n" * n),
+    ("float image", "QLMLexer._floatRE", _blocks,
+        lambda n: "[a.jpg" + " x" * n + "] y\n"),
+    ("unclosed links", "QLMLexer._links", QLMLexer.inline,
+        lambda n: "[a " * n + "]"),
+    ("unclosed calls", "QLMLexer._links", QLMLexer.inline,
+        lambda n: "[a b(" * n + "]"),
+    ("bracket words", "QLMLexer._links", QLMLexer.inline,
+        lambda n: "[ab" * n + "]"),
+    ("spaces in link", "QLMLexer._links", QLMLexer.inline,
+        lambda n: "[x" + " " * n + "y" + " " * n + "z(]"),
+    ("image links", "QLMLexer._links", lambda t: convert(t, "regex.txt"),
+        lambda n: "[a.jpg][b]" * n + "\n"),
+    ("style delimiters", "QLMRenderer._delimitersRE", QLMRenderer.style_text,
+        lambda n: "*a _b `c " * n),
+    ("unstyle delimiters", "QLMRenderer.unstyle", QLMRenderer.unstyle,
+        lambda n: " *a" * n),
+    ("value, no line end", "SiteConfig._value", SiteConfig.parse,
+        lambda n: "HTML_TITLE:" + " " * n),
+    ("value, trailing spaces", "SiteConfig._value", SiteConfig.parse,
+        lambda n: "HTML_TITLE: x" + " " * n + "\n"),
+    ("snippet, unclosed", "SiteConfig._snippet", SiteConfig.parse,
+        lambda n: "HTML_HEAD:" + " \n" * n + "<"),
+    ("snippet, quotes", "SiteConfig._snippet", SiteConfig.parse,
+        lambda n: "HTML_HEAD:" + " ''\n" * n + "<"),
+    ("snippet, long", "SiteConfig._snippet", SiteConfig.parse,
+        lambda n: 'HTML_HEAD: """\n' + "<p>x</p>\n" * n + '"""\n'),
+    ("settings", "SiteConfig._keyRE", SiteConfig.parse,
+        lambda n: "HTML_TITLE: x\n" * n),
+    ("blurb, definitions", "news_post_blurb", _blurb,
+        lambda n: "   Title\n\n" + "word: text\n" * n),
+    ("blurb, no blank line", "news_post_blurb", _blurb,
+        lambda n: "   Title\n\n" + "line of text\n" * n),
+    ("blurb, unclosed links", "news_post_blurb", _blurb,
+        lambda n: "   Title\n\nFirst " + "[a " * n + "\n\n"),
+    ("blurb, bracket runs", "news_post_blurb", _blurb,
+        lambda n: "   Title\n\nFirst " + "[" * n + "a b]\n\n"),
+    ("blurb, bracket words", "news_post_blurb", _blurb,
+        lambda n: "   Title\n\nFirst " + "[a" * n + " b c]\n\n"),
+    ("blurb, spaces in link", "news_post_blurb", _blurb,
+        lambda n: "   Title\n\nFirst [a" + " " * n + "b c]\n\n"),
+    )
+
+def time_case(function, make, sizes, repeat, limit):
+    """
+    Returns the best times of the function on inputs of each size, fewer
+    if a run takes longer than limit seconds
+
+    """
+    timesL = []
+    for size in sizes:
+        text = make(size)
+        best = None
+        for x in range(repeat):
+            t0 = time.perf_counter()
+            function(text)
+            t = time.perf_counter() - t0
+            if best is None or t < best: best = t
+            if t > limit: break
+        timesL.append(best)
+        if best > limit: break
+    return timesL
+
+def growth(timesL):
+    """
+    Returns the exponent of time in input size between the last two sizes,
+    None if too fast to tell, or infinity if the runs stopped early
+
+    """
+    if len(timesL) < 3: return math.inf
+    if timesL[-1] < NOISE: return None
+    return math.log(timesL[-1] / max(timesL[-2], 1e-9), 2)
+
+def time_cases(size, repeat, limit):
+    """
+    Prints the times and growth of each case, returns the number flagged
+
+    """
+    sizes = (size, size * 2, size * 4)
+    print("\n  {:<24}{:<30}{:>9}{:>9}{:>9}{:>8}".format(
+            "Case", "Pattern", *(["n=%d" % x for x in sizes] + ["Growth"])))
+    flagged = 0
+    for name, pattern, function, make in CASES:
+        timesL = time_case(function, make, sizes, repeat, limit)
+        g = growth(timesL)
+        bad = g is not None and g > GROWTH_LIMIT
+        if bad: flagged += 1
+        cellsL = ["{:.4f}".format(x) for x in timesL] + ["-"] * (3 - len(timesL))
+        print("  {:<24}{:<30}{:>9}{:>9}{:>9}{:>8}{}".format(name, pattern, *cellsL,
+                g is None and "-" or "{:.2f}".format(g), bad and "  SLOW" or ""))
+    return flagged
+
+def main():
+    parser = argparse.ArgumentParser(description="QLM and settings regex timing on adversarial input")
+    parser.add_argument("--size", type=int, default=2000, help="smallest input size, in repeats")
+    parser.add_argument("--repeat", type=int, default=3, help="timing runs per size")
+    parser.add_argument("--limit", type=float, default=10.0, help="seconds before a case is stopped")
+    args = parser.parse_args()
+    flagged = time_cases(args.size, args.repeat, args.limit)
+    print("\n  {} of {} cases grow faster than linear".format(flagged, len(CASES)))
+    return flagged and 1 or 0
+
+if __name__ == "__main__":
+    sys.exit(main())
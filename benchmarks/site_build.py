@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Times full runs of Quicknr on a synthetic website, from conversion to upload
+
+A scratch Quicknr folder is made in a temporary folder, with a website of
+QLM pages, news posts with images, Markdown pages and import files, in the
+numbers given. Quicknr is run on it headless, its prompts answered through
+its standard input, and uploads go to an FTP stand-in served from this 
+process, each reply delayed by the latency given. The scenarios run in 
+order on the same website:
+
+    cold        - first conversion of all sources
+    noop        - run with nothing changed
+    edit        - one page changed
+    convertall  - all sources converted again, with --convertall
+    upload      - all files of public_html uploaded, with --allupload
+    sync        - one page changed and one image removed, then the server
+                  listed and only the differences sent, with --sync
+
+Results are printed and written as JSON, with --out, to be compared between
+versions
+
+"""
+
+import sys, os, re, time, json, shutil, tempfile, argparse, platform
+import posixpath, socket, socketserver, threading, subprocess, zlib, struct
+
+QNR_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SITE_NAME = "bench"
+SCENARIOS = ("cold", "noop", "edit", "convertall", "upload", "sync")
+
+# --------------------- FTP stand-in
+
+class FTPStandIn(socketserver.ThreadingTCPServer):
+    """
+    Minimal FTP server on localhost, storing files in rootDir, passive mode
+    only, with each reply delayed by latency seconds
+
+    Counts of commands, files stored and bytes stored are kept in stats
+
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+    def __init__(self, rootDir, latency=0.0):
+        super().__init__(("127.0.0.1", 0), _FTPSession)
+        self.rootDir = rootDir
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.reset_stats()
+    @property
+    def address(self):
+        """ Returns server address as "host:port" """
+        return "{}:{}".format(*self.server_address)
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+    def reset_stats(self):
+        with self.lock: self.stats = dict(commands=0, stored=0, bytes=0)
+    def count(self, **kwargs):
+        with self.lock:
+            for k, v in kwargs.items(): self.stats[k] += v
+
+class _FTPSession(socketserver.StreamRequestHandler):
+    """
+    Control connection of the FTP stand-in, one per client
+
+    """
+    def handle(self):
+        self.cwd = "/"
+        self.pasvSock = None
+        self.reply("220 Quicknr benchmark FTP stand-in")
+        for line in self.rfile:
+            cmd, _, arg = line.decode("utf-8", "replace").rstrip("\r\n").partition(" ")
+            self.server.count(commands=1)
+            method = getattr(self, "ftp_" + cmd.upper(), None)
+            if method is None: self.reply("502 Command not implemented.")
+            elif method(arg) is False: break
+        if self.pasvSock: self.pasvSock.close()
+    def reply(self, text):
+        if self.server.latency: time.sleep(self.server.latency)
+        self.wfile.write(text.encode("utf-8") + b"\r\n")
+    def local_path(self, arg):
+        """ Returns the virtual and local paths of arg, kept inside the root """
+        vPath = posixpath.normpath(posixpath.join(self.cwd, arg or "."))
+        if vPath.startswith("//"): vPath = vPath[1:]
+        return vPath, os.path.join(self.server.rootDir, vPath.lstrip("/"))
+    def data_connection(self):
+        """ Returns the accepted data connection of the last PASV/EPSV """
+        if not self.pasvSock:
+            self.reply("425 Use PASV or EPSV first.")
+            return None
+        self.reply("150 Opening data connection.")
+        try:
+            conn = self.pasvSock.accept()[0]
+        finally:
+            self.pasvSock.close()
+            self.pasvSock = None
+        return conn
+    def passive(self):
+        self.pasvSock = socket.socket()
+        self.pasvSock.bind(("127.0.0.1", 0))
+        self.pasvSock.listen(1)
+        self.pasvSock.settimeout(10)
+        return self.pasvSock.getsockname()[1]
+    def ftp_USER(self, arg): self.reply("331 Password required.")
+    def ftp_PASS(self, arg): self.reply("230 Logged in.")
+    def ftp_ACCT(self, arg): self.reply("230 Logged in.")
+    def ftp_SYST(self, arg): self.reply("215 UNIX Type: L8")
+    def ftp_FEAT(self, arg):
+        self.reply("211-Features:\r\n EPSV\r\n PASV\r\n SIZE\r\n MLST type*;size*;modify*;\r\n211 End")
+    def ftp_OPTS(self, arg): self.reply("200 OK.")
+    def ftp_NOOP(self, arg): self.reply("200 OK.")
+    def ftp_TYPE(self, arg): self.reply("200 Type set to {}.".format(arg))
+    def ftp_PORT(self, arg): self.reply("502 Active mode not supported.")
+    def ftp_QUIT(self, arg):
+        self.reply("221 Goodbye.")
+        return False
+    def ftp_PWD(self, arg): self.reply('257 "{}" is the current directory.'.format(self.cwd))
+    def ftp_CWD(self, arg):
+        vPath, lPath = self.local_path(arg)
+        if os.path.isdir(lPath):
+            self.cwd = vPath
+            self.reply("250 Directory changed.")
+        else: self.reply("550 No such directory.")
+    def ftp_CDUP(self, arg): self.ftp_CWD("..")
+    def ftp_MKD(self, arg):
+        vPath, lPath = self.local_path(arg)
+        try: os.mkdir(lPath)
+        except OSError: self.reply("550 Directory not created.")
+        else: self.reply('257 "{}" created.'.format(vPath))
+    def ftp_RMD(self, arg):
+        try: os.rmdir(self.local_path(arg)[1])
+        except OSError: self.reply("550 Directory not removed.")
+        else: self.reply("250 Directory removed.")
+    def ftp_DELE(self, arg):
+        try: os.remove(self.local_path(arg)[1])
+        except OSError: self.reply("550 File not deleted.")
+        else: self.reply("250 File deleted.")
+    def ftp_SIZE(self, arg):
+        lPath = self.local_path(arg)[1]
+        if os.path.isfile(lPath): self.reply("213 {}".format(os.path.getsize(lPath)))
+        else: self.reply("550 No such file.")
+    def ftp_PASV(self, arg):
+        port = self.passive()
+        self.reply("227 Entering Passive Mode (127,0,0,1,{},{}).".format(port >> 8, port & 0xFF))
+    def ftp_EPSV(self, arg):
+        self.reply("229 Entering Extended Passive Mode (|||{}|).".format(self.passive()))
+    def ftp_LIST(self, arg, namesOnly=False):
+        lPath = self.local_path("" if arg.startswith("-") else arg)[1]
+        if not os.path.isdir(lPath):
+            self.reply("550 No such directory.")
+            return
+        linesL = []
+        for e in sorted(os.scandir(lPath), key=lambda e: e.name):
+            if namesOnly:
+                linesL.append(e.name)
+                continue
+            st = e.stat()
+            linesL.append("{} 1 owner group {:>10} {} {}".format(
+                            e.is_dir() and "drwxr-xr-x" or "-rw-r--r--", st.st_size,
+                            time.strftime("%b %d %H:%M", time.localtime(st.st_mtime)), e.name))
+        conn = self.data_connection()
+        if not conn: return
+        with conn: conn.sendall("".join(x + "\r\n" for x in linesL).encode("utf-8"))
+        self.reply("226 Transfer complete.")
+    def ftp_NLST(self, arg): self.ftp_LIST(arg, namesOnly=True)
+    def ftp_MLSD(self, arg):
+        lPath = self.local_path(arg)[1]
+        if not os.path.isdir(lPath):
+            self.reply("550 No such directory.")
+            return
+        linesL = []
+        for e in sorted(os.scandir(lPath), key=lambda e: e.name):
+            st = e.stat()
+            linesL.append("type={};size={};modify={}; {}".format(
+                            e.is_dir() and "dir" or "file", st.st_size,
+                            time.strftime("%Y%m%d%H%M%S", time.gmtime(st.st_mtime)), e.name))
+        conn = self.data_connection()
+        if not conn: return
+        with conn: conn.sendall("".join(x + "\r\n" for x in linesL).encode("utf-8"))
+        self.reply("226 Transfer complete.")
+    def ftp_STOR(self, arg):
+        lPath = self.local_path(arg)[1]
+        if not os.path.isdir(os.path.dirname(lPath)):
+            self.reply("553 No such directory.")
+            return
+        conn = self.data_connection()
+        if not conn: return
+        size = 0
+        with conn, open(lPath, mode="wb") as f:
+            while True:
+                chunk = conn.recv(65536)
+                if not chunk: break
+                f.write(chunk)
+                size += len(chunk)
+        self.server.count(stored=1, bytes=size)
+        self.reply("226 Transfer complete.")
+    def ftp_RETR(self, arg):
+        lPath = self.local_path(arg)[1]
+        if not os.path.isfile(lPath):
+            self.reply("550 No such file.")
+            return
+        conn = self.data_connection()
+        if not conn: return
+        with conn, open(lPath, mode="rb") as f: conn.sendall(f.read())
+        self.reply("226 Transfer complete.")
+
+# --------------------- Synthetic website
+
+def make_png(width, height, seed):
+    """
+    Returns the bytes of a PNG image of a colour gradient
+
+    """
+    rowsL = []
+    for y in range(height):
+        row = bytearray([0]) # Filter type of the row
+        for x in range(width):
+            row += bytes(((x * 4 + seed) % 256, (y * 4 + seed * 7) % 256, (seed * 13) % 256))
+        rowsL.append(bytes(row))
+    def _chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + \
+                struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+    return b"\x89PNG\r\n\x1a\n" + \
+            _chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)) + \
+            _chunk(b"IDAT", zlib.compress(b"".join(rowsL))) + _chunk(b"IEND", b"")
+
+def make_qlm_page(i, imports):
+    """
+    Returns the text of QLM page i, importing one of the import files
+
+    """
+    partsL = ["   Page {} of the benchmark".format(i)]
+    for j in range(1, 4):
+        partsL.append("  Section {}".format(j))
+        partsL.append(  "This is paragraph {} of page {}, with *bold*, _italic_ and `mono` "
+                        "text,\na [link to the home page index.html] and a [bare link "
+                        "www.example.com/{}].".format(j, i, j))
+        partsL.append("* First item\n* Second item with ***all three***\n  * Nested item")
+        partsL.append("1. One\n2. Two\n3. Three")
+        partsL.append("Note: A note block of section {}\nover two lines.".format(j))
+        partsL.append("Code: for x in range({}):\n    print(x, \"<&>\")".format(j))
+        partsL.append("[A caption res/img/picture-{}.png] A paragraph floating next to an "
+                        "image, long enough to wrap.".format(j))
+    if imports: partsL.append('@import: "part-{}.txt"'.format(i % imports))
+    partsL.append("Last paragraph of page {}.".format(i))
+    return "\n\n".join(partsL) + "\n"
+
+def make_news_post(i):
+    """
+    Returns the text of news post i, showing its image
+
+    """
+    return ("   News post {0}\n\n"
+            "[images/post-{0}.png]\n\n"
+            "First paragraph of news post {0}, with some text that goes on for a while\n"
+            "to make a blurb, and a [link www.example.com/{0}].\n\n"
+            "  Post heading\n\n"
+            "Second paragraph of the post, with *bold* and _italic_ text.\n").format(i)
+
+def make_markdown_page(i):
+    """
+    Returns the text of Markdown page i
+
+    """
+    return ("Markdown page {0}\n\n"
+            "# Heading of page {0}\n\n"
+            "A paragraph with **bold**, *italic* and `code`, and a [link](index.html).\n\n"
+            "- First item\n- Second item\n\n"
+            "    indented code\n").format(i)
+
+def make_site(rootDir, pages, news, markdown, imports, ftpServer, connections):
+    """
+    Makes a scratch Quicknr folder in rootDir, with a website of the sizes
+    given, set to upload to ftpServer over that many connections, and 
+    returns the website folder path
+
+    """
+    ignore = shutil.ignore_patterns("__pycache__")
+    shutil.copy(os.path.join(QNR_DIR, "Quicknr_App.py"), rootDir)
+    for x in ["config", "javascript", "templates"]:
+        shutil.copytree(os.path.join(QNR_DIR, x), os.path.join(rootDir, x), ignore=ignore)
+    # --------------------- Website folder tree, as made by Quicknr
+    siteDir = os.path.join(rootDir, "websites", SITE_NAME)
+    for x in ["page_sources/news", "public_html/news/images", "public_html/res/css",
+                "public_html/res/font", "public_html/res/img", "quicknr_private"]:
+        os.makedirs(os.path.join(siteDir, x))
+    shutil.copytree(os.path.join(QNR_DIR, "config"), os.path.join(siteDir, "config"), ignore=ignore)
+    for x in ["quicknr_base.css", "quicknr_base_newslist.css", "quicknr_base_newspost.css"]:
+        shutil.copy(os.path.join(QNR_DIR, "templates/quicknr_base/res/css", x),
+                    os.path.join(siteDir, "public_html/res/css"))
+    shutil.copytree(os.path.join(QNR_DIR, "javascript"), os.path.join(siteDir, "public_html/res/js"))
+    with open(os.path.join(siteDir, "quicknr_private/quicknr_data.txt"), mode="w") as f:
+        f.write(SITE_NAME + "\n")
+    # --------------------- Settings, uploads to the FTP stand-in
+    cP = os.path.join(siteDir, "config/config.txt")
+    with open(cP, encoding="utf-8") as f: cT = f.read()
+    for k, v in [("FTP_SERVER", ftpServer), ("FTP_USERNAME", "bench"),
+                    ("FTP_PASSWORD", "bench"), ("FTP_PATH", "/www"),
+                    ("FTP_CONNECTIONS", str(connections))]:
+        cT = re.sub(r"(?m)^{}:.*$".format(k), '{}: "{}"'.format(k, v), cT)
+    with open(cP, mode="w", encoding="utf-8") as f: f.write(cT)
+    # --------------------- Sources, imports and images
+    sourcesDir = os.path.join(siteDir, "page_sources")
+    def _write(path, text):
+        with open(path, mode="w", encoding="utf-8") as f: f.write(text)
+    _write(os.path.join(sourcesDir, "index.txt"), make_qlm_page(0, imports))
+    for i in range(1, pages):
+        _write(os.path.join(sourcesDir, "page-{}.txt".format(i)), make_qlm_page(i, imports))
+    for i in range(markdown):
+        _write(os.path.join(sourcesDir, "markdown-{}.mdml".format(i)), make_markdown_page(i))
+    for i in range(imports):
+        _write(os.path.join(siteDir, "config/import/part-{}.txt".format(i)),
+                "# Import file {0} of the benchmark\n"
+                '<div class="part">\n<p>Imported part {0}</p>\n</div>\n'.format(i))
+    for i in range(1, news + 1):
+        day = time.strftime("%Y%m%d", time.gmtime(1451606400 + i * 86400))
+        _write(os.path.join(sourcesDir, "news/{}-post-{}.txt".format(day, i)), make_news_post(i))
+        with open(os.path.join(siteDir, "public_html/news/images/post-{}.png".format(i)),
+                    mode="wb") as f:
+            f.write(make_png(64, 48, i))
+    for j in range(1, 4):
+        with open(os.path.join(siteDir, "public_html/res/img/picture-{}.png".format(j)),
+                    mode="wb") as f:
+            f.write(make_png(320, 240, j))
+    return siteDir
+
+# --------------------- Scenarios
+
+def run_quicknr(rootDir, args, answersD, logPath):
+    """
+    Runs Quicknr on the website with the arguments given, writes its output
+    to logPath, and returns the output and wall time
+
+    Each prompt is answered with the value of the first answersD key found 
+    in it, or Q
+
+    """
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "Quicknr_App.py", "--site", SITE_NAME] + args,
+                            cwd=rootDir, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT)
+    outL = []
+    tail = b""
+    while True:
+        chunk = os.read(proc.stdout.fileno(), 65536)
+        if not chunk: break
+        outL.append(chunk)
+        tail = (tail + chunk)[-200:]
+        if tail.endswith(b"to quit): "): # Prompts are flushed before input is read
+            prompt = tail.decode("utf-8", "replace").rsplit("\n", 1)[-1]
+            answer = next((v for k, v in answersD.items() if k in prompt), "Q")
+            proc.stdin.write(answer.encode() + b"\n")
+            proc.stdin.flush()
+    proc.wait()
+    t = time.perf_counter() - t0
+    out = b"".join(outL).decode("utf-8", "replace")
+    with open(logPath, mode="w", encoding="utf-8") as f: f.write(out)
+    return out, t
+
+def count_written(dirPath, sinceNs):
+    """
+    Returns the number of files under dirPath modified since sinceNs
+
+    """
+    count = 0
+    for dp, dns, fns in os.walk(dirPath):
+        for fn in fns:
+            if os.stat(os.path.join(dp, fn)).st_mtime_ns >= sinceNs: count += 1
+    return count
+
+def run_scenarios(workDir, sizes, latency, jobs, connections):
+    """
+    Makes the website in workDir and runs the scenarios on it in order,
+    returns a list of result dicts
+
+    """
+    rootDir = os.path.join(workDir, "quicknr")
+    ftpDir = os.path.join(workDir, "ftp")
+    os.makedirs(rootDir)
+    os.makedirs(os.path.join(ftpDir, "www"))
+    server = FTPStandIn(ftpDir, latency)
+    server.start()
+    try:
+        siteDir = make_site(rootDir, ftpServer=server.address, connections=connections, **sizes)
+        jobArgs = ["--jobs", str(jobs)] if jobs != 1 else []
+        # Sources are always converted, Markdown pages too if the module is
+        # available, and uploads made in the upload scenario only
+        build = {"CONVERT": "Y"}
+        stepsL = [  ("cold", [], build),
+                    ("noop", [], build),
+                    ("edit", [], build),
+                    ("convertall", ["--convertall"], build),
+                    ("upload", ["--allupload"], {"CONVERT": "Y", "UPLOAD": "Y"}),
+                    ("sync", ["--sync"], {"CONVERT": "Y", "UPLOAD": "Y", "DELETE": "Y"})]
+        resultsL = []
+        for name, args, answersD in stepsL:
+            if name == "edit" or name == "sync":
+                with open(os.path.join(siteDir, "page_sources/index.txt"), mode="a") as f:
+                    f.write("\nA paragraph added by the {} scenario.\n".format(name))
+            if name == "sync":
+                os.remove(os.path.join(siteDir, "public_html/res/img/picture-3.png"))
+            server.reset_stats()
+            sinceNs = time.time_ns()
+            out, t = run_quicknr(rootDir, args + jobArgs, answersD,
+                                    os.path.join(workDir, name + ".log"))
+            mo = re.search(r"(?m)^(?:Error: |Traceback ).*$", out)
+            resultsL.append(dict(scenario=name, seconds=round(t, 4),
+                                    written=count_written(os.path.join(siteDir, "public_html"), sinceNs),
+                                    uploaded=server.stats["stored"],
+                                    uploadedBytes=server.stats["bytes"],
+                                    ftpCommands=server.stats["commands"],
+                                    error=mo.group() if mo else None))
+        return resultsL
+    finally:
+        server.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Quicknr full run timing on a synthetic website")
+    parser.add_argument("--pages", type=int, default=200, help="QLM pages, index included")
+    parser.add_argument("--news", type=int, default=50, help="news posts, each with an image")
+    parser.add_argument("--markdown", type=int, default=20, help="Markdown pages")
+    parser.add_argument("--imports", type=int, default=10, help="import files")
+    parser.add_argument("--latency", type=float, default=0.0, help="FTP reply delay, milliseconds")
+    parser.add_argument("--jobs", type=int, default=1, help="Quicknr --jobs value")
+    parser.add_argument("--connections", type=int, default=4, help="FTP_CONNECTIONS setting")
+    parser.add_argument("--repeat", type=int, default=1, help="runs of all scenarios, best kept")
+    parser.add_argument("--out", help="JSON results file")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch folders and logs")
+    args = parser.parse_args()
+    if args.pages < 1: parser.error("at least one page is needed")
+    sizes = dict(pages=args.pages, news=args.news, markdown=args.markdown, imports=args.imports)
+    bestD = {}
+    for r in range(args.repeat):
+        workDir = tempfile.mkdtemp(prefix="quicknr_bench_")
+        try:
+            for x in run_scenarios(workDir, sizes, args.latency / 1000, args.jobs,
+                                    args.connections):
+                if x["scenario"] not in bestD or x["seconds"] < bestD[x["scenario"]]["seconds"]:
+                    bestD[x["scenario"]] = x
+        finally:
+            if args.keep: print("\n  Scratch folder: " + workDir)
+            else: shutil.rmtree(workDir, ignore_errors=True)
+    resultsL = [bestD[x] for x in SCENARIOS]
+    print("\n  {:<12}  {:>9}  {:>8}  {:>9}  {:>10}".format(
+                "Scenario", "Seconds", "Written", "Uploaded", "KB up"))
+    for x in resultsL:
+        print("  {:<12}  {:>9.3f}  {:>8}  {:>9}  {:>10.1f}".format(x["scenario"], x["seconds"],
+                x["written"], x["uploaded"], x["uploadedBytes"] / 1024))
+        if x["error"]: print("    " + x["error"])
+    report = dict(quicknr=QNR_DIR, python=platform.python_version(), sizes=sizes,
+                    latencyMs=args.latency, jobs=args.jobs, connections=args.connections,
+                    repeat=args.repeat,
+                    results=resultsL)
+    if args.out:
+        with open(args.out, mode="w", encoding="utf-8") as f: json.dump(report, f, indent=2)
+        print("\n  Results written to " + args.out)
+    return 1 if any(x["error"] for x in resultsL) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
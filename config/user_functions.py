@@ -23,9 +23,15 @@
 #  made. After it has done its work, the function must return the      #
 #  processed text.                                                     #
 #                                                                      #
-#  This file as a whole will be read and executed by Quicknr before    #
-#  the relevant function is called. It is therefore safest to not      #
-#  include any code outside function (or class) definitions.           #
+#  This file is imported by Quicknr as a module once per run, before   #
+#  any function is called, so code outside function (or class)         #
+#  definitions runs only once. It is still safest to keep it to        #
+#  imports and definitions. The calls of each function are counted     #
+#  and timed, and listed after conversion, slowest first.              #
+#                                                                      #
+#  A function named "post_build", if defined, is called once after     #
+#  conversion instead, with all converted pages; see the PYTHON        #
+#  section of "config.txt" for its parameters.                         #
 #                                                                      #
 #  Note that after user functions are executed, Quicknr still          #
 #  performs some tidying up before writing to HTML file:               #